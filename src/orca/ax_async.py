@@ -0,0 +1,313 @@
+# Utilities for querying accessible objects without blocking.
+#
+# Copyright 2024 The Orca Team
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., Franklin Street, Fifth Floor,
+# Boston MA  02110-1301 USA.
+
+"""
+Utilities for querying accessible objects without blocking.
+Each query is sent as an asynchronous D-Bus call with its own timeout, and returns
+an AXFuture right away. Callers which need many values can send all of the queries
+and then gather the results, paying for one round trip instead of one per query.
+The replies are dispatched in a private main context, so gathering them never runs
+Orca's other sources (e.g. event processing) re-entrantly. Values which AXObject
+caches are handed to it, so later synchronous calls for them do not block either.
+"""
+
+__id__        = "$Id$"
+__version__   = "$Revision$"
+__date__      = "$Date$"
+__copyright__ = "Copyright (c) 2024 The Orca Team"
+__license__   = "LGPL"
+
+import time
+
+import gi
+gi.require_version("Atspi", "2.0")
+from gi.repository import Atspi
+from gi.repository import Gio
+from gi.repository import GLib
+
+from . import debug
+from .ax_object import AXObject
+from .ax_snapshot import AXSnapshot
+
+
+class AXFuture:
+    """The eventual result of an asynchronous query."""
+
+    def __init__(self, obj, description):
+        self.obj = obj
+        self.description = description
+        self._done = False
+        self._value = None
+        self._error = None
+        self._callbacks = []
+
+    def __str__(self):
+        return f"AXFuture({self.description})"
+
+    def done(self):
+        """Returns True if the query has completed, failed, or timed out."""
+
+        return self._done
+
+    def result(self, default=None):
+        """Returns the value of the query, or default if it failed or is not done."""
+
+        if not self._done or self._error is not None:
+            return default
+        return self._value
+
+    def error(self):
+        """Returns the error if the query failed or timed out, otherwise None."""
+
+        return self._error
+
+    def add_done_callback(self, callback):
+        """Calls callback with this future once it is done, or now if it is."""
+
+        if self._done:
+            callback(self)
+            return
+        self._callbacks.append(callback)
+
+    def _finish(self, value=None, error=None):
+        if self._done:
+            return
+
+        self._done = True
+        self._value = value
+        self._error = error
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                msg = f"AXAsync: Exception in callback for {self}: {e}"
+                debug.printMessage(debug.LEVEL_INFO, msg, True)
+
+
+class AXAsync:
+    """Utilities for querying accessible objects without blocking."""
+
+    ACCESSIBLE_INTERFACE = "org.a11y.atspi.Accessible"
+    TEXT_INTERFACE = "org.a11y.atspi.Text"
+    PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+    # In milliseconds. An application which takes longer than this to reply is not
+    # going to be waited on.
+    TIMEOUT = 500
+
+    # In milliseconds. How often replies are dispatched when no one is gathering them.
+    DISPATCH_INTERVAL = 20
+
+    _context = None
+    _pending = set()
+    _dispatcher_id = 0
+
+    @staticmethod
+    def _get_context():
+        if AXAsync._context is None:
+            AXAsync._context = GLib.MainContext.new()
+        return AXAsync._context
+
+    @staticmethod
+    def _dispatch():
+        context = AXAsync._get_context()
+        while context.pending():
+            context.iteration(False)
+
+        if AXAsync._pending:
+            return True
+
+        AXAsync._dispatcher_id = 0
+        return False
+
+    @staticmethod
+    def _on_reply(connection, result, data):
+        future, convert, cache_as, generation = data
+        AXAsync._pending.discard(future)
+        if future.done():
+            return
+
+        try:
+            value = convert(connection.call_finish(result).unpack())
+        except Exception as error:
+            tokens = ["AXAsync:", future, "failed for", future.obj, ":", error]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            future._finish(error=error)
+            return
+
+        if cache_as:
+            AXObject.update_cached_properties(future.obj, {cache_as: value}, generation)
+        future._finish(value=value)
+
+    @staticmethod
+    def call(obj, interface, method, parameters=None, reply_type=None,
+             convert=None, cache_as=None, timeout=None):
+        """Sends the D-Bus method call to obj and returns an AXFuture for the reply.
+        convert is applied to the unpacked reply to get the value of the future. If
+        cache_as is specified, the value is also cached by AXObject under that name."""
+
+        future = AXFuture(obj, f"{interface.rsplit('.', 1)[-1]}.{method}")
+        obj_id = AXSnapshot.get_id(obj)
+        connection = AXSnapshot.get_connection()
+        if obj_id is None or connection is None:
+            future._finish(error=ValueError(f"Cannot query {obj}"))
+            return future
+
+        if timeout is None:
+            timeout = AXAsync.TIMEOUT
+
+        data = future, convert or (lambda x: x), cache_as, AXObject.get_generation(obj)
+        context = AXAsync._get_context()
+        context.push_thread_default()
+        try:
+            connection.call(
+                obj_id[0], obj_id[1], interface, method, parameters,
+                GLib.VariantType.new(reply_type) if reply_type else None,
+                Gio.DBusCallFlags.NONE, timeout, None, AXAsync._on_reply, data)
+        finally:
+            context.pop_thread_default()
+
+        AXAsync._pending.add(future)
+        if not AXAsync._dispatcher_id:
+            AXAsync._dispatcher_id = GLib.timeout_add(
+                AXAsync.DISPATCH_INTERVAL, AXAsync._dispatch)
+        return future
+
+    @staticmethod
+    def _get_property(obj, interface, name, convert=None, cache_as=None, timeout=None):
+        return AXAsync.call(
+            obj, AXAsync.PROPERTIES_INTERFACE, "Get", GLib.Variant("(ss)", (interface, name)),
+            "(v)", lambda x: (convert or (lambda v: v))(x[0]), cache_as, timeout)
+
+    @staticmethod
+    def get_name(obj, timeout=None):
+        """Returns an AXFuture for the name of obj."""
+
+        return AXAsync._get_property(
+            obj, AXAsync.ACCESSIBLE_INTERFACE, "Name", cache_as="name", timeout=timeout)
+
+    @staticmethod
+    def get_description(obj, timeout=None):
+        """Returns an AXFuture for the description of obj."""
+
+        return AXAsync._get_property(
+            obj, AXAsync.ACCESSIBLE_INTERFACE, "Description", cache_as="description",
+            timeout=timeout)
+
+    @staticmethod
+    def get_child_count(obj, timeout=None):
+        """Returns an AXFuture for the child count of obj."""
+
+        return AXAsync._get_property(
+            obj, AXAsync.ACCESSIBLE_INTERFACE, "ChildCount", cache_as="child_count",
+            timeout=timeout)
+
+    @staticmethod
+    def get_role(obj, timeout=None):
+        """Returns an AXFuture for the Atspi.Role of obj."""
+
+        return AXAsync.call(
+            obj, AXAsync.ACCESSIBLE_INTERFACE, "GetRole", None, "(u)",
+            lambda x: AXSnapshot.role_from_value(x[0]), "role", timeout)
+
+    @staticmethod
+    def get_state_set(obj, timeout=None):
+        """Returns an AXFuture for the Atspi.StateSet of obj."""
+
+        return AXAsync.call(
+            obj, AXAsync.ACCESSIBLE_INTERFACE, "GetState", None, "(au)",
+            lambda x: AXSnapshot.state_set_from_words(x[0]), "state_set", timeout)
+
+    @staticmethod
+    def get_attributes(obj, timeout=None):
+        """Returns an AXFuture for the object attributes dict of obj."""
+
+        return AXAsync.call(
+            obj, AXAsync.ACCESSIBLE_INTERFACE, "GetAttributes", None, "(a{ss})",
+            lambda x: dict(x[0]), timeout=timeout)
+
+    @staticmethod
+    def get_text(obj, start_offset=0, end_offset=-1, timeout=None):
+        """Returns an AXFuture for the text of obj between the offsets."""
+
+        return AXAsync.call(
+            obj, AXAsync.TEXT_INTERFACE, "GetText",
+            GLib.Variant("(ii)", (start_offset, end_offset)), "(s)",
+            lambda x: x[0], timeout=timeout)
+
+    @staticmethod
+    def gather(futures, timeout=None):
+        """Waits for the futures and returns their results, in order. Futures which are
+        not done within timeout milliseconds (default: AXAsync.TIMEOUT) are abandoned,
+        and their result is None. Only replies to AXAsync queries are dispatched while
+        waiting."""
+
+        futures = list(futures)
+        if timeout is None:
+            timeout = AXAsync.TIMEOUT
+
+        start = time.time()
+        deadline = start + timeout / 1000
+        context = AXAsync._get_context()
+        wakeup = GLib.timeout_source_new(timeout)
+        wakeup.set_callback(lambda *args: False)
+        wakeup.attach(context)
+        try:
+            while not all(f.done() for f in futures) and time.time() < deadline:
+                context.iteration(True)
+        finally:
+            wakeup.destroy()
+
+        timed_out = [f for f in futures if not f.done()]
+        for future in timed_out:
+            AXAsync._pending.discard(future)
+            future._finish(error=TimeoutError(f"No reply within {timeout}ms"))
+
+        msg = (
+            f"AXAsync: Gathered {len(futures) - len(timed_out)} of {len(futures)} "
+            f"results in {time.time() - start:.4f}s"
+        )
+        debug.printMessage(debug.LEVEL_INFO, msg, True)
+        return [f.result() for f in futures]
+
+    @staticmethod
+    def prefetch(objects, properties=("name", "role", "state_set"), timeout=None):
+        """Queries the properties of all the objects at once so that AXObject has them
+        cached. Returns the number of queries which succeeded."""
+
+        getters = {
+            "name": AXAsync.get_name,
+            "description": AXAsync.get_description,
+            "child_count": AXAsync.get_child_count,
+            "role": AXAsync.get_role,
+            "state_set": AXAsync.get_state_set,
+        }
+
+        futures = []
+        for obj in objects:
+            if not isinstance(obj, Atspi.Accessible):
+                continue
+            futures.extend(getters[name](obj, timeout) for name in properties)
+
+        if not futures:
+            return 0
+
+        AXAsync.gather(futures, timeout)
+        return len([f for f in futures if f.error() is None])
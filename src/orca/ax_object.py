@@ -34,6 +34,7 @@ __date__      = "$Date$"
 __copyright__ = "Copyright (c) 2023 Igalia, S.L."
 __license__   = "LGPL"
 
+import itertools
 import re
 import threading
 import time
@@ -43,39 +44,303 @@ gi.require_version("Atspi", "2.0")
 from gi.repository import Atspi
 
 from . import debug
+from .ax_snapshot import AXSnapshot
+
+
+class BoundedCache(dict):
+    """Dictionary which holds at most max_size entries, evicting the least recently used
+    one to make room, and which forgets entries older than ttl seconds. Zero means no
+    limit. Both can be changed at any time."""
+
+    def __init__(self, max_size=0, ttl=0):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def __setitem__(self, key, value):
+        super().pop(key, None)
+        while self.max_size and len(self) >= self.max_size:
+            super().pop(next(iter(self)))
+        super().__setitem__(key, (time.monotonic(), value))
+
+    def _lookup(self, key, touch=True):
+        entry = super().get(key)
+        if entry is None:
+            return False, None
+
+        timestamp, value = entry
+        if self.ttl and time.monotonic() - timestamp > self.ttl:
+            super().pop(key, None)
+            return False, None
+
+        # Keep the dictionary ordered from least to most recently used.
+        if touch and self.max_size:
+            super().pop(key, None)
+            super().__setitem__(key, entry)
+
+        return True, value
+
+    def __contains__(self, key):
+        return self._lookup(key)[0]
+
+    def __getitem__(self, key):
+        found, value = self._lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        found, value = self._lookup(key)
+        if not found:
+            return default
+        return value
+
+    def pop(self, key, *args):
+        found, value = self._lookup(key, False)
+        if found:
+            super().pop(key, None)
+            return value
+        if args:
+            return args[0]
+        raise KeyError(key)
+
+    def prune(self):
+        """Removes the entries which are no longer valid, returning how many there were."""
+
+        stale = [key for key in list(super().keys()) if not self._lookup(key, False)[0]]
+        return len(stale)
+
+
+class GenerationalCache(BoundedCache):
+    """Bounded dictionary of cached values, keyed by object id, whose entries go stale
+    when the generation of the object they depend upon changes. By default that object
+    is the one whose id is the key. Stale entries are ignored and dropped on lookup.
+    See AXObject.get_id()."""
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, (key, AXObject._get_generation(key), value))
+
+    def set(self, key, value, scope):
+        """Caches value for key, to be treated as stale once the generation of scope changes."""
+
+        scope = AXObject.get_id(scope)
+        super().__setitem__(key, (scope, AXObject._get_generation(scope), value))
+
+    def _lookup(self, key, touch=True):
+        found, entry = super()._lookup(key, touch)
+        if not found:
+            return False, None
+
+        scope, generation, value = entry
+        if AXObject._get_generation(scope) != generation:
+            dict.pop(self, key, None)
+            return False, None
+
+        return True, value
+
+
+class PredicateCache:
+    """The cached results of named per-object predicates, such as whether an object is
+    layout only. Each result is stamped with the generation of its object, and with the
+    epoch of the document the object is in, so results go stale when the object or one
+    of its descendants is invalidated, or when the document is cleared. Results of the
+    predicates named as relational additionally go stale whenever the relations between
+    objects might have changed. Hits and misses are counted per predicate."""
+
+    def __init__(self, get_document, relational=(), max_size=50000):
+        """get_document is called with an object and returns its document, or None."""
+
+        self.get_document = get_document
+        self.relational = frozenset(relational)
+        self.stats = {}
+        self._entries = GenerationalCache(max_size=max_size)
+        self._epochs = {}
+        self._relational_epoch = 0
+
+    def get(self, name, obj):
+        """Returns the cached result of name for obj, or None if there is none."""
+
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = [0, 0]
+
+        entry = self._entries.get((name, AXObject.get_id(obj)))
+        if entry is not None:
+            document, epoch, relational_epoch, value = entry
+            if self._epochs.get(document, 0) == epoch \
+               and relational_epoch in (None, self._relational_epoch):
+                stats[0] += 1
+                return value
+
+        stats[1] += 1
+        return None
+
+    def set(self, name, obj, value):
+        """Caches value as the result of name for obj."""
+
+        document = AXObject.get_id(self.get_document(obj))
+        relational_epoch = self._relational_epoch if name in self.relational else None
+        entry = document, self._epochs.get(document, 0), relational_epoch, value
+        self._entries.set((name, AXObject.get_id(obj)), entry, obj)
+
+    def clear(self, document=None):
+        """Stales the cached results for objects in document, or all of them."""
+
+        if document is None:
+            self._entries.clear()
+            self._epochs.clear()
+            return
+
+        document = AXObject.get_id(document)
+        self._epochs[document] = self._epochs.get(document, 0) + 1
+
+    def clear_relational(self):
+        """Stales the cached results of the relational predicates."""
+
+        self._relational_epoch += 1
+
+    def prune(self):
+        """Removes the entries which are no longer valid, returning how many there were."""
+
+        return self._entries.prune()
+
+    def print_stats(self, prefix):
+        """Prints the hits and misses for each predicate, busiest first."""
+
+        if debug.LEVEL_INFO < debug.debugLevel:
+            return
+
+        tokens = [prefix, "Predicate cache has", len(self._entries), "entries"]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        for name, (hits, misses) in sorted(self.stats.items(), key=lambda x: -sum(x[1])):
+            msg = (
+                f"{prefix} Predicate {name}: {hits} hits, {misses} misses "
+                f"({100 * hits / max(hits + misses, 1):.1f}% hit rate)"
+            )
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+
+
+class SearchBudget:
+    """Limits on how much of the accessible tree a single search may visit."""
+
+    def __init__(self, max_nodes=0, time_limit=0.0, is_cancelled=None):
+        """Zero and None mean no limit. The time limit is in seconds. The function
+        is_cancelled is called as the search goes, and stops it by returning True."""
+
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        self.is_cancelled = is_cancelled
+        self.exhausted = False
+        self.reason = ""
+        self._visited = 0
+        self._deadline = None
+
+    def start(self):
+        """Resets the budget at the start of a search."""
+
+        self.exhausted = False
+        self.reason = ""
+        self._visited = 0
+        self._deadline = None
+        if self.time_limit:
+            self._deadline = time.monotonic() + self.time_limit
+
+    def spend(self):
+        """Accounts for visiting one more node. Returns False if the search must stop."""
+
+        self._visited += 1
+        if self.max_nodes and self._visited > self.max_nodes:
+            self.reason = f"more than {self.max_nodes} nodes"
+        elif self._deadline is not None and time.monotonic() > self._deadline:
+            self.reason = f"more than {self.time_limit}s"
+        elif self.is_cancelled is not None and self.is_cancelled():
+            self.reason = "cancelled"
+        else:
+            return True
+
+        self.exhausted = True
+        return False
 
 
 class AXObject:
     """Utilities for obtaining information about accessible objects."""
 
-    KNOWN_DEAD = {}
+    # Keyed by the object's id. See get_id().
+    KNOWN_DEAD = BoundedCache(max_size=10000, ttl=600)
     REAL_APP_FOR_MUTTER_FRAME = {}
     REAL_FRAME_FOR_MUTTER_FRAME = {}
-    OBJECT_ATTRIBUTES = {}
+    OBJECT_ATTRIBUTES = GenerationalCache(max_size=10000)
+
+    # Properties which rarely change and which we are told about via events when they do.
+    # Keyed by the object's id, with each value being a dictionary of property name to
+    # value. CACHED_CHILDREN is keyed by the id of the parent, and holds the ids of the
+    # children whose cached properties depend upon it.
+    PROPERTIES = {}
+    PROPERTIES_MAX_SIZE = 50000
+    PROPERTY_STATS = {}
+    CACHED_CHILDREN = {}
+
+    # The ancestors of each object, nearest first, along with a dictionary of the nearest
+    # ancestors found via find_ancestor() with remember_as. Keyed by the object's id. A chain
+    # stays cached until obj or one of its ancestors gets a new parent or role.
+    ANCESTRY = BoundedCache(max_size=10000)
+    # Keyed by the object's id, the ids of the objects whose cached ancestry includes it.
+    ANCESTRY_DEPENDENTS = {}
+
+    # Keyed by the bus name of the app, the times at which calls to it timed out.
+    TIMEOUTS = {}
+
+    # In milliseconds. How long to wait for a reply from the app which has focus, and from
+    # any other app. The former is the default of libatspi. Apps which have only just
+    # started are given longer by libatspi, for up to APP_STARTUP_TIME.
+    FOCUSED_APP_TIMEOUT = 800
+    UNFOCUSED_APP_TIMEOUT = 250
+    APP_STARTUP_TIME = 15000
+    _focused_bus_name = None
+    _timeout = FOCUSED_APP_TIMEOUT
+
+    # The cached properties invalidated by each object:property-change event.
+    PROPERTIES_FOR_CHANGE = {
+        "accessible-description": ("description",),
+        "accessible-name": ("name",),
+        "accessible-parent": ("parent", "index_in_parent"),
+        "accessible-role": ("role",),
+    }
+
+    # The generation of an object changes whenever it or one of its descendants is
+    # invalidated, or changes according to an event. For events, the descendants are
+    # those whose chain of parents is cached, because we do not call into AT-SPI as
+    # events arrive. Data cached in a GenerationalCache is stamped with the generation of
+    # the object it depends upon, and is treated as stale once that generation changes.
+    # Objects which have never been invalidated are at the floor generation; raising
+    # the floor is how we stale everything at once.
+    GENERATIONS = {}
+    GENERATIONS_MAX_SIZE = 50000
+
+    # The path of the application object of every app. Its generation changes with every
+    # event from the app, whether or not we know the ancestors of the event's source.
+    APP_PATH = "/org/a11y/atspi/accessible/root"
+    _generation_counter = itertools.count(1)
+    _generation_floor = 0
 
     _lock = threading.Lock()
 
     @staticmethod
     def _clear_stored_data():
-        """Clears any data we have cached for objects"""
+        """Removes stale and short-lived data we have cached for objects"""
 
         while True:
             time.sleep(60)
-            AXObject._clear_all_dictionaries()
+            AXObject._clear_all_dictionaries(clear_properties=False)
 
     @staticmethod
-    def _clear_all_dictionaries(reason=""):
+    def _clear_all_dictionaries(reason="", clear_properties=True):
         msg = "AXObject: Clearing local cache."
         if reason:
             msg += f" Reason: {reason}"
         debug.printMessage(debug.LEVEL_INFO, msg, True)
 
         with AXObject._lock:
-            tokens = ["AXObject: Clearing known dead-or-alive state for",
-                        len(AXObject.KNOWN_DEAD), "objects"]
-            debug.printTokens(debug.LEVEL_INFO, tokens, True)
-            AXObject.KNOWN_DEAD.clear()
-
             tokens = ["AXObject: Clearing", len(AXObject.REAL_APP_FOR_MUTTER_FRAME),
                         "real apps for mutter frames"]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
@@ -86,17 +351,301 @@ class AXObject:
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             AXObject.REAL_FRAME_FOR_MUTTER_FRAME.clear()
 
+            AXSnapshot.clear(reason or "Periodic clearing.")
+
+            # The cached properties are invalidated by events, and the object attributes
+            # by generation, so the periodic clearing only removes what has gone stale.
+            AXObject._print_property_stats()
+            if not clear_properties:
+                AXObject._prune_ancestry_dependents()
+                removed = AXObject.KNOWN_DEAD.prune()
+                tokens = ["AXObject: Removed expired dead-or-alive state for", removed, "objects"]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                removed = AXObject.OBJECT_ATTRIBUTES.prune()
+                tokens = ["AXObject: Removed stale object attributes for", removed, "objects"]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                return
+
+            tokens = ["AXObject: Clearing known dead-or-alive state for",
+                        len(AXObject.KNOWN_DEAD), "objects"]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            AXObject.KNOWN_DEAD.clear()
+
             tokens = ["AXObject: Clearing cached object attributes for",
                         len(AXObject.OBJECT_ATTRIBUTES), "objects"]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             AXObject.OBJECT_ATTRIBUTES.clear()
 
+            tokens = ["AXObject: Clearing cached properties for",
+                      len(AXObject.PROPERTIES), "objects"]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            AXObject.PROPERTIES.clear()
+            AXObject.CACHED_CHILDREN.clear()
+
+            tokens = ["AXObject: Clearing cached ancestry for", len(AXObject.ANCESTRY), "objects"]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            AXObject.ANCESTRY.clear()
+            AXObject.ANCESTRY_DEPENDENTS.clear()
+
+            AXObject._raise_generation_floor()
+
     @staticmethod
     def clear_cache_now(reason=""):
         """Clears all cached information immediately."""
 
         AXObject._clear_all_dictionaries(reason)
 
+    @staticmethod
+    def get_generation(obj):
+        """Returns the current generation of obj."""
+
+        return AXObject._get_generation(AXObject.get_id(obj))
+
+    @staticmethod
+    def get_app_generation(obj):
+        """Returns the current generation of obj's app, without asking the app."""
+
+        bus_name = AXObject.get_bus_name(obj)
+        if bus_name is None:
+            return None
+        return AXObject._get_generation((bus_name, AXObject.APP_PATH))
+
+    @staticmethod
+    def _get_generation(obj_id):
+        """Returns the current generation of the object with the specified id."""
+
+        return AXObject.GENERATIONS.get(obj_id, AXObject._generation_floor)
+
+    @staticmethod
+    def _raise_generation_floor():
+        """Makes everything stamped with a generation stale."""
+
+        tokens = ["AXObject: Raising generation floor. Forgetting generations for",
+                  len(AXObject.GENERATIONS), "objects"]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        AXObject.GENERATIONS.clear()
+        AXObject._generation_floor = next(AXObject._generation_counter)
+
+    @staticmethod
+    def _bump_generation(obj_id):
+        """Gives the object a new generation, staling what is cached for it."""
+
+        if obj_id not in AXObject.GENERATIONS \
+           and len(AXObject.GENERATIONS) >= AXObject.GENERATIONS_MAX_SIZE:
+            AXObject._raise_generation_floor()
+
+        AXObject.GENERATIONS[obj_id] = next(AXObject._generation_counter)
+
+    @staticmethod
+    def _bump_generation_of_cached_ancestry(obj_id):
+        """Bumps the generation of the object and of its ancestors whose parents are
+        cached. This never calls into AT-SPI, so it is safe to use as events arrive."""
+
+        seen = set()
+        while obj_id is not None and obj_id not in seen:
+            seen.add(obj_id)
+            AXObject._bump_generation(obj_id)
+            parent = AXObject.PROPERTIES.get(obj_id, {}).get("parent")
+            obj_id = AXObject.get_id(parent) if parent is not None else None
+
+    @staticmethod
+    def invalidate(obj, reason=""):
+        """Stales data cached for obj and its ancestors, leaving everything else intact."""
+
+        if obj is None:
+            return
+
+        tokens = ["AXObject: Invalidating", obj, "and its ancestors."]
+        if reason:
+            tokens.append(f"Reason: {reason}")
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+
+        objects = []
+        while obj is not None and obj not in objects:
+            AXObject._bump_generation(AXObject.get_id(obj))
+            objects.append(obj)
+            obj = AXObject.get_parent(obj)
+
+    @staticmethod
+    def _get_cached_property(obj, name):
+        """Returns a (found, value) tuple for the cached property name of obj"""
+
+        stats = AXObject.PROPERTY_STATS.setdefault(name, [0, 0])
+        properties = AXObject.PROPERTIES.get(AXObject.get_id(obj))
+        if properties is not None and name in properties:
+            stats[0] += 1
+            return True, properties[name]
+
+        # Anything we've cached since the snapshot was taken is at least as current.
+        snapshot = AXSnapshot.take_properties(obj)
+        if snapshot:
+            for key, value in snapshot.items():
+                if properties is None or key not in properties:
+                    AXObject._set_cached_property(obj, key, value)
+            if name in snapshot:
+                stats[0] += 1
+                return True, snapshot[name]
+
+        stats[1] += 1
+        return False, None
+
+    @staticmethod
+    def _set_cached_property(obj, name, value, parent=None):
+        """Caches the property name of obj. If the value depends on obj's parent, the
+        parent should be provided so that the value can be invalidated via the parent."""
+
+        obj_id = AXObject.get_id(obj)
+        properties = AXObject.PROPERTIES.get(obj_id)
+        if properties is None:
+            if len(AXObject.PROPERTIES) >= AXObject.PROPERTIES_MAX_SIZE:
+                oldest = next(iter(AXObject.PROPERTIES))
+                AXObject.PROPERTIES.pop(oldest, None)
+            properties = AXObject.PROPERTIES.setdefault(obj_id, {})
+
+        properties[name] = value
+        if parent is not None:
+            AXObject.CACHED_CHILDREN.setdefault(AXObject.get_id(parent), set()).add(obj_id)
+
+    @staticmethod
+    def update_cached_properties(obj, properties, generation):
+        """Caches the properties of obj which were retrieved by some means other than
+        AXObject, such as asynchronously. They must not depend on the parent of obj.
+        Nothing is cached if obj has been invalidated since generation, because what
+        we were given might be stale."""
+
+        if AXObject.get_generation(obj) != generation:
+            tokens = ["AXObject: Not caching properties of", obj, "which changed since request"]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            return
+
+        for name, value in properties.items():
+            AXObject._set_cached_property(obj, name, value)
+
+    @staticmethod
+    def _clear_cached_properties(obj_id, *names):
+        """Clears the specified cached properties, or all of them, for the object."""
+
+        properties = AXObject.PROPERTIES.get(obj_id)
+        if properties is None:
+            return
+
+        if not names:
+            AXObject.PROPERTIES.pop(obj_id, None)
+            return
+
+        for name in names:
+            properties.pop(name, None)
+
+    @staticmethod
+    def _print_property_stats():
+        """Prints the hits and misses for each cached property."""
+
+        if debug.LEVEL_INFO < debug.debugLevel:
+            return
+
+        for name, (hits, misses) in sorted(AXObject.PROPERTY_STATS.items()):
+            total = hits + misses
+            msg = (
+                f"AXObject: Cached property {name}: {hits} hits, {misses} misses "
+                f"({100 * hits / max(total, 1):.1f}% hit rate)"
+            )
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+
+    @staticmethod
+    def _clear_ancestry(obj_id):
+        """Clears the cached ancestry of the object and of everything beneath it."""
+
+        AXObject.ANCESTRY.pop(obj_id, None)
+        for dependent in AXObject.ANCESTRY_DEPENDENTS.pop(obj_id, ()):
+            AXObject.ANCESTRY.pop(dependent, None)
+
+    @staticmethod
+    def _forget_subtree(obj_id):
+        """Forgets everything cached for the object and for its descendants we know of,
+        namely the children whose properties and the objects whose ancestry we cached.
+        Their generations are bumped so that data stamped with them is stale too. This
+        never calls into AT-SPI, so it is safe to use as events arrive."""
+
+        to_forget, seen = [obj_id], set()
+        while to_forget:
+            obj_id = to_forget.pop()
+            if obj_id in seen:
+                continue
+            seen.add(obj_id)
+            AXObject._bump_generation(obj_id)
+            AXObject._clear_cached_properties(obj_id)
+            to_forget.extend(AXObject.CACHED_CHILDREN.pop(obj_id, ()))
+            to_forget.extend(AXObject.ANCESTRY_DEPENDENTS.get(obj_id, ()))
+            AXObject._clear_ancestry(obj_id)
+
+        if len(seen) > 1:
+            tokens = ["AXObject: Forgot cached data for", len(seen), "objects in subtree"]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+
+    @staticmethod
+    def _prune_ancestry_dependents():
+        """Forgets the dependents whose ancestry is no longer cached."""
+
+        cached = set(dict.keys(AXObject.ANCESTRY))
+        for obj_id in list(AXObject.ANCESTRY_DEPENDENTS.keys()):
+            dependents = AXObject.ANCESTRY_DEPENDENTS.get(obj_id)
+            if dependents is None:
+                continue
+            dependents &= cached
+            if not dependents:
+                AXObject.ANCESTRY_DEPENDENTS.pop(obj_id, None)
+
+    @staticmethod
+    def update_cache_for_event(event):
+        """Invalidates the cached properties and generations of objects which event says
+        have changed."""
+
+        if event.source is None:
+            return
+
+        AXSnapshot.discard(event.source)
+        event_type = event.type
+        source = AXObject.get_id(event.source)
+        if isinstance(source, tuple):
+            AXObject._bump_generation((source[0], AXObject.APP_PATH))
+        if event_type.startswith("object:property-change:"):
+            names = AXObject.PROPERTIES_FOR_CHANGE.get(event_type.split(":")[2])
+            if names:
+                AXObject._bump_generation_of_cached_ancestry(source)
+                AXObject._clear_cached_properties(source, *names)
+            if names and ("parent" in names or "role" in names):
+                AXObject._clear_ancestry(source)
+            return
+
+        if event_type.startswith("object:state-changed:"):
+            AXObject._bump_generation_of_cached_ancestry(source)
+            if event_type.startswith("object:state-changed:defunct"):
+                AXObject._forget_subtree(source)
+            else:
+                AXObject._clear_cached_properties(source, "state_set")
+            return
+
+        if event_type.startswith(("object:text-changed:", "object:attributes-changed",
+                                  "object:visible-data-changed")):
+            AXObject._bump_generation_of_cached_ancestry(source)
+            return
+
+        if event_type.startswith("object:children-changed:"):
+            AXObject._bump_generation_of_cached_ancestry(source)
+            AXObject._clear_cached_properties(source, "child_count")
+            children = AXObject.CACHED_CHILDREN.get(source, set())
+            for child in children:
+                AXObject._clear_cached_properties(child, "index_in_parent")
+            if isinstance(event.any_data, Atspi.Accessible):
+                AXSnapshot.discard(event.any_data)
+                child = AXObject.get_id(event.any_data)
+                if event_type.startswith("object:children-changed:remove"):
+                    children.discard(child)
+                    AXObject._forget_subtree(child)
+                else:
+                    AXObject._clear_ancestry(child)
+                    AXObject._clear_cached_properties(child, "parent", "index_in_parent")
+
     @staticmethod
     def start_cache_clearing_thread():
         """Starts thread to periodically clear cached details."""
@@ -122,17 +671,74 @@ class AXObject:
 
         return False
 
+    @staticmethod
+    def get_id(obj):
+        """Returns the (bus name, path) which identifies obj on the accessibility bus.
+        Python can give a new object the hash of one which has been destroyed, so this
+        is the key for everything we cache about objects. The bus name and path are
+        read from obj itself, without a snapshot or a call to the app. Only things
+        which are not on the bus, such as None, are identified by hash(obj)."""
+
+        return AXSnapshot.get_id(obj) or hash(obj)
+
+    @staticmethod
+    def get_bus_name(obj):
+        """Returns the bus name of the app obj belongs to, without asking the app, or
+        None if obj is not on the bus."""
+
+        obj_id = AXSnapshot.get_id(obj)
+        if obj_id is None:
+            return None
+        return obj_id[0]
+
+    @staticmethod
+    def set_focused_app(bus_name):
+        """Notes the bus name of the app which has focus, or None if we don't know it."""
+
+        AXObject._focused_bus_name = bus_name
+
+    @staticmethod
+    def _set_timeout_for(obj):
+        """Sets the timeout for the calls we are about to make to obj's app, which is short
+        unless the app has focus, so that an unresponsive app in the background cannot hang
+        us. libatspi only has a global timeout, so it is set again whenever the app we are
+        about to call differs in this respect from the previous one."""
+
+        timeout = AXObject.FOCUSED_APP_TIMEOUT
+        focused = AXObject._focused_bus_name
+        if focused is not None:
+            bus_name = AXObject.get_bus_name(obj)
+            if bus_name is not None and bus_name != focused:
+                timeout = AXObject.UNFOCUSED_APP_TIMEOUT
+
+        if timeout == AXObject._timeout:
+            return
+
+        try:
+            Atspi.set_timeout(timeout, AXObject.APP_STARTUP_TIME)
+        except Exception as error:
+            tokens = ["AXObject: Exception setting timeout to", timeout, ":", error]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            return
+
+        AXObject._timeout = timeout
+
     @staticmethod
     def is_valid(obj):
-        """Returns False if we know for certain this object is invalid"""
+        """Returns False if we know for certain this object is invalid. Because this is
+        checked before every call to obj's app, it also sets the timeout for that call."""
 
-        return not (obj is None or AXObject.object_is_known_dead(obj))
+        if obj is None or AXObject.object_is_known_dead(obj):
+            return False
+
+        AXObject._set_timeout_for(obj)
+        return True
 
     @staticmethod
     def object_is_known_dead(obj):
         """Returns True if we know for certain this object no longer exists"""
 
-        return obj and AXObject.KNOWN_DEAD.get(hash(obj)) is True
+        return obj and AXObject.KNOWN_DEAD.get(AXObject.get_id(obj)) is True
 
     @staticmethod
     def _set_known_dead_status(obj, is_dead):
@@ -141,12 +747,14 @@ class AXObject:
         if obj is None:
             return
 
-        current_status = AXObject.KNOWN_DEAD.get(hash(obj))
+        obj_id = AXObject.get_id(obj)
+        current_status = AXObject.KNOWN_DEAD.get(obj_id)
         if current_status == is_dead:
             return
 
-        AXObject.KNOWN_DEAD[hash(obj)] = is_dead
+        AXObject.KNOWN_DEAD[obj_id] = is_dead
         if is_dead:
+            AXObject._clear_cached_properties(obj_id)
             msg = "AXObject: Adding to known dead objects"
             debug.printMessage(debug.LEVEL_INFO, msg, True, True)
             return
@@ -166,13 +774,46 @@ class AXObject:
         elif re.search(r"The application no longer exists", error):
             msg = msg.replace(error, "app no longer exists")
             debug.printMessage(debug.LEVEL_INFO, msg, True)
+        elif re.search(r"Timeout was reached|Did not receive a reply|NoReply", error):
+            msg = msg.replace(error, "call timed out")
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+            obj_id = AXSnapshot.get_id(obj)
+            if obj_id is not None:
+                AXObject.TIMEOUTS.setdefault(obj_id[0], []).append(time.monotonic())
+            return
         else:
             debug.printMessage(debug.LEVEL_INFO, msg, True)
             return
 
-        if AXObject.KNOWN_DEAD.get(hash(obj)) is False:
+        if AXObject.KNOWN_DEAD.get(AXObject.get_id(obj)) is False:
             AXObject._set_known_dead_status(obj, True)
 
+    @staticmethod
+    def get_timeout_count(app, window):
+        """Returns the number of calls to app which timed out in the past window seconds."""
+
+        app_id = AXSnapshot.get_id(app)
+        if app_id is None:
+            return 0
+
+        times = AXObject.TIMEOUTS.get(app_id[0])
+        if not times:
+            return 0
+
+        cutoff = time.monotonic() - window
+        times[:] = [t for t in times if t >= cutoff]
+        if not times:
+            AXObject.TIMEOUTS.pop(app_id[0], None)
+        return len(times)
+
+    @staticmethod
+    def clear_timeouts(app):
+        """Forgets the calls to app which timed out."""
+
+        app_id = AXSnapshot.get_id(app)
+        if app_id is not None:
+            AXObject.TIMEOUTS.pop(app_id[0], None)
+
     @staticmethod
     def supports_action(obj):
         """Returns True if the action interface is supported on obj"""
@@ -420,16 +1061,16 @@ class AXObject:
         if not AXObject.is_valid(obj):
             return []
 
+        # The ancestry and the index of each object in its parent are cached until the
+        # tree changes, so comparing paths to sort objects in document order only needs
+        # to ask the app the first time.
         path = []
-        acc = obj
-        while acc:
-            try:
-                path.append(Atspi.Accessible.get_index_in_parent(acc))
-            except Exception as error:
-                msg = f"AXObject: Exception getting index in parent for {acc}: {error}"
-                AXObject.handle_error(acc, error, msg)
+        for acc in [obj, *AXObject.get_ancestors(obj)]:
+            index = AXObject.get_index_in_parent(acc)
+            # Only an object without a parent has no index; otherwise the lookup failed.
+            if index < 0 and AXObject.get_parent(acc) is not None:
                 return []
-            acc = AXObject.get_parent_checked(acc)
+            path.append(index)
 
         path.reverse()
         return path
@@ -441,6 +1082,10 @@ class AXObject:
         if not AXObject.is_valid(obj):
             return -1
 
+        found, index = AXObject._get_cached_property(obj, "index_in_parent")
+        if found:
+            return index
+
         try:
             index = Atspi.Accessible.get_index_in_parent(obj)
         except Exception as error:
@@ -448,6 +1093,11 @@ class AXObject:
             AXObject.handle_error(obj, error, msg)
             return -1
 
+        # The index changes when the parent's children change, so it can only be cached
+        # if we know the parent.
+        parent = AXObject.get_parent(obj)
+        if parent is not None:
+            AXObject._set_cached_property(obj, "index_in_parent", index, parent)
         return index
 
     @staticmethod
@@ -457,12 +1107,15 @@ class AXObject:
         if not AXObject.is_valid(obj):
             return None
 
-        try:
-            parent = Atspi.Accessible.get_parent(obj)
-        except Exception as error:
-            msg = f"AXObject: Exception in get_parent: {error}"
-            AXObject.handle_error(obj, error, msg)
-            return None
+        found, parent = AXObject._get_cached_property(obj, "parent")
+        if not found:
+            try:
+                parent = Atspi.Accessible.get_parent(obj)
+            except Exception as error:
+                msg = f"AXObject: Exception in get_parent: {error}"
+                AXObject.handle_error(obj, error, msg)
+                return None
+            AXObject._set_cached_property(obj, "parent", parent, parent)
 
         if parent == obj:
             tokens = ["AXObject:", obj, "claims to be its own parent"]
@@ -510,29 +1163,70 @@ class AXObject:
         return parent
 
     @staticmethod
-    def find_ancestor(obj, pred):
-        """Returns the ancestor of obj if the function pred is true"""
+    def get_ancestors(obj):
+        """Returns the ancestors of obj, nearest first, stopping at the application."""
 
         if not AXObject.is_valid(obj):
-            return None
+            return ()
+
+        obj_id = AXObject.get_id(obj)
+        entry = AXObject.ANCESTRY.get(obj_id)
+        if entry is not None:
+            return entry[0]
 
         # Keep track of objects we've encountered in order to handle broken trees.
-        objects = [obj]
+        # Once we reach an ancestor whose ancestry is cached, we can stop walking.
+        ancestors = []
         parent = AXObject.get_parent_checked(obj)
         while parent:
-            if parent in objects:
-                tokens = ["AXObject: Circular tree suspected in find_ancestor. ",
-                          parent, "already in: ", objects]
+            if parent == obj or parent in ancestors:
+                tokens = ["AXObject: Circular tree suspected in get_ancestors. ",
+                          parent, "already in: ", [obj, *ancestors]]
                 debug.printTokens(debug.LEVEL_INFO, tokens, True)
-                return None
+                break
 
-            if pred(parent):
-                return parent
+            ancestors.append(parent)
+            entry = AXObject.ANCESTRY.get(AXObject.get_id(parent))
+            if entry is not None:
+                ancestors.extend(entry[0])
+                break
 
-            objects.append(parent)
             parent = AXObject.get_parent_checked(parent)
 
-        return None
+        ancestors = tuple(ancestors)
+        AXObject.ANCESTRY[obj_id] = ancestors, {}
+        for ancestor in ancestors:
+            AXObject.ANCESTRY_DEPENDENTS.setdefault(AXObject.get_id(ancestor), set()).add(obj_id)
+
+        return ancestors
+
+    @staticmethod
+    def find_ancestor(obj, pred, remember_as=None):
+        """Returns the ancestor of obj if the function pred is true. If remember_as is
+        specified, the result is cached under that key along with the ancestry of obj.
+        The key must identify pred, and pred must only depend on things which don't
+        change, such as the role or supported interfaces."""
+
+        ancestors = AXObject.get_ancestors(obj)
+        if not ancestors:
+            return None
+
+        if remember_as is not None:
+            entry = AXObject.ANCESTRY.get(AXObject.get_id(obj))
+            nearest = entry[1] if entry is not None else {}
+            if remember_as in nearest:
+                return nearest[remember_as]
+
+        result = None
+        for ancestor in ancestors:
+            if pred(ancestor):
+                result = ancestor
+                break
+
+        if remember_as is not None:
+            nearest[remember_as] = result
+
+        return result
 
     @staticmethod
     def is_ancestor(obj, ancestor):
@@ -618,30 +1312,64 @@ class AXObject:
         return real_child
 
     @staticmethod
-    def _find_descendant(obj, pred):
-        """Returns the descendant of obj if the function pred is true"""
+    def iter_descendants(root, exclude_if=None, budget=None):
+        """Generator to iterate through the descendants of root in depth-first order,
+        without recursion. Descendants for which the function exclude_if is true are
+        skipped along with their subtrees. If budget is specified, iteration stops once
+        the budget is exhausted."""
 
-        if not AXObject.is_valid(obj):
-            return None
+        if not AXObject.is_valid(root):
+            return
 
-        for i in range(AXObject.get_child_count(obj)):
-            child = AXObject.get_child_checked(obj, i)
-            if child and pred(child):
-                return child
+        if budget is not None:
+            budget.start()
+
+        # Each entry is an object we're descending into, the index of its next child
+        # to visit, and its child count.
+        stack = [[root, 0, AXObject.get_child_count(root)]]
+        ancestors = {AXObject.get_id(root)}
+        while stack:
+            entry = stack[-1]
+            obj, index, count = entry
+            if index >= count:
+                stack.pop()
+                ancestors.discard(AXObject.get_id(obj))
+                continue
 
-            child = AXObject._find_descendant(child, pred)
-            if child and pred(child):
-                return child
+            entry[1] += 1
+            if budget is not None and not budget.spend():
+                return
 
-        return None
+            child = AXObject.get_child_checked(obj, index)
+            if child is None or (exclude_if and exclude_if(child)):
+                continue
+
+            yield child
+            child_id = AXObject.get_id(child)
+            if child_id in ancestors:
+                tokens = ["AXObject: Circular tree suspected in iter_descendants.",
+                          child, "is its own ancestor"]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                continue
+
+            stack.append([child, 0, AXObject.get_child_count(child)])
+            ancestors.add(child_id)
 
     @staticmethod
-    def find_descendant(obj, pred):
-        """Returns the descendant of obj if the function pred is true"""
+    def find_descendant(obj, pred, budget=None):
+        """Returns the first descendant of obj for which the function pred is true.
+        If budget is specified, None is also returned when the budget is exhausted."""
 
         start = time.time()
-        result = AXObject._find_descendant(obj, pred)
+        result = None
+        for child in AXObject.iter_descendants(obj, budget=budget):
+            if pred(child):
+                result = child
+                break
+
         tokens = ["AXObject: find_descendant: found", result, f"in {time.time() - start:.4f}s"]
+        if budget is not None and budget.exhausted:
+            tokens.append(f"Search stopped: {budget.reason}")
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
         return result
 
@@ -659,32 +1387,22 @@ class AXObject:
         return AXObject.find_deepest_descendant(last_child)
 
     @staticmethod
-    def _find_all_descendants(obj, include_if, exclude_if, matches):
-        """Returns all descendants which match the specified inclusion and exclusion"""
-
-        if not AXObject.is_valid(obj):
-            return
+    def find_all_descendants(root, include_if=None, exclude_if=None, budget=None):
+        """Returns all descendants which match the specified inclusion and exclusion.
+        If budget is specified, the matches found before it was exhausted are returned."""
 
-        child_count = AXObject.get_child_count(obj)
-        for i in range(child_count):
-            child = AXObject.get_child(obj, i)
-            if exclude_if and exclude_if(child):
-                continue
+        start = time.time()
+        matches = []
+        for child in AXObject.iter_descendants(root, exclude_if, budget):
             if include_if and include_if(child):
                 matches.append(child)
-            AXObject._find_all_descendants(child, include_if, exclude_if, matches)
-
-    @staticmethod
-    def find_all_descendants(root, include_if=None, exclude_if=None):
-        """Returns all descendants which match the specified inclusion and exclusion"""
 
-        start = time.time()
-        matches = []
-        AXObject._find_all_descendants(root, include_if, exclude_if, matches)
         msg = (
             f"AXObject: find_all_descendants: {len(matches)} "
             f"matches found in {time.time() - start:.4f}s"
         )
+        if budget is not None and budget.exhausted:
+            msg += f". Search stopped: {budget.reason}"
         debug.printMessage(debug.LEVEL_INFO, msg, True)
         return matches
 
@@ -695,6 +1413,10 @@ class AXObject:
         if not AXObject.is_valid(obj):
             return Atspi.Role.INVALID
 
+        found, role = AXObject._get_cached_property(obj, "role")
+        if found:
+            return role
+
         try:
             role = Atspi.Accessible.get_role(obj)
         except Exception as error:
@@ -703,6 +1425,7 @@ class AXObject:
             return Atspi.Role.INVALID
 
         AXObject._set_known_dead_status(obj, False)
+        AXObject._set_cached_property(obj, "role", role)
         return role
 
     @staticmethod
@@ -728,6 +1451,10 @@ class AXObject:
         if not AXObject.is_valid(obj):
             return ""
 
+        found, name = AXObject._get_cached_property(obj, "name")
+        if found:
+            return name
+
         try:
             name = Atspi.Accessible.get_name(obj)
         except Exception as error:
@@ -736,6 +1463,7 @@ class AXObject:
             return ""
 
         AXObject._set_known_dead_status(obj, False)
+        AXObject._set_cached_property(obj, "name", name)
         return name
 
     @staticmethod
@@ -755,6 +1483,10 @@ class AXObject:
         if not AXObject.is_valid(obj):
             return ""
 
+        found, description = AXObject._get_cached_property(obj, "description")
+        if found:
+            return description
+
         try:
             description = Atspi.Accessible.get_description(obj)
         except Exception as error:
@@ -762,6 +1494,7 @@ class AXObject:
             AXObject.handle_error(obj, error, msg)
             return ""
 
+        AXObject._set_cached_property(obj, "description", description)
         return description
 
     @staticmethod
@@ -820,6 +1553,10 @@ class AXObject:
         if not AXObject.is_valid(obj):
             return 0
 
+        found, count = AXObject._get_cached_property(obj, "child_count")
+        if found:
+            return count
+
         try:
             count = Atspi.Accessible.get_child_count(obj)
         except Exception as error:
@@ -827,6 +1564,7 @@ class AXObject:
             AXObject.handle_error(obj, error, msg)
             return 0
 
+        AXObject._set_cached_property(obj, "child_count", count)
         return count
 
     @staticmethod
@@ -946,6 +1684,10 @@ class AXObject:
         if not AXObject.is_valid(obj):
             return Atspi.StateSet()
 
+        found, state_set = AXObject._get_cached_property(obj, "state_set")
+        if found:
+            return state_set
+
         try:
             state_set = Atspi.Accessible.get_state_set(obj)
         except Exception as error:
@@ -954,6 +1696,7 @@ class AXObject:
             return Atspi.StateSet()
 
         AXObject._set_known_dead_status(obj, False)
+        AXObject._set_cached_property(obj, "state_set", state_set)
         return state_set
 
     @staticmethod
@@ -1218,6 +1961,14 @@ class AXObject:
             tokens.append(f" Reason: {reason}")
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
+        AXObject._clear_ancestry(AXObject.get_id(obj))
+        to_clear = [AXObject.get_id(obj)]
+        while to_clear:
+            obj_id = to_clear.pop()
+            AXObject._clear_cached_properties(obj_id)
+            if recursive:
+                to_clear.extend(AXObject.CACHED_CHILDREN.pop(obj_id, ()))
+
         if not recursive:
             try:
                 Atspi.Accessible.clear_cache_single(obj)
@@ -1278,7 +2029,7 @@ class AXObject:
             return {}
 
         if use_cache:
-            attributes = AXObject.OBJECT_ATTRIBUTES.get(hash(obj))
+            attributes = AXObject.OBJECT_ATTRIBUTES.get(AXObject.get_id(obj))
             if attributes:
                 return attributes
 
@@ -1292,7 +2043,7 @@ class AXObject:
         if attributes is None:
             return {}
 
-        AXObject.OBJECT_ATTRIBUTES[hash(obj)] = attributes
+        AXObject.OBJECT_ATTRIBUTES.set(AXObject.get_id(obj), attributes, obj)
         return attributes
 
     @staticmethod
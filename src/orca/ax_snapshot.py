@@ -0,0 +1,266 @@
+# Utilities for retrieving the properties of many accessible objects at once.
+#
+# Copyright 2024 The Orca Team
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., Franklin Street, Fifth Floor,
+# Boston MA  02110-1301 USA.
+
+"""
+Utilities for retrieving the properties of many accessible objects at once.
+Applications which implement the org.a11y.atspi.Cache interface can give us the
+role, name, description, states, and child count of every object in one round trip.
+The snapshot taken this way is consumed by AXObject, which moves the properties of
+an object into its own cache the first time one of them is needed. Applications
+which lack the interface are remembered, and for them AXObject keeps asking for
+each property individually.
+"""
+
+__id__        = "$Id$"
+__version__   = "$Revision$"
+__date__      = "$Date$"
+__copyright__ = "Copyright (c) 2024 The Orca Team"
+__license__   = "LGPL"
+
+import os
+import threading
+import time
+
+import gi
+gi.require_version("Atspi", "2.0")
+from gi.repository import Atspi
+from gi.repository import Gio
+from gi.repository import GLib
+
+from . import debug
+
+
+class AXSnapshot:
+    """Utilities for retrieving the properties of many accessible objects at once."""
+
+    CACHE_PATH = "/org/a11y/atspi/cache"
+    CACHE_INTERFACE = "org.a11y.atspi.Cache"
+
+    # In milliseconds. The call is made on the main thread, so we would rather go without
+    # the snapshot than wait long for the reply of a large application.
+    TIMEOUT = 500
+
+    # Keyed by (bus name, object path), with each value being a dictionary of property
+    # name to value, using the same names as the AXObject property cache.
+    ITEMS = {}
+    UNSUPPORTED_APPS = set()
+
+    _connection = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def clear(reason=""):
+        """Discards the current snapshot."""
+
+        if not AXSnapshot.ITEMS:
+            return
+
+        tokens = ["AXSnapshot: Discarding snapshot of", len(AXSnapshot.ITEMS), "objects."]
+        if reason:
+            tokens.append(f"Reason: {reason}")
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+
+        with AXSnapshot._lock:
+            AXSnapshot.ITEMS.clear()
+
+    @staticmethod
+    def get_connection():
+        """Returns a connection to the accessibility bus, or None on failure."""
+
+        if AXSnapshot._connection is not None:
+            return AXSnapshot._connection
+
+        address = os.environ.get("AT_SPI_BUS_ADDRESS")
+        try:
+            if not address:
+                result = Gio.DBusConnection.call_sync(
+                    Gio.bus_get_sync(Gio.BusType.SESSION, None),
+                    "org.a11y.Bus", "/org/a11y/bus", "org.a11y.Bus", "GetAddress",
+                    None, GLib.VariantType.new("(s)"), Gio.DBusCallFlags.NONE, -1, None)
+                address = result.unpack()[0]
+
+            flags = Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT \
+                | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION
+            AXSnapshot._connection = Gio.DBusConnection.new_for_address_sync(
+                address, flags, None, None)
+        except Exception as error:
+            msg = f"AXSnapshot: Exception connecting to the accessibility bus: {error}"
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+            return None
+
+        return AXSnapshot._connection
+
+    @staticmethod
+    def get_id(obj):
+        """Returns the (bus name, object path) of obj without asking the app, or None."""
+
+        try:
+            return obj.app.bus_name, obj.path
+        except Exception:
+            return None
+
+    @staticmethod
+    def _get_items(bus_name):
+        """Returns the unpacked reply of the Cache.GetItems call, or None on failure."""
+
+        connection = AXSnapshot.get_connection()
+        if connection is None:
+            return None
+
+        try:
+            result = connection.call_sync(
+                bus_name, AXSnapshot.CACHE_PATH, AXSnapshot.CACHE_INTERFACE, "GetItems",
+                None, None, Gio.DBusCallFlags.NONE, AXSnapshot.TIMEOUT, None)
+        except GLib.Error as error:
+            msg = f"AXSnapshot: Exception calling GetItems on {bus_name}: {error}"
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+            if Gio.DBusError.is_remote_error(error):
+                remote_error = Gio.DBusError.get_remote_error(error)
+                if remote_error in ("org.freedesktop.DBus.Error.UnknownMethod",
+                                    "org.freedesktop.DBus.Error.UnknownInterface",
+                                    "org.freedesktop.DBus.Error.UnknownObject"):
+                    AXSnapshot.UNSUPPORTED_APPS.add(bus_name)
+            return None
+
+        return result.unpack()[0]
+
+    @staticmethod
+    def role_from_value(value):
+        """Returns the Atspi.Role for the role value given to us over D-Bus."""
+
+        try:
+            return Atspi.Role(value)
+        except ValueError:
+            return Atspi.Role.UNKNOWN
+
+    @staticmethod
+    def state_set_from_words(words):
+        """Returns the Atspi.StateSet for the state bit words given to us over D-Bus."""
+
+        states = []
+        for i, word in enumerate(words):
+            for bit in range(32):
+                value = i * 32 + bit
+                if word & (1 << bit) and value < Atspi.StateType.LAST_DEFINED:
+                    states.append(Atspi.StateType(value))
+
+        return Atspi.StateSet.new(states)
+
+    @staticmethod
+    def _parse_items(items):
+        """Returns a dictionary of id to (parent id, properties) for the items."""
+
+        result = {}
+        for item in items:
+            # Current versions of at-spi2-core give us the index in parent and the child
+            # count. Older ones give us the list of children instead. We don't use the
+            # index in parent because AXObject only caches it along with the parent.
+            if len(item) == 10:
+                obj, _app, parent, _index, count, _ifaces, name, role, desc, states = item
+            elif len(item) == 9:
+                obj, _app, parent, children, _ifaces, name, role, desc, states = item
+                count = len(children)
+            else:
+                continue
+
+            properties = {
+                "role": AXSnapshot.role_from_value(role),
+                "name": name,
+                "description": desc,
+                "child_count": count,
+                "state_set": AXSnapshot.state_set_from_words(states),
+            }
+            result[tuple(obj)] = tuple(parent), properties
+
+        return result
+
+    @staticmethod
+    def prefetch(root):
+        """Snapshots the properties of root and its descendants in one call if the app
+        supports it. Returns the number of objects in the snapshot."""
+
+        root_id = AXSnapshot.get_id(root)
+        if root_id is None:
+            return 0
+
+        bus_name = root_id[0]
+        if bus_name in AXSnapshot.UNSUPPORTED_APPS:
+            return 0
+
+        start = time.time()
+        items = AXSnapshot._get_items(bus_name)
+        if not items:
+            return 0
+
+        parsed = AXSnapshot._parse_items(items)
+
+        # The reply covers the entire application. We only keep root's subtree.
+        in_subtree = {root_id: True}
+        def is_in_subtree(obj_id):
+            chain = []
+            while obj_id not in in_subtree:
+                entry = parsed.get(obj_id)
+                if entry is None or obj_id in chain:
+                    break
+                chain.append(obj_id)
+                obj_id = entry[0]
+            result = in_subtree.get(obj_id, False)
+            for x in chain:
+                in_subtree[x] = result
+            return result
+
+        snapshot = {k: v[1] for k, v in parsed.items() if is_in_subtree(k)}
+        with AXSnapshot._lock:
+            AXSnapshot.ITEMS.clear()
+            AXSnapshot.ITEMS.update(snapshot)
+
+        msg = (
+            f"AXSnapshot: Snapshot of {len(snapshot)} of {len(items)} objects "
+            f"from {bus_name} took {time.time() - start:.4f}s"
+        )
+        debug.printMessage(debug.LEVEL_INFO, msg, True)
+        return len(snapshot)
+
+    @staticmethod
+    def take_properties(obj):
+        """Returns and forgets the snapshot properties of obj, or None if there are none."""
+
+        if not AXSnapshot.ITEMS:
+            return None
+
+        obj_id = AXSnapshot.get_id(obj)
+        if obj_id is None:
+            return None
+
+        with AXSnapshot._lock:
+            return AXSnapshot.ITEMS.pop(obj_id, None)
+
+    @staticmethod
+    def discard(obj):
+        """Forgets the snapshot properties of obj, which are now stale."""
+
+        if not AXSnapshot.ITEMS:
+            return
+
+        obj_id = AXSnapshot.get_id(obj)
+        if obj_id is None:
+            return
+
+        with AXSnapshot._lock:
+            AXSnapshot.ITEMS.pop(obj_id, None)
@@ -45,27 +45,28 @@ from gi.repository import Atspi
 
 from . import debug
 from . import messages
-from .ax_object import AXObject
+from .ax_object import AXObject, GenerationalCache
 from .ax_utilities import AXUtilities
 
 class AXTable:
     """Utilities for obtaining information about accessible tables."""
 
-    # Things we cache.
-    CAPTIONS = {}
-    PHYSICAL_COORDINATES_FROM_CELL = {}
-    PHYSICAL_COORDINATES_FROM_TABLE = {}
-    PHYSICAL_SPANS_FROM_CELL = {}
-    PHYSICAL_SPANS_FROM_TABLE = {}
-    PHYSICAL_COLUMN_COUNT = {}
-    PHYSICAL_ROW_COUNT = {}
-    PRESENTABLE_COORDINATES = {}
-    PRESENTABLE_COORDINATES_LABELS = {}
-    PRESENTABLE_SPANS = {}
-    PRESENTABLE_COLUMN_COUNT = {}
-    PRESENTABLE_ROW_COUNT = {}
-    COLUMN_HEADERS_FOR_CELL = {}
-    ROW_HEADERS_FOR_CELL = {}
+    # Things we cache. Each entry is stamped with the generation of the table, row, or
+    # cell whose changes can alter it. See AXObject.invalidate().
+    CAPTIONS = GenerationalCache()
+    PHYSICAL_COORDINATES_FROM_CELL = GenerationalCache()
+    PHYSICAL_COORDINATES_FROM_TABLE = GenerationalCache()
+    PHYSICAL_SPANS_FROM_CELL = GenerationalCache()
+    PHYSICAL_SPANS_FROM_TABLE = GenerationalCache()
+    PHYSICAL_COLUMN_COUNT = GenerationalCache()
+    PHYSICAL_ROW_COUNT = GenerationalCache()
+    PRESENTABLE_COORDINATES = GenerationalCache()
+    PRESENTABLE_COORDINATES_LABELS = GenerationalCache()
+    PRESENTABLE_SPANS = GenerationalCache()
+    PRESENTABLE_COLUMN_COUNT = GenerationalCache()
+    PRESENTABLE_ROW_COUNT = GenerationalCache()
+    COLUMN_HEADERS_FOR_CELL = GenerationalCache()
+    ROW_HEADERS_FOR_CELL = GenerationalCache()
 
     # Things which have to be explicitly cleared.
     DYNAMIC_COLUMN_HEADERS_ROW = {}
@@ -83,11 +84,36 @@ class AXTable:
 
     @staticmethod
     def _clear_stored_data():
-        """Clears any data we have cached for objects"""
+        """Removes stale data we have cached for objects"""
 
         while True:
             time.sleep(60)
-            AXTable._clear_all_dictionaries()
+            AXTable._remove_stale_entries()
+
+    @staticmethod
+    def _remove_stale_entries():
+        with AXTable._lock:
+            removed = sum(cache.prune() for cache in AXTable._get_caches())
+
+        tokens = ["AXTable: Removed", removed, "stale cache entries."]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+
+    @staticmethod
+    def _get_caches():
+        return (AXTable.CAPTIONS,
+                AXTable.PHYSICAL_COORDINATES_FROM_CELL,
+                AXTable.PHYSICAL_COORDINATES_FROM_TABLE,
+                AXTable.PHYSICAL_SPANS_FROM_CELL,
+                AXTable.PHYSICAL_SPANS_FROM_TABLE,
+                AXTable.PHYSICAL_COLUMN_COUNT,
+                AXTable.PHYSICAL_ROW_COUNT,
+                AXTable.PRESENTABLE_COORDINATES,
+                AXTable.PRESENTABLE_COORDINATES_LABELS,
+                AXTable.PRESENTABLE_SPANS,
+                AXTable.PRESENTABLE_COLUMN_COUNT,
+                AXTable.PRESENTABLE_ROW_COUNT,
+                AXTable.COLUMN_HEADERS_FOR_CELL,
+                AXTable.ROW_HEADERS_FOR_CELL)
 
     @staticmethod
     def _clear_all_dictionaries(reason=""):
@@ -97,19 +123,8 @@ class AXTable:
         debug.printMessage(debug.LEVEL_INFO, msg, True)
 
         with AXTable._lock:
-            AXTable.CAPTIONS.clear()
-            AXTable.PHYSICAL_COORDINATES_FROM_CELL.clear()
-            AXTable.PHYSICAL_COORDINATES_FROM_TABLE.clear()
-            AXTable.PHYSICAL_SPANS_FROM_CELL.clear()
-            AXTable.PHYSICAL_SPANS_FROM_TABLE.clear()
-            AXTable.PHYSICAL_COLUMN_COUNT.clear()
-            AXTable.PHYSICAL_ROW_COUNT.clear()
-            AXTable.PRESENTABLE_COORDINATES.clear()
-            AXTable.PRESENTABLE_COORDINATES_LABELS.clear()
-            AXTable.PRESENTABLE_COLUMN_COUNT.clear()
-            AXTable.PRESENTABLE_ROW_COUNT.clear()
-            AXTable.COLUMN_HEADERS_FOR_CELL.clear()
-            AXTable.ROW_HEADERS_FOR_CELL.clear()
+            for cache in AXTable._get_caches():
+                cache.clear()
 
     @staticmethod
     def clear_cache_now(reason=""):
@@ -124,8 +139,8 @@ class AXTable:
         if not AXObject.supports_table(table):
             return None
 
-        if hash(table) in AXTable.CAPTIONS:
-            return AXTable.CAPTIONS.get(hash(table))
+        if AXObject.get_id(table) in AXTable.CAPTIONS:
+            return AXTable.CAPTIONS.get(AXObject.get_id(table))
 
         try:
             caption = Atspi.Table.get_caption(table)
@@ -136,7 +151,7 @@ class AXTable:
 
         tokens = ["AXTable: Caption for", table, "is", caption]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.CAPTIONS[hash(table)] = caption
+        AXTable.CAPTIONS[AXObject.get_id(table)] = caption
         return caption
 
     @staticmethod
@@ -151,7 +166,7 @@ class AXTable:
             if count is not None:
                 return count
 
-        count = AXTable.PHYSICAL_COLUMN_COUNT.get(hash(table))
+        count = AXTable.PHYSICAL_COLUMN_COUNT.get(AXObject.get_id(table))
         if count is not None:
             return count
 
@@ -164,15 +179,15 @@ class AXTable:
 
         tokens = ["AXTable: Column count for", table, "is", count]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PHYSICAL_COLUMN_COUNT[hash(table)] = count
+        AXTable.PHYSICAL_COLUMN_COUNT[AXObject.get_id(table)] = count
         return count
 
     @staticmethod
     def _get_column_count_from_attribute(table):
         """Returns the value of the 'colcount' object attribute or None if not found."""
 
-        if hash(table) in AXTable.PRESENTABLE_COLUMN_COUNT:
-            return AXTable.PRESENTABLE_COLUMN_COUNT.get(hash(table))
+        if AXObject.get_id(table) in AXTable.PRESENTABLE_COLUMN_COUNT:
+            return AXTable.PRESENTABLE_COLUMN_COUNT.get(AXObject.get_id(table))
 
         attrs = AXObject.get_attributes_dict(table)
         attr = attrs.get("colcount")
@@ -182,7 +197,7 @@ class AXTable:
 
         tokens = ["AXTable: Column count attribute for", table, "is", count]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PRESENTABLE_COLUMN_COUNT[hash(table)] = count
+        AXTable.PRESENTABLE_COLUMN_COUNT[AXObject.get_id(table)] = count
         return count
 
     @staticmethod
@@ -197,7 +212,7 @@ class AXTable:
             if count is not None:
                 return count
 
-        count = AXTable.PHYSICAL_ROW_COUNT.get(hash(table))
+        count = AXTable.PHYSICAL_ROW_COUNT.get(AXObject.get_id(table))
         if count is not None:
             return count
 
@@ -210,15 +225,15 @@ class AXTable:
 
         tokens = ["AXTable: Row count for", table, "is", count]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PHYSICAL_ROW_COUNT[hash(table)] = count
+        AXTable.PHYSICAL_ROW_COUNT[AXObject.get_id(table)] = count
         return count
 
     @staticmethod
     def _get_row_count_from_attribute(table):
         """Returns the value of the 'rowcount' object attribute or None if not found."""
 
-        if hash(table) in AXTable.PRESENTABLE_ROW_COUNT:
-            return AXTable.PRESENTABLE_ROW_COUNT.get(hash(table))
+        if AXObject.get_id(table) in AXTable.PRESENTABLE_ROW_COUNT:
+            return AXTable.PRESENTABLE_ROW_COUNT.get(AXObject.get_id(table))
 
         attrs = AXObject.get_attributes_dict(table)
         attr = attrs.get("rowcount")
@@ -228,7 +243,7 @@ class AXTable:
 
         tokens = ["AXTable: Row count attribute for", table, "is", count]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PRESENTABLE_ROW_COUNT[hash(table)] = count
+        AXTable.PRESENTABLE_ROW_COUNT[AXObject.get_id(table)] = count
         return count
 
     @staticmethod
@@ -401,8 +416,8 @@ class AXTable:
     def _get_cell_spans_from_attribute(cell):
         """Returns the row and column spans exposed via object attribute, or None, None."""
 
-        if hash(cell) in AXTable.PRESENTABLE_SPANS:
-            return AXTable.PRESENTABLE_SPANS.get(hash(cell))
+        if AXObject.get_id(cell) in AXTable.PRESENTABLE_SPANS:
+            return AXTable.PRESENTABLE_SPANS.get(AXObject.get_id(cell))
 
         attrs = AXObject.get_attributes_dict(cell)
         row_span = attrs.get("rowspan")
@@ -410,15 +425,15 @@ class AXTable:
 
         tokens = ["AXTable: Row and col span attributes for", cell, ":", row_span, ",", col_span]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PRESENTABLE_SPANS[hash(cell)] = row_span, col_span
+        AXTable.PRESENTABLE_SPANS[AXObject.get_id(cell)] = row_span, col_span
         return row_span, col_span
 
     @staticmethod
     def _get_cell_spans_from_table(cell):
         """Returns the row and column spans of cell via the table interface."""
 
-        if hash(cell) in AXTable.PHYSICAL_SPANS_FROM_TABLE:
-            return AXTable.PHYSICAL_SPANS_FROM_TABLE.get(hash(cell))
+        if AXObject.get_id(cell) in AXTable.PHYSICAL_SPANS_FROM_TABLE:
+            return AXTable.PHYSICAL_SPANS_FROM_TABLE.get(AXObject.get_id(cell))
 
         index = AXTable._get_cell_index(cell)
         if index < 0:
@@ -465,15 +480,15 @@ class AXTable:
         tokens = ["AXTable: Table iface spans for", cell,
                   f"are rowspan: {row_span}, colspan: {col_span}"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PHYSICAL_SPANS_FROM_TABLE[hash(cell)] = row_span, col_span
+        AXTable.PHYSICAL_SPANS_FROM_TABLE.set(AXObject.get_id(cell), (row_span, col_span), table)
         return row_span, col_span
 
     @staticmethod
     def _get_cell_spans_from_table_cell(cell):
         """Returns the row and column spans of cell via the table cell interface."""
 
-        if hash(cell) in AXTable.PHYSICAL_SPANS_FROM_CELL:
-            return AXTable.PHYSICAL_SPANS_FROM_CELL.get(hash(cell))
+        if AXObject.get_id(cell) in AXTable.PHYSICAL_SPANS_FROM_CELL:
+            return AXTable.PHYSICAL_SPANS_FROM_CELL.get(AXObject.get_id(cell))
 
         if not AXObject.supports_table_cell(cell):
             return -1, -1
@@ -491,7 +506,7 @@ class AXTable:
         tokens = ["AXTable: TableCell iface spans for", cell,
                   f"are rowspan: {row_span}, colspan: {col_span}"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PHYSICAL_SPANS_FROM_CELL[hash(cell)] = row_span, col_span
+        AXTable.PHYSICAL_SPANS_FROM_CELL[AXObject.get_id(cell)] = row_span, col_span
         return row_span, col_span
 
     @staticmethod
@@ -623,14 +638,15 @@ class AXTable:
         # TODO - JD: Figure out what the rest do, and then try to get the implementations
         # aligned.
 
-        result = AXTable.ROW_HEADERS_FOR_CELL.get(hash(cell))
+        result = AXTable.ROW_HEADERS_FOR_CELL.get(AXObject.get_id(cell))
         if result is not None:
             return result
 
+        table = AXTable.get_table(cell)
         result = AXTable._get_row_headers(cell)
         # There either are no headers, or we got all of them.
         if len(result) != 1:
-            AXTable.ROW_HEADERS_FOR_CELL[hash(cell)] = result
+            AXTable.ROW_HEADERS_FOR_CELL.set(AXObject.get_id(cell), result, table or cell)
             return result
 
         others = AXTable._get_row_headers(result[0])
@@ -638,7 +654,7 @@ class AXTable:
             result.insert(0, others[0])
             others = AXTable._get_row_headers(result[0])
 
-        AXTable.ROW_HEADERS_FOR_CELL[hash(cell)] = result
+        AXTable.ROW_HEADERS_FOR_CELL.set(AXObject.get_id(cell), result, table or cell)
         return result
 
     @staticmethod
@@ -700,14 +716,15 @@ class AXTable:
         # TODO - JD: Figure out what the rest do, and then try to get the implementations
         # aligned.
 
-        result = AXTable.COLUMN_HEADERS_FOR_CELL.get(hash(cell))
+        result = AXTable.COLUMN_HEADERS_FOR_CELL.get(AXObject.get_id(cell))
         if result is not None:
             return result
 
+        table = AXTable.get_table(cell)
         result = AXTable._get_column_headers(cell)
         # There either are no headers, or we got all of them.
         if len(result) != 1:
-            AXTable.COLUMN_HEADERS_FOR_CELL[hash(cell)] = result
+            AXTable.COLUMN_HEADERS_FOR_CELL.set(AXObject.get_id(cell), result, table or cell)
             return result
 
         others = AXTable._get_column_headers(result[0])
@@ -715,7 +732,7 @@ class AXTable:
             result.insert(0, others[0])
             others = AXTable._get_column_headers(result[0])
 
-        AXTable.COLUMN_HEADERS_FOR_CELL[hash(cell)] = result
+        AXTable.COLUMN_HEADERS_FOR_CELL.set(AXObject.get_id(cell), result, table or cell)
         return result
 
     @staticmethod
@@ -784,8 +801,8 @@ class AXTable:
     def _get_cell_coordinates_from_table(cell):
         """Returns the row and column indices of cell via the table interface."""
 
-        if hash(cell) in AXTable.PHYSICAL_COORDINATES_FROM_TABLE:
-            return AXTable.PHYSICAL_COORDINATES_FROM_TABLE.get(hash(cell))
+        if AXObject.get_id(cell) in AXTable.PHYSICAL_COORDINATES_FROM_TABLE:
+            return AXTable.PHYSICAL_COORDINATES_FROM_TABLE.get(AXObject.get_id(cell))
 
         index = AXTable._get_cell_index(cell)
         if index < 0:
@@ -807,15 +824,15 @@ class AXTable:
 
         tokens = ["AXTable: Table iface coords for", cell, f"are row: {row}, col: {column}"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PHYSICAL_COORDINATES_FROM_TABLE[hash(cell)] = row, column
+        AXTable.PHYSICAL_COORDINATES_FROM_TABLE.set(AXObject.get_id(cell), (row, column), table)
         return row, column
 
     @staticmethod
     def _get_cell_coordinates_from_table_cell(cell):
         """Returns the row and column indices of cell via the table cell interface."""
 
-        if hash(cell) in AXTable.PHYSICAL_COORDINATES_FROM_CELL:
-            return AXTable.PHYSICAL_COORDINATES_FROM_CELL.get(hash(cell))
+        if AXObject.get_id(cell) in AXTable.PHYSICAL_COORDINATES_FROM_CELL:
+            return AXTable.PHYSICAL_COORDINATES_FROM_CELL.get(AXObject.get_id(cell))
 
         if not AXObject.supports_table_cell(cell):
             return -1, -1
@@ -832,7 +849,8 @@ class AXTable:
 
         tokens = ["AXTable: TableCell iface coords for", cell, f"are row: {row}, col: {column}"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PHYSICAL_COORDINATES_FROM_CELL[hash(cell)] = row, column
+        AXTable.PHYSICAL_COORDINATES_FROM_CELL.set(
+            AXObject.get_id(cell), (row, column), AXTable.get_table(cell) or cell)
         return row, column
 
     @staticmethod
@@ -842,8 +860,8 @@ class AXTable:
         if cell is None:
             return None, None
 
-        if hash(cell) in AXTable.PRESENTABLE_COORDINATES:
-            return AXTable.PRESENTABLE_COORDINATES.get(hash(cell))
+        if AXObject.get_id(cell) in AXTable.PRESENTABLE_COORDINATES:
+            return AXTable.PRESENTABLE_COORDINATES.get(AXObject.get_id(cell))
 
         attrs = AXObject.get_attributes_dict(cell)
         row_index = attrs.get("rowindex")
@@ -851,7 +869,7 @@ class AXTable:
 
         tokens = ["AXTable: Row and col index attributes for", cell, ":", row_index, ",", col_index]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PRESENTABLE_COORDINATES[hash(cell)] = row_index, col_index
+        AXTable.PRESENTABLE_COORDINATES[AXObject.get_id(cell)] = row_index, col_index
         if row_index is not None and col_index is not None:
             return row_index, col_index
 
@@ -865,7 +883,7 @@ class AXTable:
 
         tokens = ["AXTable: Updated attributes based on", row, ":", row_index, col_index]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PRESENTABLE_COORDINATES[hash(cell)] = row_index, col_index
+        AXTable.PRESENTABLE_COORDINATES.set(AXObject.get_id(cell), (row_index, col_index), row)
         return row_index, col_index
 
     @staticmethod
@@ -893,7 +911,7 @@ class AXTable:
         if is_table(obj):
             return obj
 
-        return AXObject.find_ancestor(obj, is_table)
+        return AXObject.find_ancestor(obj, is_table, remember_as="table")
 
     @staticmethod
     def get_table_description_for_presentation(table):
@@ -1084,8 +1102,8 @@ class AXTable:
     def get_label_for_cell_coordinates(cell):
         """Returns the text that should be used instead of the numeric indices."""
 
-        if hash(cell) in AXTable.PRESENTABLE_COORDINATES_LABELS:
-            return AXTable.PRESENTABLE_COORDINATES_LABELS.get(hash(cell))
+        if AXObject.get_id(cell) in AXTable.PRESENTABLE_COORDINATES_LABELS:
+            return AXTable.PRESENTABLE_COORDINATES_LABELS.get(AXObject.get_id(cell))
 
         attrs = AXObject.get_attributes_dict(cell)
         result = ""
@@ -1099,7 +1117,7 @@ class AXTable:
 
         tokens = ["AXTable: Coordinates label for", cell, f": {result}"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PRESENTABLE_COORDINATES_LABELS[hash(cell)] = result
+        AXTable.PRESENTABLE_COORDINATES_LABELS[AXObject.get_id(cell)] = result
         if result:
             return result
 
@@ -1115,7 +1133,7 @@ class AXTable:
 
         tokens = ["AXTable: Updated coordinates label based on", row, f": {result}"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        AXTable.PRESENTABLE_COORDINATES_LABELS[hash(cell)] = result
+        AXTable.PRESENTABLE_COORDINATES_LABELS.set(AXObject.get_id(cell), result, row)
         return result
 
     @staticmethod
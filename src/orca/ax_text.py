@@ -36,17 +36,335 @@ __copyright__ = "Copyright (c) 2024 Igalia, S.L." \
                 "Copyright (c) 2024 GNOME Foundation Inc."
 __license__   = "LGPL"
 
+import bisect
+import time
+
 import gi
 gi.require_version("Atspi", "2.0")
 from gi.repository import Atspi
 
 from . import debug
-from .ax_object import AXObject
+from .ax_object import AXObject, BoundedCache
 from .ax_utilities import AXUtilities
 
+class TextMirror:
+    """A local copy of the text of an object, kept current via text-changed events."""
+
+    def __init__(self, obj, text):
+        self.obj = obj
+        self.text = text
+        self.confirmed = False
+        self.verified = time.monotonic()
+        # The range, in current offsets, of the text changed since the last verification.
+        self.dirty = None
+
+    def _mark_dirty(self, start, end):
+        start, end = max(0, start), min(len(self.text), end)
+        if self.dirty is not None:
+            start, end = min(start, self.dirty[0]), max(end, self.dirty[1])
+        self.dirty = start, end
+
+    def _shift_dirty(self, offset, delta):
+        if self.dirty is None:
+            return
+
+        def shift(x):
+            if x <= offset:
+                return x
+            return max(offset, x + delta)
+
+        self.dirty = shift(self.dirty[0]), shift(self.dirty[1])
+
+    def apply(self, event):
+        """Applies the text-changed event. Returns False if it cannot be applied."""
+
+        offset, length, string = event.detail1, event.detail2, event.any_data
+        if not isinstance(string, str) or len(string) != length:
+            return False
+
+        if event.type.startswith("object:text-changed:insert"):
+            if not 0 <= offset <= len(self.text):
+                return False
+            self.text = self.text[:offset] + string + self.text[offset:]
+            self._shift_dirty(offset, length)
+            self._mark_dirty(offset - 1, offset + length + 1)
+            return True
+
+        if event.type.startswith("object:text-changed:delete"):
+            if self.text[offset:offset + length] != string or offset < 0:
+                return False
+            self.text = self.text[:offset] + self.text[offset + length:]
+            self._shift_dirty(offset, -length)
+            self._mark_dirty(offset - 1, offset + 1)
+            return True
+
+        return False
+
+    def verify(self):
+        """Returns True if the character count and the text changed since the last
+        verification match what the app reports."""
+
+        try:
+            count = Atspi.Text.get_character_count(self.obj)
+            if count != len(self.text):
+                tokens = ["AXText: Mirror of", self.obj, f"has {len(self.text)} characters.",
+                          f"App reports {count}."]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                return False
+
+            if self.dirty is not None:
+                start, end = self.dirty
+                text = Atspi.Text.get_text(self.obj, start, end)
+                if text != self.text[start:end]:
+                    tokens = ["AXText: Mirror of", self.obj, f"has '{self.text[start:end]}'",
+                              f"({start}-{end}). App reports '{text}'."]
+                    debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                    return False
+        except Exception as error:
+            msg = f"AXText: Exception verifying mirror: {error}"
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+            return False
+
+        self.confirmed = True
+        self.verified = time.monotonic()
+        self.dirty = None
+        return True
+
+    def get_text(self, start_offset, end_offset):
+        """Returns the text within the specified offsets, as Atspi.Text.get_text would."""
+
+        if end_offset < 0:
+            end_offset = len(self.text)
+        return self.text[max(0, start_offset):end_offset]
+
+
+class OffsetIndex:
+    """Values for non-overlapping ranges of offsets in an object, sorted by start offset."""
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.starts = []
+        # Keyed by start offset, the (end offset, value, time added) of each range.
+        self.ranges = {}
+
+    def lookup(self, offset):
+        """Returns the (start, end, value, time added) of the range containing offset."""
+
+        i = bisect.bisect_right(self.starts, offset) - 1
+        if i < 0:
+            return None
+
+        start = self.starts[i]
+        end, value, added = self.ranges[start]
+        if not start <= offset < end:
+            return None
+
+        return start, end, value, added
+
+    def add(self, start, end, value):
+        """Adds the range, replacing any known ranges it overlaps."""
+
+        if not 0 <= start < end:
+            return
+
+        i = bisect.bisect_left(self.starts, start)
+        if i and self.ranges[self.starts[i - 1]][0] > start:
+            i -= 1
+        j = bisect.bisect_left(self.starts, end)
+        for x in self.starts[i:j]:
+            del self.ranges[x]
+        self.starts[i:j] = [start]
+        self.ranges[start] = end, value, time.monotonic()
+
+    def remove(self, start):
+        """Forgets the range which starts at start."""
+
+        if self.ranges.pop(start, None) is not None:
+            self.starts.remove(start)
+
+    def truncate(self, offset):
+        """Forgets the ranges which end at or after offset."""
+
+        i = bisect.bisect_left(self.starts, offset)
+        if i and self.ranges[self.starts[i - 1]][0] >= offset:
+            i -= 1
+        for x in self.starts[i:]:
+            del self.ranges[x]
+        del self.starts[i:]
+
+
+class LineIndex(OffsetIndex):
+    """The lines of an object we know about, sorted by start offset."""
+
+    def get(self, offset, soft_line_ttl):
+        """Returns the (content, start, end) of the known line containing offset, or None.
+        Lines which end without a newline (e.g. wrapped lines) expire after soft_line_ttl
+        seconds, because resizing can change them without a text-changed event."""
+
+        result = self.lookup(offset)
+        if result is None:
+            return None
+
+        start, end, content, added = result
+        if not content.endswith("\n") and time.monotonic() - added > soft_line_ttl:
+            self.remove(start)
+            return None
+
+        return content, start, end
+
+    def apply(self, event, text=None):
+        """Adjusts the lines for the text-changed event. The lines touching the change are
+        forgotten, as are the other lines of its paragraph, which might have rewrapped.
+        The lines after the paragraph are shifted if text, the full text after the change,
+        is provided and confirms them. Otherwise they are forgotten, because we cannot
+        tell whether they were added before or after the change."""
+
+        offset, length = event.detail1, event.detail2
+        if event.type.startswith("object:text-changed:insert"):
+            change_end, delta = offset, length
+        elif event.type.startswith("object:text-changed:delete"):
+            change_end, delta = offset + length, -length
+        else:
+            return
+
+        starts, ranges = [], {}
+        previous = None
+        in_paragraph = False
+        for start in self.starts:
+            end, content, added = self.ranges[start]
+            if end < offset:
+                previous = start if not content.endswith("\n") else None
+                starts.append(start)
+                ranges[start] = end, content, added
+                continue
+
+            if start <= change_end or in_paragraph:
+                if previous is not None:
+                    starts.remove(previous)
+                    del ranges[previous]
+                    previous = None
+                in_paragraph = not content.endswith("\n")
+                continue
+
+            if text is None or text[start + delta:end + delta] != content:
+                continue
+
+            starts.append(start + delta)
+            ranges[start + delta] = end + delta, content, added
+
+        self.starts, self.ranges = starts, ranges
+
+
 class AXText:
     """Utilities for obtaining information about accessible text."""
 
+    # The caches below are keyed by the object's id. See AXObject.get_id().
+
+    # Local copies of the text of editable objects, so that repeatedly asking for the
+    # same text (e.g. for caret navigation, echo, and braille) does not require a round
+    # trip each time. A mirror is seeded from the app on first use and is then updated
+    # from text-changed events. Because events queued before seeding might be applied
+    # again, a new mirror is checked against the app before it is trusted, as is every
+    # mirror which changed after MIRROR_VERIFY_INTERVAL seconds.
+    MIRRORS = BoundedCache(max_size=100)
+    MIRROR_MAX_LENGTH = 500000
+    MIRROR_VERIFY_INTERVAL = 5
+
+    # The lines of text objects, so that moving by line, and presenting the same line
+    # in several ways, only requires a round trip the first time a line is visited. Like
+    # the mirrors, and for the same reason, only the lines of objects whose text we have
+    # a verified mirror of are indexed.
+    LINE_INDEXES = BoundedCache(max_size=100)
+    SOFT_LINE_TTL = 5
+
+    # The attribute runs of text objects, which are forgotten from the point of a change
+    # to the text onward, and entirely when the attributes change.
+    ATTRIBUTE_RUNS = BoundedCache(max_size=100)
+
+    @staticmethod
+    def _get_mirror(obj):
+        """Returns the TextMirror for obj, seeding it if appropriate, or None."""
+
+        mirror = AXText.MIRRORS.get(AXObject.get_id(obj))
+        if mirror is not None and mirror.obj is obj:
+            if not mirror.confirmed and mirror.dirty is None:
+                return mirror
+            if mirror.confirmed \
+               and time.monotonic() - mirror.verified < AXText.MIRROR_VERIFY_INTERVAL:
+                return mirror
+            if mirror.verify():
+                return mirror
+
+            tokens = ["AXText: Discarding mirror of", obj]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            AXText.MIRRORS.pop(AXObject.get_id(obj), None)
+
+        # Text which is not editable can change without text-changed events in some
+        # toolkits, e.g. when it is the name of a label, so we do not mirror it.
+        if not AXObject.supports_text(obj) or not AXUtilities.is_editable(obj):
+            return None
+
+        try:
+            count = Atspi.Text.get_character_count(obj)
+            if count > AXText.MIRROR_MAX_LENGTH:
+                return None
+            text = Atspi.Text.get_text(obj, 0, count)
+        except Exception as error:
+            msg = f"AXText: Exception seeding mirror: {error}"
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+            return None
+
+        if len(text) != count:
+            tokens = ["AXText: Not mirroring", obj, f"which reports {count} characters",
+                      f"but gave us {len(text)}."]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            return None
+
+        mirror = TextMirror(obj, text)
+        AXText.MIRRORS[AXObject.get_id(obj)] = mirror
+        tokens = ["AXText: Mirroring", count, "characters of", obj]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        return mirror
+
+    @staticmethod
+    def _has_verified_mirror(obj):
+        """Returns True if we have a mirror of the text of obj which has been checked
+        against the app, without seeding or verifying one."""
+
+        mirror = AXText.MIRRORS.get(AXObject.get_id(obj))
+        return mirror is not None and mirror.obj is obj and mirror.confirmed
+
+    @staticmethod
+    def update_cache_for_event(event):
+        """Applies the text-changed event to the mirror and line index of its source, and
+        forgets the attribute runs which the text- or attributes-changed event affects."""
+
+        if event.source is None:
+            return
+
+        if event.type.startswith("object:text-attributes-changed"):
+            AXText.ATTRIBUTE_RUNS.pop(AXObject.get_id(event.source), None)
+            return
+
+        runs = AXText.ATTRIBUTE_RUNS.get(AXObject.get_id(event.source))
+        if runs is not None and runs.obj is event.source:
+            runs.truncate(event.detail1)
+
+        text = None
+        mirror = AXText.MIRRORS.get(AXObject.get_id(event.source))
+        if mirror is not None and mirror.obj is event.source:
+            if mirror.apply(event):
+                text = mirror.text
+            else:
+                tokens = ["AXText: Discarding mirror of", event.source, "which cannot apply",
+                          event.type, event.detail1, event.detail2]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                AXText.MIRRORS.pop(AXObject.get_id(event.source), None)
+
+        index = AXText.LINE_INDEXES.get(AXObject.get_id(event.source))
+        if index is not None and index.obj is event.source:
+            index.apply(event, text)
+
     @staticmethod
     def get_character_at_offset(obj, offset=None):
         """Returns the character, start, and end for the current or specified offset."""
@@ -63,6 +381,15 @@ class AXText:
             debug.printMessage(debug.LEVEL_INFO, msg, True)
             return "", 0, 0
 
+        mirror = AXText._get_mirror(obj)
+        if mirror is not None and offset < len(mirror.text):
+            character = mirror.text[offset]
+            debug_string = character.replace("\n", "\\n")
+            tokens = [f"AXText: Character at offset {offset} in", obj,
+                      f"'{debug_string}' ({offset}-{offset + 1}) (mirrored)"]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            return character, offset, offset + 1
+
         try:
             result = Atspi.Text.get_string_at_offset(obj, offset, Atspi.TextGranularity.CHAR)
         except Exception as error:
@@ -175,13 +502,27 @@ class AXText:
     def get_line_at_offset(obj, offset=None):
         """Returns the line, start, and end for the current or specified offset."""
 
+        if offset is None:
+            offset = AXText.get_caret_offset(obj)
+
+        can_index = AXText._has_verified_mirror(obj)
+        index = AXText.LINE_INDEXES.get(AXObject.get_id(obj))
+        if index is not None and not can_index:
+            AXText.LINE_INDEXES.pop(AXObject.get_id(obj), None)
+            index = None
+        if index is not None and index.obj is obj:
+            result = index.get(offset, AXText.SOFT_LINE_TTL)
+            if result is not None:
+                debug_string = result[0].replace("\n", "\\n")
+                tokens = [f"AXText: Line at offset {offset} in", obj,
+                          f"'{debug_string}' ({result[1]}-{result[2]}) (indexed)"]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                return result
+
         length = AXText.get_character_count(obj)
         if not length:
             return "", 0, 0
 
-        if offset is None:
-            offset = AXText.get_caret_offset(obj)
-
         # Don't adjust the length in multiline text because we want to say "blank" at the end.
         if not AXUtilities.is_multi_line(obj):
             offset = min(max(0, offset), length - 1)
@@ -206,6 +547,13 @@ class AXText:
         tokens = [f"AXText: Line at offset {offset} in", obj,
                   f"'{debug_string}' ({result.start_offset}-{result.end_offset})"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
+
+        if can_index and result.start_offset <= offset < result.end_offset:
+            if index is None or index.obj is not obj:
+                index = LineIndex(obj)
+                AXText.LINE_INDEXES[AXObject.get_id(obj)] = index
+            index.add(result.start_offset, result.end_offset, result.content)
+
         return result.content, result.start_offset, result.end_offset
 
     @staticmethod
@@ -381,6 +729,13 @@ class AXText:
         if not AXObject.supports_text(obj):
             return 0
 
+        mirror = AXText._get_mirror(obj)
+        if mirror is not None:
+            count = len(mirror.text)
+            tokens = ["AXText:", obj, f"has {count} characters (mirrored)."]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            return count
+
         try:
             count = Atspi.Text.get_character_count(obj)
         except Exception as error:
@@ -447,6 +802,14 @@ class AXText:
         if not AXObject.supports_text(obj):
             return ""
 
+        mirror = AXText._get_mirror(obj)
+        if mirror is not None:
+            result = mirror.get_text(start_offset, end_offset)
+            tokens = ["AXText: Text of", obj,
+                      f"({start_offset}-{end_offset}): '{result}' (mirrored)"]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            return result
+
         try:
             result = Atspi.Text.get_text(obj, start_offset, end_offset)
         except Exception as error:
@@ -466,12 +829,16 @@ class AXText:
         if not length:
             return ""
 
-        try:
-            result = Atspi.Text.get_text(obj, 0, length)
-        except Exception as error:
-            msg = f"AXText: Exception in get_all_text: {error}"
-            debug.printMessage(debug.LEVEL_INFO, msg, True)
-            return ""
+        mirror = AXText._get_mirror(obj)
+        if mirror is not None:
+            result = mirror.text
+        else:
+            try:
+                result = Atspi.Text.get_text(obj, 0, length)
+            except Exception as error:
+                msg = f"AXText: Exception in get_all_text: {error}"
+                debug.printMessage(debug.LEVEL_INFO, msg, True)
+                return ""
 
         words = result.split()
         if len(words) > 10:
@@ -678,6 +1045,16 @@ class AXText:
         if offset is None:
             offset = AXText.get_caret_offset(obj)
 
+        runs = AXText.ATTRIBUTE_RUNS.get(AXObject.get_id(obj))
+        if runs is not None and runs.obj is obj:
+            result = runs.lookup(offset)
+            if result is not None:
+                start, end, attrs = result[:3]
+                tokens = ["AXText: Attributes for", obj, f"at offset {offset} : {attrs}",
+                          f"({start}-{end}) (indexed)"]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                return dict(attrs), start, end
+
         try:
             result = Atspi.Text.get_attribute_run(obj, offset, include_defaults=True)
         except Exception as error:
@@ -687,7 +1064,16 @@ class AXText:
 
         tokens = ["AXText: Attributes for", obj, f"at offset {offset} : {result}"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
-        return result[0] or {}, result[1] or 0, result[2] or AXText.get_character_count(obj)
+        attrs, start, end = \
+            result[0] or {}, result[1] or 0, result[2] or AXText.get_character_count(obj)
+
+        if start <= offset < end:
+            if runs is None or runs.obj is not obj:
+                runs = OffsetIndex(obj)
+                AXText.ATTRIBUTE_RUNS[AXObject.get_id(obj)] = runs
+            runs.add(start, end, dict(attrs))
+
+        return attrs, start, end
 
     @staticmethod
     def get_all_text_attributes(obj, start_offset=0, end_offset=-1):
@@ -757,6 +1143,31 @@ class AXText:
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
         return rect
 
+    @staticmethod
+    def get_character_rects(obj, start, end, range_rect=None):
+        """Returns a list of the Atspi rects of the characters in the specified range in
+        obj, estimated by dividing the rect of the range evenly. This costs at most one
+        call, for the rect of the range, which callers who already have it can pass as
+        range_rect. The estimate is exact for monospaced text, such as in terminals."""
+
+        if not AXObject.supports_text(obj) or start >= end:
+            return []
+
+        if range_rect is None:
+            range_rect = AXText.get_range_rect(obj, start, end)
+
+        rects = []
+        width = range_rect.width / (end - start)
+        for i in range(end - start):
+            rect = Atspi.Rect()
+            rect.x = range_rect.x + round(i * width)
+            rect.y = range_rect.y
+            rect.width = round((i + 1) * width) - round(i * width)
+            rect.height = range_rect.height
+            rects.append(rect)
+
+        return rects
+
     @staticmethod
     def get_range_rect(obj, start, end):
         """Returns the Atspi rect of the string at the specified range in obj."""
@@ -35,13 +35,14 @@ __copyright__ = "Copyright (c) 2023 Igalia, S.L."
 __license__   = "LGPL"
 
 import inspect
+import time
 
 import gi
 gi.require_version("Atspi", "2.0")
 from gi.repository import Atspi
 
 from . import debug
-from .ax_object import AXObject
+from .ax_object import AXObject, SearchBudget
 from .ax_utilities_collection import AXUtilitiesCollection
 from .ax_utilities_role import AXUtilitiesRole
 from .ax_utilities_state import AXUtilitiesState
@@ -52,6 +53,53 @@ class AXUtilities:
 
     COMPARE_COLLECTION_PERFORMANCE = False
 
+    # In seconds. How long to look for a single descendant without the collection
+    # interface before concluding we're not going to find it.
+    SEARCH_TIME_LIMIT = 0.5
+
+    # An app whose calls time out QUARANTINE_THRESHOLD times within QUARANTINE_WINDOW
+    # seconds is quarantined for QUARANTINE_PERIOD seconds. The period doubles each time
+    # the app is quarantined again, up to QUARANTINE_PERIOD_MAX seconds.
+    QUARANTINE_THRESHOLD = 3
+    QUARANTINE_WINDOW = 60
+    QUARANTINE_PERIOD = 10
+    QUARANTINE_PERIOD_MAX = 300
+
+    # Keyed by the bus name of the app, the time its quarantine ends and its last period.
+    QUARANTINED_APPS = {}
+
+    @staticmethod
+    def is_quarantined(app):
+        """Returns True if app has timed out too often recently to be worth waiting on
+        for anything other than the locus of focus."""
+
+        bus_name = AXObject.get_bus_name(app)
+        if bus_name is None:
+            return False
+
+        now = time.monotonic()
+        until, period = AXUtilities.QUARANTINED_APPS.get(bus_name, (0, 0))
+        if now < until:
+            return True
+
+        count = AXObject.get_timeout_count(app, AXUtilities.QUARANTINE_WINDOW)
+        if count < AXUtilities.QUARANTINE_THRESHOLD:
+            # Once an app has behaved for a full period, it starts over with a clean slate.
+            if until and now - until > period:
+                AXUtilities.QUARANTINED_APPS.pop(bus_name, None)
+            return False
+
+        if until:
+            period = min(period * 2, AXUtilities.QUARANTINE_PERIOD_MAX)
+        else:
+            period = AXUtilities.QUARANTINE_PERIOD
+        AXUtilities.QUARANTINED_APPS[bus_name] = now + period, period
+        AXObject.clear_timeouts(app)
+
+        tokens = ["AXUtilities:", app, f"timed out {count} times. Quarantined for {period}s."]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        return True
+
     @staticmethod
     def get_desktop():
         """Returns the accessible desktop"""
@@ -171,7 +219,8 @@ class AXUtilities:
             if not AXUtilities.COMPARE_COLLECTION_PERFORMANCE:
                 return result
 
-        return AXObject.find_descendant(obj, AXUtilitiesRole.is_default_button)
+        budget = SearchBudget(time_limit=AXUtilities.SEARCH_TIME_LIMIT)
+        return AXObject.find_descendant(obj, AXUtilitiesRole.is_default_button, budget)
 
     @staticmethod
     def get_focused_object(obj):
@@ -183,7 +232,8 @@ class AXUtilities:
             if not AXUtilities.COMPARE_COLLECTION_PERFORMANCE:
                 return result
 
-        return AXObject.find_descendant(obj, AXUtilitiesState.is_focused)
+        budget = SearchBudget(time_limit=AXUtilities.SEARCH_TIME_LIMIT)
+        return AXObject.find_descendant(obj, AXUtilitiesState.is_focused, budget)
 
     @staticmethod
     def get_status_bar(obj):
@@ -195,7 +245,8 @@ class AXUtilities:
             if not AXUtilities.COMPARE_COLLECTION_PERFORMANCE:
                 return result
 
-        return AXObject.find_descendant(obj, AXUtilitiesRole.is_status_bar)
+        budget = SearchBudget(time_limit=AXUtilities.SEARCH_TIME_LIMIT)
+        return AXObject.find_descendant(obj, AXUtilitiesRole.is_status_bar, budget)
 
     @staticmethod
     def is_message_dialog(obj):
@@ -444,6 +444,7 @@ class CaretNavigation:
         script.presentationInterrupt()
         script.speakContents(contents, priorObj=line[-1][0])
         script.displayContents(contents)
+        script.utilities.prefetchLineContents(contents, forward=True)
         return True
 
     def _previous_line(self, script, event):
@@ -470,6 +471,7 @@ class CaretNavigation:
         script.presentationInterrupt()
         script.speakContents(contents)
         script.displayContents(contents)
+        script.utilities.prefetchLineContents(contents, forward=False)
         return True
 
     def _start_of_line(self, script, event):
@@ -28,6 +28,7 @@ import gi
 gi.require_version('Atspi', '2.0')
 from gi.repository import Atspi
 from gi.repository import GLib
+import collections
 import queue
 import threading
 import time
@@ -39,20 +40,88 @@ from . import orca_state
 from . import script_manager
 from . import settings
 from .ax_object import AXObject
+from .ax_text import AXText
 from .ax_utilities import AXUtilities
 
 
 class EventManager:
 
+    # Events of these types are obsoleted by a more recent event of the same type from the
+    # same object.
+    OBSOLETED_BY_SAME_TYPE_AND_OBJECT = (
+        "document:page-changed",
+        "object:active-descendant-changed",
+        "object:children-changed",
+        "object:property-change",
+        "object:state-changed",
+        "object:selection-changed",
+        "object:text-caret-moved",
+        "object:text-selection-changed",
+        "window",
+    )
+
+    # Events of these types are obsoleted by a more recent event of the same type and details
+    # from a sibling of the object.
+    OBSOLETED_BY_SAME_TYPE_IN_SIBLING = (
+        "focus",
+        "object:state-changed:focused",
+    )
+
+    # Events of these types are obsoleted by a more recent event of any of these types from
+    # the same object.
+    OBSOLETED_BY_WINDOW_EVENT = (
+        "window:activate",
+        "window:deactivate",
+    )
+
+    # Events of these types tell us that properties we have cached might have changed.
+    # We need all of them, regardless of what the scripts are listening for.
+    CACHE_EVENT_TYPES = (
+        "object:attributes-changed",
+        "object:children-changed",
+        "object:property-change",
+        "object:state-changed",
+        "object:text-changed",
+        "object:visible-data-changed",
+    )
+
+    # Throttling levels for applications which are flooding us with events.
+    THROTTLE_NONE = 0
+    THROTTLE_FLOOD = 1
+    THROTTLE_DELUGE = 2
+
+    # Events of these types are always processed in the focus lane.
+    FOCUS_LANE_EVENT_TYPES = (
+        "focus:",
+        "mouse:",
+        "object:state-changed:focused",
+        "window:",
+    )
+
     def __init__(self):
         debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER: Initializing', True)
         self._scriptListenerCounts = {}
         self._active = False
         self._paused = False
+        self._focusEventQueue = queue.Queue(0)
         self._eventQueue     = queue.Queue(0)
+        self._pendingEvents  = {}
+        self._pendingKeys    = {}
+        self._eventSerial    = 0
+        self._eventRates     = {}
+        self._eventRatesPruneTime = 0
+        self._throttledApps  = {}
+        self._activeWindow   = None
+        self._activeBusName  = None
+        self._keysDown       = set()
+        self._focus          = None
+        self._focusAncestors = ()
+        self._focusAncestry  = frozenset()
         self._gidleId        = 0
         self._gidleLock      = threading.Lock()
         self._listener = Atspi.EventListener.new(self._enqueue_object_event)
+        self._cacheListener = Atspi.EventListener.new(AXObject.update_cache_for_event)
+        self._textCacheListener = Atspi.EventListener.new(AXText.update_cache_for_event)
         orca_state.device = None
         debug.printMessage(debug.LEVEL_INFO, 'Event manager initialized', True)
 
@@ -65,6 +134,11 @@ class EventManager:
         orca_state.device.key_watcher = \
             orca_state.device.add_key_watcher(self._processKeyboardEvent)
 
+        for eventType in self.CACHE_EVENT_TYPES:
+            self._cacheListener.register(eventType)
+        self._textCacheListener.register("object:text-changed")
+        self._textCacheListener.register("object:text-attributes-changed")
+
         self._active = True
         debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER: Activated', True)
 
@@ -73,7 +147,14 @@ class EventManager:
 
         debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER: Deactivating', True)
         self._active = False
-        self._eventQueue = queue.Queue(0)
+        for eventType in self.CACHE_EVENT_TYPES:
+            self._cacheListener.deregister(eventType)
+        self._textCacheListener.deregister("object:text-changed")
+        self._textCacheListener.deregister("object:text-attributes-changed")
+        self._clearQueue()
+        self._eventRates = {}
+        self._throttledApps = {}
+        self._keysDown = set()
         self._scriptListenerCounts = {}
         orca_state.device = None
         debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER: Deactivated', True)
@@ -85,99 +166,166 @@ class EventManager:
         debug.printMessage(debug.LEVEL_INFO, msg, True)
         self._paused = pause
         if clearQueue:
-            self._eventQueue = queue.Queue(0)
-
-    def _isObsoletedBy(self, event):
-        """Returns the event which renders this one no longer worthy of being processed."""
-
-        def isSame(x):
-            return x.type == event.type \
-                and x.source == event.source \
-                and x.detail1 == event.detail1 \
-                and x.detail2 == event.detail2 \
-                and x.any_data == event.any_data
-
-        def obsoletesIfSameTypeAndObject(x):
-            skippable = {
-                "document:page-changed",
-                "object:active-descendant-changed",
-                "object:children-changed",
-                "object:property-change",
-                "object:state-changed",
-                "object:selection-changed",
-                "object:text-caret-moved",
-                "object:text-selection-changed",
-                "window",
-            }
-            if not any(x.type.startswith(etype) for etype in skippable):
-                return False
-            return x.source == event.source and x.type == event.type
+            self._clearQueue()
 
-        def obsoletesIfSameTypeInSibling(x):
-            if x.type != event.type or x.detail1 != event.detail1 or x.detail2 != event.detail2 \
-               or x.any_data != event.any_data:
-                return False
+    def _getObsolescenceKeys(self, event):
+        """Returns the keys under which event is indexed while it is pending. A pending
+        event obsoletes any older event which has one of the same keys."""
 
-            skippable = {
-                "focus",
-                "object:state-changed:focused",
-            }
-            if not any(x.type.startswith(etype) for etype in skippable):
-                return False
-            return AXObject.get_parent(x.source) == AXObject.get_parent(event.source)
-
-        def obsoletesWindowEvent(x):
-            skippable = {
-                "window:activate",
-                "window:deactivate",
-            }
-            if not any(x.type.startswith(etype) for etype in skippable):
-                return False
-            if not any(event.type.startswith(etype) for etype in skippable):
-                return False
-            if x.source == event.source:
-                return True
-            return False
+        etype = event.type
+        keys = []
+        try:
+            key = ("duplicate", etype, event.source, event.detail1, event.detail2, event.any_data)
+            hash(key)
+        except TypeError:
+            pass
+        else:
+            keys.append(key)
+
+        if etype.startswith(self.OBSOLETED_BY_SAME_TYPE_AND_OBJECT):
+            keys.append(("object", etype, event.source))
+
+        if etype.startswith(self.OBSOLETED_BY_SAME_TYPE_IN_SIBLING):
+            try:
+                key = ("sibling", etype, event.detail1, event.detail2, event.any_data,
+                       AXObject.get_parent(event.source))
+                hash(key)
+            except TypeError:
+                pass
+            else:
+                keys.append(key)
+
+        if etype.startswith(self.OBSOLETED_BY_WINDOW_EVENT):
+            keys.append(("window", event.source))
+
+        return keys
+
+    def _getFocusAncestry(self):
+        """Returns the ids of the locus of focus and its ancestors, which are only
+        rebuilt when the locus of focus or its cached ancestry changes."""
+
+        focus = focus_manager.getManager().get_locus_of_focus()
+        if focus is None:
+            return frozenset()
+
+        ancestors = AXObject.get_ancestors(focus)
+        if focus is not self._focus or ancestors is not self._focusAncestors:
+            self._focus = focus
+            self._focusAncestors = ancestors
+            self._focusAncestry = frozenset(AXObject.get_id(x) for x in (focus, *ancestors))
+        return self._focusAncestry
+
+    def _isFocusLaneEvent(self, event):
+        """Returns True if event is tied to the locus of focus or the active window and
+        should therefore be processed ahead of events from elsewhere. Other events from
+        the app with the active window are not, because a busy app, such as a web page
+        which is updating itself, would otherwise fill the focus lane."""
+
+        if event.type.startswith(self.FOCUS_LANE_EVENT_TYPES):
+            return True
+
+        focus = focus_manager.getManager().get_locus_of_focus()
+        if focus is not None and event.any_data is focus:
+            return True
+
+        if event.source == focus_manager.getManager().get_active_window():
+            return True
+
+        return AXObject.get_id(event.source) in self._getFocusAncestry()
+
+    def _putEvent(self, event, app=None, isFocusLaneEvent=False, keys=None, serial=None):
+        """Adds event to the appropriate lane and indexes it by its obsolescence keys."""
+
+        if keys is None:
+            keys = self._getObsolescenceKeys(event)
+        if serial is None:
+            self._eventSerial += 1
+            serial = self._eventSerial
+
+        if isFocusLaneEvent:
+            self._focusEventQueue.put(event)
+        else:
+            self._eventQueue.put(event)
+
+        self._pendingKeys[id(event)] = serial, keys, isFocusLaneEvent, app
+        for key in keys:
+            self._pendingEvents.setdefault(key, collections.deque()).append((serial, event))
+
+    def _getEvent(self):
+        """Removes the next event from the queue and from the index, draining the focus
+        lane first. Returns an (event, serial, keys) tuple, where keys are the obsolescence
+        keys the event was indexed under. Raises queue.Empty if there are no events."""
 
-        self._eventQueue.mutex.acquire()
         try:
-            events = list(reversed(self._eventQueue.queue))
-        except Exception as error:
-            msg = f"EVENT MANAGER: Exception in _isObsoletedBy: {error}"
-            debug.printMessage(debug.LEVEL_INFO, msg, True)
-            events = []
-        finally:
-            self._eventQueue.mutex.release()
-
-        for e in events:
-            if e == event:
-                return None
-            if isSame(e):
-                tokens = ["EVENT MANAGER:", event, "obsoleted by", e,
-                          "more recent duplicate"]
-                debug.printTokens(debug.LEVEL_INFO, tokens, True)
-                return e
-            if obsoletesIfSameTypeAndObject(e):
-                tokens = ["EVENT MANAGER:", event, "obsoleted by", e,
-                          "more recent event of same type for same object"]
-                debug.printTokens(debug.LEVEL_INFO, tokens, True)
-                return e
-            if obsoletesIfSameTypeInSibling(e):
-                tokens = ["EVENT MANAGER:", event, "obsoleted by", e,
-                          "more recent event of same type from sibling"]
-                debug.printTokens(debug.LEVEL_INFO, tokens, True)
-                return e
-            if obsoletesWindowEvent(e):
-                tokens = ["EVENT MANAGER:", event, "obsoleted by", e,
-                          "more recent window (de)activation event"]
-                debug.printTokens(debug.LEVEL_INFO, tokens, True)
-                return e
+            event = self._focusEventQueue.get_nowait()
+        except queue.Empty:
+            event = self._eventQueue.get_nowait()
+
+        serial, keys = self._pendingKeys.pop(id(event))[:2]
+        for key in keys:
+            events = self._pendingEvents.get(key)
+            if not events:
+                continue
+            if events[0][1] is event:
+                events.popleft()
+            else:
+                events.remove((serial, event))
+            if not events:
+                del self._pendingEvents[key]
+
+        return event, serial, keys
+
+    def _getQueueSize(self):
+        """Returns the number of pending events in all lanes."""
+
+        return self._focusEventQueue.qsize() + self._eventQueue.qsize()
+
+    def _queueIsEmpty(self):
+        """Returns True if there are no pending events in any lane."""
+
+        return self._focusEventQueue.empty() and self._eventQueue.empty()
+
+    def _clearQueue(self):
+        """Discards all pending events."""
+
+        self._focusEventQueue = queue.Queue(0)
+        self._eventQueue = queue.Queue(0)
+        self._pendingEvents = {}
+        self._pendingKeys = {}
+
+    def _isObsoletedBy(self, event, serial, keys):
+        """Returns the event which renders this one no longer worthy of being processed.
+        The keys are those event was indexed under when it was queued; computing them again
+        could give different ones, e.g. if the source has a new parent."""
+
+        reasons = {
+            "duplicate": "more recent duplicate",
+            "object": "more recent event of same type for same object",
+            "sibling": "more recent event of same type from sibling",
+            "window": "more recent window (de)activation event",
+        }
+
+        # Events are indexed in the order they were queued, so the last event for each key
+        # is the most recent one. Because the focus lane is drained first, it may be older
+        # than the event being processed.
+        newest, reason = None, None
+        for key in keys:
+            events = self._pendingEvents.get(key)
+            if not events or events[-1][0] < serial:
+                continue
+            if newest is None or events[-1][0] > newest[0]:
+                newest, reason = events[-1], reasons[key[0]]
+
+        if newest is not None:
+            tokens = ["EVENT MANAGER:", event, "obsoleted by", newest[1], reason]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            return newest[1]
 
         tokens = ["EVENT MANAGER:", event, "is not obsoleted"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
         return None
 
-    def _ignore(self, event):
+    def _ignore(self, event, app=None):
         """Returns True if this event should be ignored."""
 
         debug.printMessage(debug.LEVEL_INFO, '')
@@ -193,8 +341,16 @@ class EventManager:
         if event_type.startswith('window') or event_type.startswith('mouse:button'):
             return False
 
-        if self._inDeluge() and self._ignoreDuringDeluge(event):
-            msg = 'EVENT MANAGER: Ignoring event type due to deluge'
+        if self._getThrottleLevel(AXObject.get_bus_name(event.source)) == self.THROTTLE_DELUGE \
+           and self._ignoreDuringDeluge(event):
+            msg = 'EVENT MANAGER: Ignoring event type due to deluge from app'
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+            return True
+
+        if app is None:
+            app = AXObject.get_application(event.source)
+        if AXUtilities.is_quarantined(app) and not self._isFocusLaneEvent(event):
+            msg = 'EVENT MANAGER: Ignoring event unrelated to focus from quarantined app'
             debug.printMessage(debug.LEVEL_INFO, msg, True)
             return True
 
@@ -379,25 +535,36 @@ class EventManager:
     def _enqueue_object_event(self, e):
         """Callback for Atspi object events."""
 
-        if self._ignore(e):
+        # While inactive or paused we ignore everything, so don't bother with the app.
+        if not self._active or self._paused:
+            self._ignore(e)
+            return
+
+        self._updateEventRate(AXObject.get_bus_name(e.source), e.type)
+        app = AXObject.get_application(e.source)
+        if self._ignore(e, app):
             return
 
         self._queuePrintln(e)
 
-        if self._inFlood() and self._prioritizeDuringFlood(e):
+        if self._prioritizeDuringFlood(e) and self._getThrottledApps():
             msg = 'EVENT MANAGER: Pruning event queue due to flood.'
             debug.printMessage(debug.LEVEL_INFO, msg, True)
             self._pruneEventsDuringFlood()
 
-        app = AXObject.get_application(e.source)
         tokens = ["EVENT MANAGER: App for event source is", app]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
         script = script_manager.getManager().getScript(app, e.source)
         script.eventCache[e.type] = (e, time.time())
 
+        isFocusLaneEvent = self._isFocusLaneEvent(e)
+        if isFocusLaneEvent:
+            msg = "EVENT MANAGER: Queueing event in focus lane"
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+
         self._gidleLock.acquire()
-        self._eventQueue.put(e)
+        self._putEvent(e, app, isFocusLaneEvent)
         if not self._gidleId:
             self._gidleId = GLib.idle_add(self._dequeue_object_event)
         self._gidleLock.release()
@@ -413,39 +580,71 @@ class EventManager:
 
         return False
 
+    def _getActiveBusName(self):
+        """Returns the bus name of the app with the active window, which is only looked
+        up when the active window changes."""
+
+        window = focus_manager.getManager().get_active_window()
+        if window is not self._activeWindow:
+            self._activeWindow = window
+            self._activeBusName = AXObject.get_bus_name(window)
+        return self._activeBusName
+
+    def _inputIsPending(self):
+        """Returns True if keyboard input is on its way and should not have to wait for us
+        to finish processing queued events. GLib cannot tell us whether a pending source
+        is the keyboard rather than AT-SPI, so we rely on the key watcher: while a key is
+        held down, its release (and any repeat) is about to arrive."""
+
+        return bool(self._keysDown)
+
     def _dequeue_object_event(self):
-        """Handles all object events destined for scripts."""
+        """Handles object events destined for scripts until the queue is empty, the time
+        budget for this callback is spent, or keyboard input is on its way."""
 
+        budget = settings.eventQueueTimeBudget / 1000
+        batchStartTime = time.time()
+        processed = 0
         rerun = True
         try:
-            event = self._eventQueue.get_nowait()
-            self._queuePrintln(event, isEnqueue=False)
-            debug.objEvent = event
-            debugging = not debug.eventDebugFilter \
-                        or debug.eventDebugFilter.match(event.type)
-            if debugging:
-                startTime = time.time()
-                msg = (
-                    f"\nvvvvv PROCESS OBJECT EVENT {event.type} "
-                    f"(queue size: {self._eventQueue.qsize()}) vvvvv"
-                )
-                debug.printMessage(debug.eventDebugLevel, msg, False)
-            self._processObjectEvent(event)
-            if debugging:
-                msg = (
-                    f"TOTAL PROCESSING TIME: {time.time() - startTime:.4f}"
-                    f"\n^^^^^ PROCESS OBJECT EVENT {event.type} ^^^^^\n"
-                )
-                debug.printMessage(debug.eventDebugLevel, msg, False)
-
-            debug.objEvent = None
-
-            self._gidleLock.acquire()
-            if self._eventQueue.empty():
-                GLib.timeout_add(2500, self._onNoFocus)
-                self._gidleId = 0
-                rerun = False # destroy and don't call again
-            self._gidleLock.release()
+            while True:
+                event, serial, keys = self._getEvent()
+                self._queuePrintln(event, isEnqueue=False)
+                debug.objEvent = event
+                debugging = not debug.eventDebugFilter \
+                            or debug.eventDebugFilter.match(event.type)
+                if debugging:
+                    startTime = time.time()
+                    msg = (
+                        f"\nvvvvv PROCESS OBJECT EVENT {event.type} "
+                        f"(queue size: {self._getQueueSize()}) vvvvv"
+                    )
+                    debug.printMessage(debug.eventDebugLevel, msg, False)
+                AXObject.set_focused_app(self._getActiveBusName())
+                self._processObjectEvent(event, serial, keys)
+                if debugging:
+                    msg = (
+                        f"TOTAL PROCESSING TIME: {time.time() - startTime:.4f}"
+                        f"\n^^^^^ PROCESS OBJECT EVENT {event.type} ^^^^^\n"
+                    )
+                    debug.printMessage(debug.eventDebugLevel, msg, False)
+
+                debug.objEvent = None
+                processed += 1
+
+                self._gidleLock.acquire()
+                if self._queueIsEmpty():
+                    GLib.timeout_add(2500, self._onNoFocus)
+                    self._gidleId = 0
+                    rerun = False # destroy and don't call again
+                self._gidleLock.release()
+                if not rerun:
+                    break
+
+                if time.time() - batchStartTime >= budget:
+                    break
+                if self._inputIsPending():
+                    break
         except queue.Empty:
             msg = 'EVENT MANAGER: Attempted dequeue, but the event queue is empty'
             debug.printMessage(debug.LEVEL_SEVERE, msg, True)
@@ -454,6 +653,15 @@ class EventManager:
         except Exception:
             debug.printException(debug.LEVEL_SEVERE)
 
+        if processed > 1:
+            elapsed = time.time() - batchStartTime
+            msg = (
+                f"EVENT MANAGER: Processed {processed} events in {elapsed:.4f}s "
+                f"({processed / max(elapsed, 0.0001):.0f} events/s). "
+                f"Queue size: {self._getQueueSize()}"
+            )
+            debug.printMessage(debug.LEVEL_INFO, msg, True)
+
         return rerun
 
     def registerListener(self, eventType):
@@ -653,15 +861,6 @@ class EventManager:
 
         return event.source != focus_manager.getManager().get_locus_of_focus()
 
-    def _inDeluge(self):
-        size = self._eventQueue.qsize()
-        if size > 100:
-            msg = f"EVENT MANAGER: DELUGE! Queue size is {size}"
-            debug.printMessage(debug.LEVEL_INFO, msg, True)
-            return True
-
-        return False
-
     def _processDuringFlood(self, event, focus=None):
         """Returns true if this event should be processed during a flood."""
 
@@ -720,40 +919,121 @@ class EventManager:
         return False
 
     def _pruneEventsDuringFlood(self):
-        """Gets rid of events we don't care about during a flood."""
+        """Gets rid of events we don't care about from the apps which are flooding us."""
 
-        oldSize = self._eventQueue.qsize()
+        throttledApps = self._getThrottledApps()
+        oldSize = self._getQueueSize()
+        pendingKeys = self._pendingKeys
 
-        newQueue = queue.Queue(0)
+        events = []
+        for eventQueue in self._focusEventQueue, self._eventQueue:
+            with eventQueue.mutex:
+                events.extend(eventQueue.queue)
+
+        # Re-add the surviving events in their original order so that the index remains
+        # sorted by serial.
+        events.sort(key=lambda x: pendingKeys[id(x)][0])
+
+        self._clearQueue()
         focus = focus_manager.getManager().get_locus_of_focus()
-        while not self._eventQueue.empty():
-            try:
-                event = self._eventQueue.get()
-            except Exception as error:
-                msg = f"EVENT MANAGER: Exception pruning events: {error}"
-                debug.printMessage(debug.LEVEL_INFO, msg, True)
-            else:
-                if self._processDuringFlood(event, focus):
-                    newQueue.put(event)
-                    self._queuePrintln(event, isPrune=False)
-            finally:
-                if not self._eventQueue.empty():
-                    self._eventQueue.task_done()
+        for event in events:
+            serial, keys, isFocusLaneEvent, app = pendingKeys[id(event)]
+            if AXObject.get_bus_name(app) not in throttledApps \
+               or self._processDuringFlood(event, focus):
+                self._putEvent(event, app, isFocusLaneEvent, keys, serial)
+                self._queuePrintln(event, isPrune=False)
 
-        self._eventQueue = newQueue
-        newSize = self._eventQueue.qsize()
+        newSize = self._getQueueSize()
 
-        msg = f"EVENT MANAGER: {oldSize - newSize} events pruned. New size: {newSize}"
-        debug.printMessage(debug.LEVEL_INFO, msg, True)
+        tokens = [f"EVENT MANAGER: {oldSize - newSize} events pruned from", throttledApps,
+                  f"New size: {newSize}"]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
-    def _inFlood(self):
-        size = self._eventQueue.qsize()
-        if size > 50:
-            msg = f"EVENT MANAGER: FLOOD? Queue size is {size}"
-            debug.printMessage(debug.LEVEL_INFO, msg, True)
-            return True
+    def _updateEventRate(self, busName, eventType):
+        """Records an event of eventType from the app with busName in the sliding window
+        of recent events."""
 
-        return False
+        rates = self._eventRates.setdefault(busName, {})
+        timestamps = rates.setdefault(eventType, collections.deque())
+        timestamps.append(time.time())
+        self._updateThrottleLevel(busName)
+
+    def _pruneEventRates(self, cutoff):
+        """Forgets the rates of the apps, e.g. ones which have exited, which have sent no
+        events since cutoff. This is done at most once per sliding window."""
+
+        if self._eventRatesPruneTime >= cutoff:
+            return
+
+        self._eventRatesPruneTime = time.time()
+        for busName, rates in list(self._eventRates.items()):
+            if not any(timestamps and timestamps[-1] >= cutoff for timestamps in rates.values()):
+                self._eventRates.pop(busName, None)
+
+    def _updateThrottleLevel(self, busName):
+        """Updates and returns the throttling level of the app with busName based on the
+        rate of each type of event it has sent within the sliding window."""
+
+        cutoff = time.time() - settings.eventFloodWindow
+        self._pruneEventRates(cutoff)
+        rates = self._eventRates.get(busName, {})
+        busiestType, count = None, 0
+        for eventType, timestamps in list(rates.items()):
+            while timestamps and timestamps[0] < cutoff:
+                timestamps.popleft()
+            if not timestamps:
+                del rates[eventType]
+            elif len(timestamps) > count:
+                busiestType, count = eventType, len(timestamps)
+
+        if not rates:
+            self._eventRates.pop(busName, None)
+
+        # Once throttled, an app remains throttled until its rate drops to half the threshold
+        # so that we don't toggle in and out of throttling with each event.
+        oldLevel = self._throttledApps.get(busName, self.THROTTLE_NONE)
+        floodThreshold = settings.eventFloodThreshold
+        delugeThreshold = settings.eventDelugeThreshold
+        level = self.THROTTLE_NONE
+        if count > floodThreshold \
+           or (oldLevel >= self.THROTTLE_FLOOD and count > floodThreshold // 2):
+            level = self.THROTTLE_FLOOD
+        if count > delugeThreshold \
+           or (oldLevel == self.THROTTLE_DELUGE and count > delugeThreshold // 2):
+            level = self.THROTTLE_DELUGE
+
+        if level == oldLevel:
+            return level
+
+        if level == self.THROTTLE_NONE:
+            del self._throttledApps[busName]
+        else:
+            self._throttledApps[busName] = level
+
+        tokens = ["EVENT MANAGER: Throttling level of", busName,
+                  f"changed from {oldLevel} to {level}.",
+                  f"Busiest event type: {busiestType} ({count} in {settings.eventFloodWindow}s).",
+                  f"Thresholds: flood {floodThreshold}, deluge {delugeThreshold}.",
+                  "Throttled apps:", self._throttledApps]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        return level
+
+    def _getThrottleLevel(self, busName):
+        """Returns the current throttling level of the app with busName."""
+
+        if busName not in self._throttledApps:
+            return self.THROTTLE_NONE
+
+        return self._updateThrottleLevel(busName)
+
+    def _getThrottledApps(self):
+        """Returns a dictionary of the bus names of the currently-throttled apps and their
+        levels."""
+
+        for busName in list(self._throttledApps):
+            self._updateThrottleLevel(busName)
+
+        return self._throttledApps
 
     def _shouldProcessEvent(self, event, eventScript, activeScript):
         if eventScript == activeScript:
@@ -776,14 +1056,16 @@ class EventManager:
         debug.printMessage(debug.LEVEL_INFO, msg, True)
         return False
 
-    def _processObjectEvent(self, event):
+    def _processObjectEvent(self, event, serial, keys):
         """Handles all object events destined for scripts.
 
         Arguments:
-        - e: an at-spi event.
+        - event: an at-spi event.
+        - serial: the order in which event was queued.
+        - keys: the obsolescence keys event was indexed under.
         """
 
-        if self._isObsoletedBy(event):
+        if self._isObsoletedBy(event, serial, keys):
             return
 
         eType = event.type
@@ -814,9 +1096,11 @@ class EventManager:
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             return
 
-        if self._inFlood():
-            if not self._processDuringFlood(event):
-                msg = 'EVENT MANAGER: Not processing this event due to flood.'
+        throttledApps = self._getThrottledApps()
+        if throttledApps:
+            if AXObject.get_bus_name(event.source) in throttledApps \
+               and not self._processDuringFlood(event):
+                msg = 'EVENT MANAGER: Not processing this event due to flood from app.'
                 debug.printMessage(debug.LEVEL_INFO, msg, True)
                 return
             if self._prioritizeDuringFlood(event):
@@ -870,6 +1154,11 @@ class EventManager:
                 debug.printMessage(debug.LEVEL_INFO, msg, True)
 
     def _processKeyboardEvent(self, device, pressed, keycode, keysym, state, text):
+        if pressed:
+            self._keysDown.add(keycode)
+        else:
+            self._keysDown.discard(keycode)
+
         keyboardEvent = input_event.KeyboardEvent(pressed, keycode, keysym, state, text)
         keyboardEvent.process()
 
@@ -27,6 +27,9 @@ __copyright__ = "Copyright (c) 2005-2008 Sun Microsystems Inc." \
                 "Copyright (c) 2016 Igalia, S.L."
 __license__   = "LGPL"
 
+import bisect
+import itertools
+
 import gi
 gi.require_version("Atspi", "2.0")
 from gi.repository import Atspi
@@ -39,7 +42,8 @@ from . import script_manager
 from . import settings
 from .ax_component import AXComponent
 from .ax_event_synthesizer import AXEventSynthesizer
-from .ax_object import AXObject
+from .ax_object import AXObject, GenerationalCache
+from .ax_snapshot import AXSnapshot
 from .ax_text import AXText
 from .ax_utilities import AXUtilities
 
@@ -94,7 +98,7 @@ class Word:
         self.y = y
         self.width = width
         self.height = height
-        self.chars = []
+        self._chars = None
 
     def __str__(self):
         return "WORD: '%s' (%i-%i) %s" % \
@@ -107,13 +111,22 @@ class Word:
         if attr != "chars":
             return super().__getattribute__(attr)
 
+        # The extents are divided from those of the word, which we already have, the first
+        # time they are needed, and then kept for the life of the context.
+        chars = super().__getattribute__("_chars")
+        if chars is not None:
+            return chars
+
         chars = []
-        for i, char in enumerate(self.string):
-            start = i + self.startOffset
-            rect1 = AXText.get_character_rect(self.zone.accessible, start)
-            extents = rect1.x, rect1.y, rect1.width, rect1.height
-            chars.append(Char(self, i, start, char, *extents))
+        rect = Atspi.Rect()
+        rect.x, rect.y, rect.width, rect.height = self.x, self.y, self.width, self.height
+        rects = AXText.get_character_rects(
+            self.zone.accessible, self.startOffset, self.startOffset + len(self.string), rect)
+        for i, (char, rect) in enumerate(zip(self.string, rects)):
+            extents = rect.x, rect.y, rect.width, rect.height
+            chars.append(Char(self, i, i + self.startOffset, char, *extents))
 
+        self._chars = chars
         return chars
 
     def getRelativeOffset(self, offset):
@@ -274,6 +287,9 @@ class TextZone(Zone):
             return super().__getattribute__(attr)
 
         string = AXText.get_substring(self.accessible, self.startOffset, self.endOffset)
+        if string == self._string and self._words:
+            return super().__getattribute__(attr)
+
         words = []
         for i, word in enumerate(re.finditer(self.WORDS_RE, string)):
             start, end = map(lambda x: x + self.startOffset, word.span())
@@ -372,6 +388,7 @@ class Line:
         self.index = index
         self.zones = zones
         self.brailleRegions = None
+        self._zoneEnds = None
 
     def __getattribute__(self, attr):
         if attr == "string":
@@ -391,6 +408,17 @@ class Line:
 
         return super().__getattribute__(attr)
 
+    def getZoneIndexAtX(self, x):
+        """Returns the index of the first zone which ends at or to the right of x, or of
+        the last zone if there is none. The zones are sorted by x, so this is a binary
+        search of the running maximum of their right edges."""
+
+        if self._zoneEnds is None:
+            ends = (zone.x + zone.width for zone in self.zones)
+            self._zoneEnds = list(itertools.accumulate(ends, max))
+
+        return min(bisect.bisect_left(self._zoneEnds, x), len(self.zones) - 1)
+
     def getBrailleRegions(self):
         # [[[WDW - We'll always compute the braille regions.  This
         # allows us to handle StateZone and ValueZone zones whose
@@ -468,12 +496,28 @@ class Context:
     WRAP_TOP_BOTTOM = 1 << 1
     WRAP_ALL        = (WRAP_LINE | WRAP_TOP_BOTTOM)
 
+    # The zones of each on-screen object from previous contexts, along with the bounding
+    # box they were built for. Entries are stamped with the generation of the object, so
+    # any event which changes it, its text, or its children causes its zones to be rebuilt.
+    ZONES = GenerationalCache(max_size=5000, ttl=600)
+
+    # The zones of each container from previous contexts, along with the bounding box they
+    # were built for and the generation of the app. Any event from the app changes the
+    # latter, so until then we need not even look for the container's on-screen objects.
+    CONTAINER_ZONES = GenerationalCache(max_size=50, ttl=600)
+
+    # The containers for which we took a snapshot, stamped with their generation. Until
+    # something beneath a container changes, its zones are reused, so there is no need
+    # for another snapshot of its app.
+    SNAPSHOTS = GenerationalCache(max_size=100, ttl=600)
+
     def __init__(self, script, root=None):
         """Create a new Context for script."""
 
         self.script = script
         self.zones = []
         self.lines = []
+        self._zonesByObject = None
         self.lineIndex = 0
         self.zoneIndex = 0
         self.wordIndex = 0
@@ -508,20 +552,22 @@ class Context:
 
         self.container = container or self.topLevel
 
-        self.zones, self.focusZone = self.getShowingZones(self.container)
+        containerId = AXObject.get_id(self.container)
+        zones = self._getReusableContainerZones(self.container, self.bounds)
+        if zones is not None:
+            self.zones, self.focusZone = zones, self._findFocusZone(zones)
+        else:
+            if containerId in self.SNAPSHOTS:
+                tokens = ["FLAT REVIEW: Not taking snapshot. Nothing changed in", self.container]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+            elif AXSnapshot.prefetch(self.container):
+                self.SNAPSHOTS[containerId] = True
+            self.zones, self.focusZone = self.getShowingZones(self.container)
         self.lines = self.clusterZonesByLine(self.zones)
         if not (self.lines and self.focusZone):
             return
 
-        for i, line in enumerate(self.lines):
-            if self.focusZone in line.zones:
-                self.lineIndex = i
-                self.zoneIndex = line.zones.index(self.focusZone)
-                word, offset = self.focusZone.wordWithCaret()
-                if word:
-                    self.wordIndex = word.index
-                    self.charIndex = offset
-                break
+        self._setCurrentToZone(self.focusZone)
 
         msg = (
             f"FLAT REVIEW: On line {self.lineIndex}, zone {self.zoneIndex} "
@@ -698,48 +744,74 @@ class Context:
         if zone is None:
             return False
 
-        for i, line in enumerate(self.lines):
-            if zone in line.zones:
-                self.lineIndex = i
-                self.zoneIndex = line.zones.index(zone)
-                word, offset = zone.wordWithCaret()
-                if word:
-                    self.wordIndex = word.index
-                    self.charIndex = offset
-                msg = "FLAT REVIEW: Updated current zone."
-                debug.printMessage(debug.LEVEL_INFO, msg, True)
-                break
-        else:
+        if not self._setCurrentToZone(zone):
             msg = "FLAT REVIEW: Failed to update current zone."
             debug.printMessage(debug.LEVEL_INFO, msg, True)
             return False
 
+        msg = "FLAT REVIEW: Updated current zone."
+        debug.printMessage(debug.LEVEL_INFO, msg, True)
+
         tokens = ["FLAT REVIEW: Updated", self.getCurrentAccessible(),
                   f"line: {self.lineIndex}, zone: {self.zoneIndex},",
                   f"word: {self.wordIndex}, char: {self.charIndex})"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
         return True
 
+    def _setCurrentToZone(self, zone):
+        """Sets the current zone to zone, and the current word and char to the caret
+        if zone contains it. Returns False if zone is not in this context."""
+
+        # The line and index of each zone are assigned when the zones are clustered.
+        line = getattr(zone, "line", None)
+        if line is None or not 0 <= line.index < len(self.lines) \
+           or self.lines[line.index] is not line:
+            return False
+
+        self.lineIndex = line.index
+        self.zoneIndex = zone.index
+        word, offset = zone.wordWithCaret()
+        if word:
+            self.wordIndex = word.index
+            self.charIndex = offset
+        return True
+
+    def _getZonesByObject(self):
+        """Returns a dictionary of the id of each zone accessible, and of each of its
+        ancestors, to the first zone in that subtree."""
+
+        if self._zonesByObject is not None:
+            return self._zonesByObject
+
+        self._zonesByObject = {}
+        for zone in self.zones:
+            for obj in [zone.accessible, *AXObject.get_ancestors(zone.accessible)]:
+                self._zonesByObject.setdefault(AXObject.get_id(obj), zone)
+
+        tokens = ["FLAT REVIEW: Indexed", len(self._zonesByObject), "objects for",
+                  len(self.zones), "zones"]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        return self._zonesByObject
+
     def _findZoneWithObject(self, obj):
         """Returns the existing zone which contains obj."""
 
         if obj is None:
             return None
 
-        for zone in self.zones:
-            if zone.accessible == obj:
-                return zone
-
-            # Some items get pruned from the flat review tree. For instance, a
-            # tree item which has a descendant section whose text is the displayed
-            # text of the tree item, that section will be in the flat review tree
-            # but the ancestor item might not.
-            if AXObject.is_ancestor(zone.accessible, obj):
-                tokens = ["FLAT REVIEW:", zone.accessible, "is ancestor of zone accessible", obj]
-                debug.printTokens(debug.LEVEL_INFO, tokens, True)
-                return zone
+        zone = self._getZonesByObject().get(AXObject.get_id(obj))
+        if zone is None:
+            return None
+
+        # Some items get pruned from the flat review tree. For instance, a
+        # tree item which has a descendant section whose text is the displayed
+        # text of the tree item, that section will be in the flat review tree
+        # but the ancestor item might not.
+        if zone.accessible != obj:
+            tokens = ["FLAT REVIEW:", obj, "is ancestor of zone accessible", zone.accessible]
+            debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
-        return None
+        return zone
 
     def getShowingZones(self, root, boundingbox=None):
         """Returns an unsorted list of all the zones under root and the focusZone."""
@@ -752,12 +824,24 @@ class Context:
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
         allZones, focusZone = [], None
+        reused = 0
+        reusable = True
+        key = self._getZonesKey(boundingbox)
         for o in objs:
-            zones = self.getZonesFromAccessible(o, boundingbox)
-            if not zones:
-                descendant = self.script.utilities.realActiveDescendant(o)
-                if descendant:
-                    zones = self.getZonesFromAccessible(descendant, boundingbox)
+            zones = self._getReusableZones(o, key)
+            if zones is not None:
+                reused += 1
+            else:
+                zones = self.getZonesFromAccessible(o, boundingbox)
+                if zones:
+                    self.ZONES.set(AXObject.get_id(o), (key, zones), o)
+                else:
+                    # The active descendant can change without changing o, so we don't
+                    # reuse zones which come from it.
+                    descendant = self.script.utilities.realActiveDescendant(o)
+                    if descendant:
+                        zones = self.getZonesFromAccessible(descendant, boundingbox)
+                        reusable = False
 
             if not zones:
                 continue
@@ -767,10 +851,65 @@ class Context:
                 zones = list(filter(lambda z: z.hasCaret(), zones)) or zones
                 focusZone = zones[0]
 
-        tokens = ["FLAT REVIEW:", len(allZones), "zones found for", root]
+        tokens = ["FLAT REVIEW:", len(allZones), "zones found for", root,
+                  f"Zones of {reused} of {len(objs)} objects reused."]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        if reusable:
+            entry = key, AXObject.get_app_generation(root), allZones
+            self.CONTAINER_ZONES.set(AXObject.get_id(root), entry, root)
         return allZones, focusZone
 
+    def _getZonesKey(self, boundingbox):
+        """Returns what zones depend upon besides the generation of their object, which
+        is the bounding box they were built for. The box is that of the top level, which
+        we already have, so this costs no calls to the app."""
+
+        return boundingbox.x, boundingbox.y, boundingbox.width, boundingbox.height
+
+    def _getReusableZones(self, obj, key):
+        """Returns the zones of obj from a previous context if neither obj nor the key of
+        the zones has changed, otherwise None."""
+
+        entry = self.ZONES.get(AXObject.get_id(obj))
+        if entry is None or entry[0] != key:
+            return None
+
+        return entry[1]
+
+    def _getReusableContainerZones(self, container, boundingbox):
+        """Returns the zones of container from a previous context if nothing in its app
+        has changed, otherwise None."""
+
+        entry = self.CONTAINER_ZONES.get(AXObject.get_id(container))
+        if entry is None:
+            return None
+
+        key, generation, zones = entry
+        if key != self._getZonesKey(boundingbox) \
+           or generation is None or generation != AXObject.get_app_generation(container):
+            return None
+
+        tokens = ["FLAT REVIEW: Reusing", len(zones), "zones. Nothing changed in", container]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        return zones
+
+    def _findFocusZone(self, zones):
+        """Returns the zone of the locus of focus or its descendants, preferring one with
+        the caret, the same way getShowingZones() picks it."""
+
+        if self.focusObj is None:
+            return None
+
+        candidates = []
+        for zone in zones:
+            if candidates and zone.accessible != candidates[0].accessible:
+                break
+            if candidates or self._isOrIsIn(zone.accessible, self.focusObj):
+                candidates.append(zone)
+
+        return next((z for z in candidates if z.hasCaret()), None) \
+            or next(iter(candidates), None)
+
     def clusterZonesByLine(self, zones):
         """Returns a sorted list of Line clusters containing sorted Zones."""
 
@@ -1276,6 +1415,21 @@ class Context:
 
         return moved
 
+    def _skipToX(self, x):
+        """Moves to the first word on the current line which can have a char at or to
+        the right of x, judging by the extents of the zones and words. This spares us
+        the extents of every char on the way there."""
+
+        line = self.lines[self.lineIndex]
+        if not line.zones:
+            return
+
+        self.zoneIndex = line.getZoneIndexAtX(x)
+        words = line.zones[self.zoneIndex].words
+        self.wordIndex = next(
+            (i for i, w in enumerate(words) if w.x + w.width >= x), max(0, len(words) - 1))
+        self.charIndex = 0
+
     def goAbove(self, flatReviewType=LINE, wrap=WRAP_ALL):
         """Moves this context's locus of interest to first char
         of the type that's closest to and above the current locus of
@@ -1304,6 +1458,7 @@ class Context:
 
             moved = self.goPrevious(Context.LINE, wrap)
             if moved:
+                self._skipToX(middleTargetX - width)
                 while True:
                     [string, bx, by, bwidth, bheight] = \
                              self.getCurrent(Context.CHAR)
@@ -1351,6 +1506,7 @@ class Context:
 
             moved = self.goNext(Context.LINE, wrap)
             if moved:
+                self._skipToX(middleTargetX - width)
                 while True:
                     [string, bx, by, bwidth, bheight] = \
                              self.getCurrent(Context.CHAR)
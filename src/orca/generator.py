@@ -46,7 +46,7 @@ from . import object_properties
 from . import settings
 from . import settings_manager
 from .ax_hypertext import AXHypertext
-from .ax_object import AXObject
+from .ax_object import AXObject, SearchBudget
 from .ax_table import AXTable
 from .ax_text import AXText
 from .ax_utilities import AXUtilities
@@ -689,7 +689,7 @@ class Generator:
 
         # For GtkListBox, such as those found in the control center
         if AXUtilities.is_list_box(AXObject.get_parent(obj)):
-            widget = AXObject.find_descendant(obj, isWidget)
+            widget = AXObject.find_descendant(obj, isWidget, SearchBudget(max_nodes=100))
             if widget:
                 return self.generate(widget, includeContext=False)
 
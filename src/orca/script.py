@@ -89,6 +89,9 @@ class Script:
         self.name += " (module=" + self.__module__ + ")"
 
         self.listeners = self.getListeners()
+        self._eventRoutes = {}
+        for eventType in self.listeners:
+            self._getListenersForEventType(eventType)
 
         # By default, handle events for non-active applications.
         #
@@ -145,6 +148,18 @@ class Script:
         """
         return {}
 
+    def _getListenersForEventType(self, eventType):
+        """Returns the listeners whose key begins with or is the same as eventType. The
+        result is cached so that each event type is only matched against the keys once."""
+
+        handlers = self._eventRoutes.get(eventType)
+        if handlers is None:
+            handlers = tuple(handler for key, handler in self.listeners.items()
+                             if eventType.startswith(key))
+            self._eventRoutes[eventType] = handlers
+
+        return handlers
+
     def setupInputEventHandlers(self):
         """Defines InputEventHandler fields for this script that can be
         called by the key and braille bindings."""
@@ -329,19 +344,16 @@ class Script:
         #
         self.generatorCache = {}
 
-        # This calls the first listener it finds whose key *begins with* or is
-        # the same as the event.type.  The reason we do this is that the event
-        # type in the listeners dictionary may not be as specific as the event
-        # type we received (e.g., the listeners dictionary might contain the
-        # key "object:state-changed:" and the event.type might be
-        # "object:state-changed:focused".  [[[TODO: WDW - the order of the
-        # keys is *not* deterministic, and is not guaranteed to be related
-        # to the order in which they were added.  So...we need to do something
-        # different here.  Logged as bugzilla bug 319781.]]]
+        # This calls each listener whose key *begins with* or is the same as the
+        # event.type, in the order in which the listeners were added. The reason
+        # we do this is that the event type in the listeners dictionary may not be
+        # as specific as the event type we received (e.g., the listeners dictionary
+        # might contain the key "object:state-changed:" and the event.type might be
+        # "object:state-changed:focused". The matching listeners for each event type
+        # are looked up once and then cached.
         #
-        for key in self.listeners.keys():
-            if event.type.startswith(key):
-                self.listeners[key](event)
+        for listener in self._getListenersForEventType(event.type):
+            listener(event)
 
     def _getQueuedEvent(self, eventType, detail1=None, detail2=None, any_data=None):
         cachedEvent, eventTime = self.eventCache.get(eventType, [None, 0])
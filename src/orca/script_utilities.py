@@ -389,7 +389,8 @@ class Utilities:
             if isDialog(obj):
                 results[1] = obj
             else:
-                results[1] = AXObject.find_ancestor(obj, isDialog)
+                results[1] = AXObject.find_ancestor(
+                    obj, isDialog, remember_as=("dialog", tuple(dialog_roles)))
 
         tokens = ["SCRIPT UTILITIES:", obj, "is in frame", results[0], "and dialog", results[1]]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
@@ -896,7 +897,7 @@ class Utilities:
         if self.isDocument(obj):
             return obj
 
-        return AXObject.find_ancestor(obj, self.isDocument)
+        return AXObject.find_ancestor(obj, self.isDocument, remember_as=("document", type(self)))
 
     def getModalDialog(self, obj):
         if not obj:
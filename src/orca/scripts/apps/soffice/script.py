@@ -393,9 +393,7 @@ class Script(default.Script):
             focus_manager.getManager().set_locus_of_focus(event, event.any_data)
             return
 
-        AXObject.clear_cache_now("children-changed event.")
-        if AXUtilities.is_table_related(event.source):
-            AXTable.clear_cache_now("children-changed event.")
+        AXObject.invalidate(event.source, "children-changed event.")
 
         if AXTable.is_last_cell(event.any_data):
             activeRow = self.pointOfReference.get('lastRow', -1)
@@ -1198,16 +1198,12 @@ class Script(script.Script):
     def onChildrenAdded(self, event):
         """Callback for object:children-changed:add accessibility events."""
 
-        AXObject.clear_cache_now("children-changed event.")
-        if AXUtilities.is_table_related(event.source):
-            AXTable.clear_cache_now("children-changed event.")
+        AXObject.invalidate(event.source, "children-changed event.")
 
     def onChildrenRemoved(self, event):
         """Callback for object:children-changed:remove accessibility events."""
 
-        AXObject.clear_cache_now("children-changed event.")
-        if AXUtilities.is_table_related(event.source):
-            AXTable.clear_cache_now("children-changed event.")
+        AXObject.invalidate(event.source, "children-changed event.")
 
     def onCaretMoved(self, event):
         """Callback for object:text-caret-moved accessibility events."""
@@ -1320,7 +1316,7 @@ class Script(script.Script):
         """Callback for object:state-changed:expanded accessibility events."""
 
         if AXUtilities.is_table_related(event.source):
-            AXTable.clear_cache_now("expanded-changed event.")
+            AXObject.invalidate(event.source, "expanded-changed event.")
 
         if not self.utilities.isPresentableExpandedChangedEvent(event):
             return
@@ -1417,9 +1413,7 @@ class Script(script.Script):
     def onObjectAttributesChanged(self, event):
         """Callback for object:attributes-changed accessibility events."""
 
-        AXObject.clear_cache_now("object-attributes-changed event.")
-        if AXUtilities.is_table_related(event.source):
-            AXTable.clear_cache_now("object-attributes-changed event.")
+        AXObject.invalidate(event.source, "object-attributes-changed event.")
 
     def onPressedChanged(self, event):
         """Callback for object:state-changed:pressed accessibility events."""
@@ -1762,7 +1756,7 @@ class Script(script.Script):
     def onColumnReordered(self, event):
         """Callback for object:column-reordered accessibility events."""
 
-        AXTable.clear_cache_now("column-reordered event.")
+        AXObject.invalidate(event.source, "column-reordered event.")
         if not self.utilities.lastInputEventWasTableSort():
             return
 
@@ -1775,7 +1769,7 @@ class Script(script.Script):
     def onRowReordered(self, event):
         """Callback for object:row-reordered accessibility events."""
 
-        AXTable.clear_cache_now("row-reordered event.")
+        AXObject.invalidate(event.source, "row-reordered event.")
         if not self.utilities.lastInputEventWasTableSort():
             return
 
@@ -44,20 +44,6 @@ from orca.ax_utilities import AXUtilities
 
 class Utilities(web.Utilities):
 
-    def __init__(self, script):
-        super().__init__(script)
-        self._isStaticTextLeaf = {}
-        self._isPseudoElement = {}
-        self._isListItemMarker = {}
-        self._topLevelObject = {}
-
-    def clearCachedObjects(self):
-        super().clearCachedObjects()
-        self._isStaticTextLeaf = {}
-        self._isPseudoElement = {}
-        self._isListItemMarker = {}
-        self._topLevelObject = {}
-
     def isStaticTextLeaf(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return super().isStaticTextLeaf(obj)
@@ -68,7 +54,7 @@ class Utilities(web.Utilities):
         if self.isListItemMarker(obj):
             return False
 
-        rv = self._isStaticTextLeaf.get(hash(obj))
+        rv = self._predicates.get("isStaticTextLeaf", obj)
         if rv is not None:
             return rv
 
@@ -78,14 +64,14 @@ class Utilities(web.Utilities):
             tokens = ["CHROMIUM:", obj, "believed to be static text leaf"]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
-        self._isStaticTextLeaf[hash(obj)] = rv
+        self._predicates.set("isStaticTextLeaf", obj, rv)
         return rv
 
     def isPseudoElement(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return super().isPseudoElement(obj)
 
-        rv = self._isPseudoElement.get(hash(obj))
+        rv = self._predicates.get("isPseudoElement", obj)
         if rv is not None:
             return rv
 
@@ -94,14 +80,14 @@ class Utilities(web.Utilities):
             tokens = ["CHROMIUM:", obj, "believed to be pseudo element"]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
-        self._isPseudoElement[hash(obj)] = rv
+        self._predicates.set("isPseudoElement", obj, rv)
         return rv
 
     def isListItemMarker(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isListItemMarker.get(hash(obj))
+        rv = self._predicates.get("isListItemMarker", obj)
         if rv is not None:
             return rv
 
@@ -118,7 +104,7 @@ class Utilities(web.Utilities):
             else:
                 rv = AXObject.get_name(obj) != self.displayedText(parent)
 
-        self._isListItemMarker[hash(obj)] = rv
+        self._predicates.set("isListItemMarker", obj, rv)
         return rv
 
     def isMenuInCollapsedSelectElement(self, obj):
@@ -183,7 +169,7 @@ class Utilities(web.Utilities):
                 debug.printTokens(debug.LEVEL_INFO, tokens, True)
                 return parent
 
-        cached = self._topLevelObject.get(hash(obj))
+        cached = self._predicates.get("topLevelObject", obj)
         if cached is not None:
             return cached
 
@@ -216,7 +202,7 @@ class Utilities(web.Utilities):
             tokens = ["CHROMIUM: Top level object for", autocomplete, "is", result]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
-        self._topLevelObject[hash(obj)] = result
+        self._predicates.set("topLevelObject", obj, result)
         return result
 
     def autocompleteForPopup(self, obj):
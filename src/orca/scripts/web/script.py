@@ -27,7 +27,9 @@ __copyright__ = "Copyright (c) 2005-2009 Sun Microsystems Inc." \
                 "Copyright (c) 2014-2015 Igalia, S.L."
 __license__   = "LGPL"
 
+import collections
 import time
+from gi.repository import GLib
 from gi.repository import Gtk
 
 from orca import caret_navigation
@@ -47,6 +49,7 @@ from orca import speechserver
 from orca import structural_navigation
 from orca.acss import ACSS
 from orca.scripts import default
+from orca.ax_component import AXComponent
 from orca.ax_document import AXDocument
 from orca.ax_object import AXObject
 from orca.ax_table import AXTable
@@ -62,10 +65,14 @@ from .script_utilities import Utilities
 
 class Script(default.Script):
 
+    # The number of Say All utterances we prepare ahead of the one being spoken.
+    SAY_ALL_LOOKAHEAD = 5
+
     def __init__(self, app):
         super().__init__(app)
 
         self._sayAllContents = []
+        self._sayAllPrefetchId = 0
         self._inSayAll = False
         self._sayAllIsInterrupted = False
         self._loadingDocumentContent = False
@@ -124,6 +131,7 @@ class Script(default.Script):
     def deactivate(self):
         """Called when this script is deactivated."""
 
+        self._cancelSayAllPrefetch()
         self._sayAllContents = []
         self._loadingDocumentContent = False
         self._madeFindAnnouncement = False
@@ -566,14 +574,65 @@ class Script(default.Script):
                     voices.append(u)
             return elements, voices
 
+        self._cancelSayAllPrefetch()
         self._inSayAll = True
-        done = False
-        while not done:
-            if sayAllBySentence:
+        producer = self._sayAllUtterances(
+            obj, characterOffset, priorObj, sayAllBySentence, _parseUtterances)
+        queue = collections.deque()
+        finished = False
+
+        def _produce():
+            nonlocal finished
+            try:
+                queue.append(next(producer))
+            except StopIteration:
+                finished = True
+
+        def _prefetch():
+            if finished or not self._inSayAll or len(queue) >= self.SAY_ALL_LOOKAHEAD:
+                self._sayAllPrefetchId = 0
+                return False
+            _produce()
+            return True
+
+        # The document frame stays put as its contents scroll, so its extents are those
+        # of the viewport for the entire Say All.
+        viewport = AXComponent.get_rect(self.utilities.documentFrame())
+        try:
+            while True:
+                if not queue and not finished:
+                    _produce()
+                if not queue:
+                    break
+
+                context, voice, contents = queue.popleft()
+                self._sayAllContents = contents
+                self._sayAllContexts.append(context)
+                self._scrollSayAllContextIntoView(context, viewport)
+                if not finished and not self._sayAllPrefetchId:
+                    self._sayAllPrefetchId = GLib.idle_add(
+                        _prefetch, priority=GLib.PRIORITY_LOW)
+                yield [context, voice]
+        finally:
+            finished = True
+
+        self._cancelSayAllPrefetch()
+        self._inSayAll = False
+        self._sayAllContents = []
+        self._sayAllContexts = []
+
+        msg = "WEB: textLines complete. Verifying SayAll status"
+        debug.printMessage(debug.LEVEL_INFO, msg, True)
+        self.inSayAll()
+
+    def _sayAllUtterances(self, obj, characterOffset, priorObj, bySentence, parse):
+        """Generates the [context, voice, contents] of each utterance from obj onward."""
+
+        while obj is not None:
+            if bySentence:
                 contents = self.utilities.getSentenceContentsAtOffset(obj, characterOffset)
             else:
                 contents = self.utilities.getLineContentsAtOffset(obj, characterOffset)
-            self._sayAllContents = contents
             for i, content in enumerate(contents):
                 obj, startOffset, endOffset, text = content
                 tokens = ["WEB SAY ALL CONTENT:",
@@ -596,7 +655,7 @@ class Script(default.Script):
                     [content], eliminatePauses=True, priorObj=priorObj)
                 priorObj = obj
 
-                elements, voices = _parseUtterances(utterances)
+                elements, voices = parse(utterances)
                 if len(elements) != len(voices):
                     continue
 
@@ -605,9 +664,7 @@ class Script(default.Script):
                         obj, element, startOffset, endOffset)
                     tokens = ["WEB", context]
                     debug.printTokens(debug.LEVEL_INFO, tokens, True)
-                    self._sayAllContexts.append(context)
-                    self.eventSynthesizer.scroll_into_view(obj, startOffset, endOffset)
-                    yield [context, voices[i]]
+                    yield context, voices[i], contents
 
             lastObj, lastOffset = contents[-1][0], contents[-1][2]
             obj, characterOffset = self.utilities.findNextCaretInOrder(lastObj, lastOffset - 1)
@@ -619,15 +676,33 @@ class Script(default.Script):
                 debug.printTokens(debug.LEVEL_INFO, tokens, True)
                 break
 
-            done = obj is None
+    def _cancelSayAllPrefetch(self):
+        """Stops preparing Say All utterances ahead of the one being spoken."""
 
-        self._inSayAll = False
-        self._sayAllContents = []
-        self._sayAllContexts = []
+        if self._sayAllPrefetchId:
+            GLib.source_remove(self._sayAllPrefetchId)
+            self._sayAllPrefetchId = 0
 
-        msg = "WEB: textLines complete. Verifying SayAll status"
-        debug.printMessage(debug.LEVEL_INFO, msg, True)
-        self.inSayAll()
+    def _scrollSayAllContextIntoView(self, context, viewport):
+        """Scrolls the content of context to the top edge if it is not in viewport."""
+
+        if not (viewport.width and viewport.height):
+            self.eventSynthesizer.scroll_into_view(
+                context.obj, context.startOffset, context.endOffset)
+            return
+
+        _x, y, width, height = self.utilities.getExtents(
+            context.obj, context.startOffset, context.endOffset)
+        if not (width or height):
+            return
+
+        if viewport.y <= y and y + height <= viewport.y + viewport.height:
+            return
+
+        tokens = ["WEB: Scrolling", context.obj, "into view for SayAll"]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        self.eventSynthesizer.scroll_to_top_edge(
+            context.obj, context.startOffset, context.endOffset)
 
     def presentFindResults(self, obj, offset):
         """Updates the context and presents the find results if appropriate."""
@@ -742,6 +817,7 @@ class Script(default.Script):
                     self.utilities.setCaretPosition(context.obj, context.currentOffset)
                     self.updateBraille(context.obj)
 
+            self._cancelSayAllPrefetch()
             self._inSayAll = False
             self._sayAllContents = []
             self._sayAllContexts = []
@@ -1440,7 +1516,7 @@ class Script(default.Script):
         if event.detail1:
             return True
 
-        self.utilities.clearCachedObjects()
+        self.utilities.clearCachedObjects(event.source)
         if AXObject.is_dead(obj):
             obj = None
 
@@ -1712,9 +1788,7 @@ class Script(default.Script):
     def onChildrenAdded(self, event):
         """Callback for object:children-changed:add accessibility events."""
 
-        AXObject.clear_cache_now("children-changed event.")
-        if AXUtilities.is_table_related(event.source):
-            AXTable.clear_cache_now("children-changed event.")
+        AXObject.invalidate(event.source, "children-changed event.")
 
         if self.utilities.eventIsBrowserUINoise(event):
             msg = "WEB: Ignoring event believed to be browser UI noise"
@@ -1740,7 +1814,7 @@ class Script(default.Script):
             else:
                 msg = "WEB: Not dumping full cache"
                 debug.printMessage(debug.LEVEL_INFO, msg, True)
-                self.utilities.clearCachedObjects()
+                self.utilities.clearRelationalCaches()
 
         elif isLiveRegion:
             if self.utilities.handleAsLiveRegion(event):
@@ -1814,9 +1888,7 @@ class Script(default.Script):
     def onChildrenRemoved(self, event):
         """Callback for object:children-changed:removed accessibility events."""
 
-        AXObject.clear_cache_now("children-changed event.")
-        if AXUtilities.is_table_related(event.source):
-            AXTable.clear_cache_now("children-changed event.")
+        AXObject.invalidate(event.source, "children-changed event.")
 
         if not self.utilities.inDocumentContent(event.source):
             msg = "WEB: Event source is not in document content."
@@ -1855,7 +1927,7 @@ class Script(default.Script):
             else:
                 msg = "WEB: Not dumping full cache"
                 debug.printMessage(debug.LEVEL_INFO, msg, True)
-                self.utilities.clearCachedObjects()
+                self.utilities.clearRelationalCaches()
 
         if self.utilities.handleEventForRemovedChild(event):
             msg = "WEB: Event handled for removed child."
@@ -28,7 +28,9 @@ __license__   = "LGPL"
 import gi
 gi.require_version("Atspi", "2.0")
 from gi.repository import Atspi
+from gi.repository import GLib
 
+import collections
 import functools
 import re
 import time
@@ -44,7 +46,7 @@ from orca import settings_manager
 from orca.ax_component import AXComponent
 from orca.ax_document import AXDocument
 from orca.ax_hypertext import AXHypertext
-from orca.ax_object import AXObject
+from orca.ax_object import AXObject, BoundedCache, PredicateCache, SearchBudget
 from orca.ax_table import AXTable
 from orca.ax_text import AXText
 from orca.ax_utilities import AXUtilities
@@ -52,6 +54,11 @@ from orca.ax_utilities import AXUtilities
 
 class Utilities(script_utilities.Utilities):
 
+    # The number of recently computed lines we keep, and how many lines in the direction
+    # of caret navigation we compute ahead of time when idle.
+    LINE_CONTENTS_CACHE_SIZE = 20
+    LINE_CONTENTS_PREFETCH = 3
+
     def __init__(self, script):
         super().__init__(script)
 
@@ -61,67 +68,43 @@ class Utilities(script_utilities.Utilities):
         self._canHaveCaretContextDecision = {}
         self._contextPathsRolesAndNames = {}
         self._paths = {}
-        self._inDocumentContent = {}
-        self._inTopLevelWebApp = {}
-        self._isTextBlockElement = {}
-        self._isContentEditableWithEmbeddedObjects = {}
-        self._isCodeDescendant = {}
-        self._isEntryDescendant = {}
-        self._hasGridDescendant = {}
-        self._isGridDescendant = {}
-        self._isLabelDescendant = {}
-        self._isModalDialogDescendant = {}
-        self._isMenuDescendant = {}
-        self._isNavigableToolTipDescendant = {}
-        self._isToolBarDescendant = {}
-        self._isWebAppDescendant = {}
-        self._isLayoutOnly = {}
-        self._isFocusableWithMathChild = {}
-        self._mathNestingLevel = {}
-        self._isOffScreenLabel = {}
-        self._labelIsAncestorOfLabelled = {}
-        self._elementLinesAreSingleChars= {}
-        self._elementLinesAreSingleWords= {}
-        self._hasLongDesc = {}
-        self._hasVisibleCaption = {}
-        self._hasDetails = {}
-        self._isDetails = {}
-        self._isNonInteractiveDescendantOfControl = {}
-        self._isClickableElement = {}
-        self._isAnchor = {}
-        self._isEditableComboBox = {}
-        self._isErrorMessage = {}
-        self._isInlineIframeDescendant = {}
-        self._isInlineListItem = {}
-        self._isInlineListDescendant = {}
-        self._isLandmark = {}
-        self._isLink = {}
-        self._isListDescendant = {}
-        self._isNonNavigablePopup = {}
-        self._isNonEntryTextWidget = {}
-        self._isCustomImage = {}
-        self._isUselessImage = {}
-        self._isRedundantSVG = {}
-        self._isUselessEmptyElement = {}
-        self._hasNameAndActionAndNoUsefulChildren = {}
-        self._isNonNavigableEmbeddedDocument = {}
-        self._isParentOfNullChild = {}
-        self._inferredLabels = {}
-        self._labelsForObject = {}
-        self._labelTargets = {}
-        self._descriptionListTerms = {}
-        self._valuesForTerm = {}
-        self._displayedLabelText = {}
-        self._preferDescriptionOverName = {}
-        self._shouldFilter = {}
-        self._shouldInferLabelFor = {}
-        self._treatAsTextObject = {}
-        self._treatAsDiv = {}
+
+        # Results which depend on relations between objects, on their order in the
+        # document, or on the object's ancestors, siblings, or document, and which
+        # therefore go stale in clearRelationalCaches(). An object's generation only
+        # changes along with its own subtree, so it cannot stamp these. The same goes
+        # for results which are computed from one of these.
+        relational = ["isOffScreenLabel", "labelIsAncestorOfLabelled", "hasDetails",
+                      "isDetails", "isErrorMessage", "inferredLabels", "labelsForObject",
+                      "labelTargets", "descriptionListTerms", "valuesForTerm",
+                      "displayedLabelText", "shouldInferLabelFor", "hasVisibleCaption",
+                      "isClickableElement", "inDocumentContent", "inTopLevelWebApp",
+                      "hasGridDescendant", "isContentEditableWithEmbeddedObjects",
+                      "isNonNavigableEmbeddedDocument", "isCodeDescendant",
+                      "isEntryDescendant", "isGridDescendant", "isInlineIframeDescendant",
+                      "isInlineListDescendant", "isLabelDescendant", "isListDescendant",
+                      "isMenuDescendant", "isModalDialogDescendant",
+                      "isNavigableToolTipDescendant", "isNonInteractiveDescendantOfControl",
+                      "isToolBarDescendant", "isWebAppDescendant", "mathNestingLevel",
+                      "isLink", "isNonEntryTextWidget", "isRedundantSVG", "isUselessImage",
+                      "hasNameAndActionAndNoUsefulChildren", "isTextBlockElement",
+                      "treatAsDiv", "isLayoutOnly", "treatAsTextObject",
+                      "elementLinesAreSingleWords", "elementLinesAreSingleChars"]
+        self._predicates = PredicateCache(self.getDocumentForObject, relational)
         self._currentObjectContents = None
         self._currentSentenceContents = None
         self._currentLineContents = None
         self._currentWordContents = None
         self._currentCharacterContents = None
+        self._lineContentsCache = []
+        self._linePrefetchId = 0
+
+        # The caret position which follows or precedes each one we have been asked about
+        # while finding the current contents, along with the objects it was found from.
+        # See _findCaretInOrder().
+        self._caretOrder = BoundedCache(max_size=20000)
+        self._caretOrderDependencies = None
+        self._caretOrderStats = [0, 0]
         self._lastQueuedLiveRegionEvent = None
         self._findContainer = None
         self._validChildRoles = {Atspi.Role.LIST: [Atspi.Role.LIST_ITEM]}
@@ -148,78 +131,45 @@ class Utilities(script_utilities.Utilities):
 
         self._script.structuralNavigation.clearCache(documentFrame)
         self.clearCaretContext(documentFrame)
-        self.clearCachedObjects()
+        self.clearRelationalCaches()
+        self._predicates.print_stats("WEB:")
 
         if preserveContext and context:
             tokens = ["WEB: Preserving context of", context[0], ",", context[1]]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             self._caretContexts[hash(documentFrameParent)] = context
 
-    def clearCachedObjects(self):
-        debug.printMessage(debug.LEVEL_INFO, "WEB: cleaning up cached objects", True)
-        self._inDocumentContent = {}
-        self._inTopLevelWebApp = {}
-        self._isTextBlockElement = {}
-        self._isContentEditableWithEmbeddedObjects = {}
-        self._isCodeDescendant = {}
-        self._isEntryDescendant = {}
-        self._hasGridDescendant = {}
-        self._isGridDescendant = {}
-        self._isLabelDescendant = {}
-        self._isMenuDescendant = {}
-        self._isModalDialogDescendant = {}
-        self._isNavigableToolTipDescendant = {}
-        self._isToolBarDescendant = {}
-        self._isWebAppDescendant = {}
-        self._isLayoutOnly = {}
-        self._isFocusableWithMathChild = {}
-        self._mathNestingLevel = {}
-        self._isOffScreenLabel = {}
-        self._labelIsAncestorOfLabelled = {}
-        self._elementLinesAreSingleChars= {}
-        self._elementLinesAreSingleWords= {}
-        self._hasLongDesc = {}
-        self._hasVisibleCaption = {}
-        self._hasDetails = {}
-        self._isDetails = {}
-        self._isNonInteractiveDescendantOfControl = {}
-        self._isClickableElement = {}
-        self._isAnchor = {}
-        self._isEditableComboBox = {}
-        self._isErrorMessage = {}
-        self._isInlineIframeDescendant = {}
-        self._isInlineListItem = {}
-        self._isInlineListDescendant = {}
-        self._isLandmark = {}
-        self._isLink = {}
-        self._isListDescendant = {}
-        self._isNonNavigablePopup = {}
-        self._isNonEntryTextWidget = {}
-        self._isCustomImage = {}
-        self._isUselessImage = {}
-        self._isRedundantSVG = {}
-        self._isUselessEmptyElement = {}
-        self._hasNameAndActionAndNoUsefulChildren = {}
-        self._isNonNavigableEmbeddedDocument = {}
-        self._isParentOfNullChild = {}
-        self._inferredLabels = {}
-        self._labelsForObject = {}
-        self._labelTargets = {}
-        self._descriptionListTerms = {}
-        self._valuesForTerm = {}
-        self._displayedLabelText = {}
-        self._preferDescriptionOverName = {}
-        self._shouldFilter = {}
-        self._shouldInferLabelFor = {}
-        self._treatAsTextObject = {}
-        self._treatAsDiv = {}
+    def clearCachedObjects(self, documentFrame=None):
+        """Clears the cached data for objects in documentFrame, or for all objects."""
+
+        tokens = ["WEB: cleaning up cached objects in", documentFrame or "all documents"]
+        debug.printTokens(debug.LEVEL_INFO, tokens, True)
+        self._predicates.print_stats("WEB:")
+        self._predicates.clear(documentFrame)
+        hits, misses = self._caretOrderStats
+        msg = f"WEB: Caret order cache: {hits} hits, {misses} misses"
+        debug.printMessage(debug.LEVEL_INFO, msg, True)
+        self._lineContentsCache = []
+        if self._linePrefetchId:
+            GLib.source_remove(self._linePrefetchId)
+            self._linePrefetchId = 0
+        self._lastQueuedLiveRegionEvent = None
+        self._findContainer = None
+        self.clearRelationalCaches()
+
+    def clearRelationalCaches(self):
+        """Clears the cached data which depends on relations between objects or on their
+        order in the document. Everything else we cache per object is stamped with the
+        generation of the object, and goes stale when AXObject.invalidate() is called on
+        it or one of its descendants."""
+
+        debug.printMessage(debug.LEVEL_INFO, "WEB: cleaning up cached relationships", True)
+        self._predicates.clear_relational()
         self._paths = {}
         self._contextPathsRolesAndNames = {}
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         self._cleanupContexts()
         self._priorContexts = {}
-        self._lastQueuedLiveRegionEvent = None
-        self._findContainer = None
 
     def clearContentCache(self):
         self._currentObjectContents = None
@@ -246,13 +196,13 @@ class Utilities(script_utilities.Utilities):
         if self.isDocument(obj):
             return True
 
-        rv = self._inDocumentContent.get(hash(obj))
+        rv = self._predicates.get("inDocumentContent", obj)
         if rv is not None:
             return rv
 
         document = self.getDocumentForObject(obj)
         rv = document is not None
-        self._inDocumentContent[hash(obj)] = rv
+        self._predicates.set("inDocumentContent", obj, rv)
         return rv
 
     def _getDocumentsEmbeddedBy(self, frame):
@@ -418,7 +368,8 @@ class Utilities(script_utilities.Utilities):
         if AXUtilities.is_table_row(obj):
             rowindex = attrs.get('rowindex')
             if rowindex is None and AXObject.get_child_count(obj):
-                cell = AXObject.find_descendant(obj, AXUtilities.is_table_cell_or_header)
+                cell = AXObject.find_descendant(
+                    obj, AXUtilities.is_table_cell_or_header, SearchBudget(max_nodes=100))
                 rowindex = AXObject.get_attributes_dict(cell, False).get('rowindex')
 
             if rowindex is not None:
@@ -758,7 +709,7 @@ class Utilities(script_utilities.Utilities):
         return result
 
     def isNonEntryTextWidget(self, obj):
-        rv = self._isNonEntryTextWidget.get(hash(obj))
+        rv = self._predicates.get("isNonEntryTextWidget", obj)
         if rv is not None:
             return rv
 
@@ -783,14 +734,14 @@ class Utilities(script_utilities.Utilities):
             else:
                 rv = not self.isTextBlockElement(obj)
 
-        self._isNonEntryTextWidget[hash(obj)] = rv
+        self._predicates.set("isNonEntryTextWidget", obj, rv)
         return rv
 
     def treatAsTextObject(self, obj, excludeNonEntryTextWidgets=True):
         if not obj or AXObject.is_dead(obj):
             return False
 
-        rv = self._treatAsTextObject.get(hash(obj))
+        rv = self._predicates.get("treatAsTextObject", obj)
         if rv is not None:
             return rv
 
@@ -831,14 +782,14 @@ class Utilities(script_utilities.Utilities):
                 debug.printTokens(debug.LEVEL_INFO, tokens, True)
                 rv = False
 
-        self._treatAsTextObject[hash(obj)] = rv
+        self._predicates.set("treatAsTextObject", obj, rv)
         return rv
 
     def hasNameAndActionAndNoUsefulChildren(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._hasNameAndActionAndNoUsefulChildren.get(hash(obj))
+        rv = self._predicates.get("hasNameAndActionAndNoUsefulChildren", obj)
         if rv is not None:
             return rv
 
@@ -854,14 +805,14 @@ class Utilities(script_utilities.Utilities):
             tokens = ["WEB:", obj, "has name and action and no useful children"]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
-        self._hasNameAndActionAndNoUsefulChildren[hash(obj)] = rv
+        self._predicates.set("hasNameAndActionAndNoUsefulChildren", obj, rv)
         return rv
 
     def isNonInteractiveDescendantOfControl(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isNonInteractiveDescendantOfControl.get(hash(obj))
+        rv = self._predicates.get("isNonInteractiveDescendantOfControl", obj)
         if rv is not None:
             return rv
 
@@ -881,7 +832,7 @@ class Utilities(script_utilities.Utilities):
                         Atspi.Role.TREE_ITEM]
             rv = AXObject.find_ancestor(obj, lambda x: AXObject.get_role(x) in controls)
 
-        self._isNonInteractiveDescendantOfControl[hash(obj)] = rv
+        self._predicates.set("isNonInteractiveDescendantOfControl", obj, rv)
         return rv
 
     def _treatObjectAsWhole(self, obj, offset=None):
@@ -1119,9 +1070,9 @@ class Utilities(script_utilities.Utilities):
         return self.adjustContentsForLanguage([[obj, start, end, string]])
 
     def getSentenceContentsAtOffset(self, obj, offset, useCache=True):
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         rv = self._getSentenceContentsAtOffset(obj, offset, useCache)
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         return rv
 
     def _getSentenceContentsAtOffset(self, obj, offset, useCache=True):
@@ -1198,9 +1149,9 @@ class Utilities(script_utilities.Utilities):
         return objects
 
     def getCharacterContentsAtOffset(self, obj, offset, useCache=True):
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         rv = self._getCharacterContentsAtOffset(obj, offset, useCache)
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         return rv
 
     def _getCharacterContentsAtOffset(self, obj, offset, useCache=True):
@@ -1222,9 +1173,9 @@ class Utilities(script_utilities.Utilities):
         return objects
 
     def getWordContentsAtOffset(self, obj, offset, useCache=True):
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         rv = self._getWordContentsAtOffset(obj, offset, useCache)
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         return rv
 
     def _getWordContentsAtOffset(self, obj, offset, useCache=True):
@@ -1304,9 +1255,9 @@ class Utilities(script_utilities.Utilities):
         return objects
 
     def getObjectContentsAtOffset(self, obj, offset=0, useCache=True):
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         rv = self._getObjectContentsAtOffset(obj, offset, useCache)
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         return rv
 
     def _getObjectContentsAtOffset(self, obj, offset=0, useCache=True):
@@ -1433,9 +1384,9 @@ class Utilities(script_utilities.Utilities):
         return False
 
     def getLineContentsAtOffset(self, obj, offset, layoutMode=None, useCache=True):
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         rv = self._getLineContentsAtOffset(obj, offset, layoutMode, useCache)
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         return rv
 
     def _getLineContentsAtOffset(self, obj, offset, layoutMode=None, useCache=True):
@@ -1456,6 +1407,10 @@ class Utilities(script_utilities.Utilities):
                 obj = child
                 offset = 0
 
+        if layoutMode is None:
+            layoutMode = settings_manager.getManager().getSetting('layoutMode') \
+                or self._script.inFocusMode()
+
         if useCache:
             if self.findObjectInContents(
                     obj, offset, self._currentLineContents, usingCache=True) != -1:
@@ -1463,9 +1418,11 @@ class Utilities(script_utilities.Utilities):
                     obj, offset, self._currentLineContents, "Line (cached)")
                 return self._currentLineContents
 
-        if layoutMode is None:
-            layoutMode = settings_manager.getManager().getSetting('layoutMode') \
-                or self._script.inFocusMode()
+            objects = self._getCachedLineContents(obj, offset, layoutMode)
+            if objects:
+                self._currentLineContents = objects
+                self._debugContentsInfo(obj, offset, objects, "Line (recently cached)")
+                return objects
 
         objects = []
         if offset > 0 and self.treatAsEndOfLine(obj, offset):
@@ -1480,36 +1437,46 @@ class Utilities(script_utilities.Utilities):
 
         objBanner = AXObject.find_ancestor(obj, self.isLandmarkBanner)
 
+        # The candidates on either side overlap from one step to the next. In order for
+        # the cost of a line to grow linearly with its length, we keep track of what is
+        # already on the line in a set, and remember the extents of each candidate and
+        # the properties of obj for as long as the line is being built.
+        onLine = set()
+        candidateExtents = {}
+
         def _include(x):
-            if x in objects:
+            xObj, xStart, xEnd, xString = x
+            if (xObj, xStart, xEnd) in onLine:
                 return False
 
-            xObj, xStart, xEnd, xString = x
             if xStart == xEnd:
                 return False
 
-            xExtents = self.getExtents(xObj, xStart, xStart + 1)
+            xExtents = candidateExtents.get((xObj, xStart))
+            if xExtents is None:
+                xExtents = candidateExtents[(xObj, xStart)] = \
+                    self.getExtents(xObj, xStart, xStart + 1)
 
             if obj != xObj:
-                if self.isLandmark(obj) and self.isLandmark(xObj):
+                if objIsLandmark and self.isLandmark(xObj):
                     return False
-                if self.isLink(obj) and self.isLink(xObj):
+                if objIsLink and self.isLink(xObj):
                     xObjBanner = AXObject.find_ancestor(xObj, self.isLandmarkBanner)
                     if (objBanner or xObjBanner) and objBanner != xObjBanner:
                         return False
                     if abs(extents[0] - xExtents[0]) <= 1 and abs(extents[1] - xExtents[1]) <= 1:
                         # This happens with dynamic skip links such as found on Wikipedia.
                         return False
-                elif self.isBlockListDescendant(obj) != self.isBlockListDescendant(xObj):
+                elif objIsBlockListDescendant != self.isBlockListDescendant(xObj):
                     return False
-                elif AXUtilities.is_tree_related(obj) and AXUtilities.is_tree_related(xObj):
+                elif objIsTreeRelated and AXUtilities.is_tree_related(xObj):
                     return False
-                elif AXUtilities.is_heading(obj) and AXComponent.has_no_size(obj):
+                elif objIsSizelessHeading:
                     return False
                 elif AXUtilities.is_heading(xObj) and AXComponent.has_no_size(xObj):
                     return False
 
-            if self.isMathTopLevel(xObj) or self.isMath(obj):
+            if self.isMathTopLevel(xObj) or objIsMath:
                 onSameLine = self.extentsAreOnSameLine(extents, xExtents, extents[3])
             elif self.isTextSubscriptOrSuperscript(xObj):
                 onSameLine = self.extentsAreOnSameLine(extents, xExtents, xExtents[3])
@@ -1522,6 +1489,7 @@ class Utilities(script_utilities.Utilities):
         if not layoutMode:
             if useCache:
                 self._currentLineContents = objects
+                self._cacheLineContents(objects, layoutMode)
 
             self._debugContentsInfo(obj, offset, objects, "Line (not layout mode)")
             return objects
@@ -1540,6 +1508,15 @@ class Utilities(script_utilities.Utilities):
             lastObj, lastEnd = self.lastContext(lastObj)
             lastEnd += 1
 
+        objects = collections.deque(objects)
+        onLine.update(x[:3] for x in objects)
+        objIsLandmark = self.isLandmark(obj)
+        objIsLink = self.isLink(obj)
+        objIsBlockListDescendant = self.isBlockListDescendant(obj)
+        objIsTreeRelated = AXUtilities.is_tree_related(obj)
+        objIsSizelessHeading = AXUtilities.is_heading(obj) and AXComponent.has_no_size(obj)
+        objIsMath = self.isMath(obj)
+
         document = self.getDocumentForObject(obj)
         prevObj, pOffset = self.findPreviousCaretInOrder(firstObj, firstStart)
         nextObj, nOffset = self.findNextCaretInOrder(lastObj, lastEnd - 1)
@@ -1561,9 +1538,10 @@ class Utilities(script_utilities.Utilities):
                 break
 
             if self._contentIsSubsetOf(objects[0], onLeft[-1]):
-                objects.pop(0)
+                onLine.discard(objects.popleft()[:3])
 
-            objects[0:0] = onLeft
+            objects.extendleft(reversed(onLeft))
+            onLine.update(x[:3] for x in onLeft)
             firstObj, firstStart = objects[0][0], objects[0][1]
             prevObj, pOffset = self.findPreviousCaretInOrder(firstObj, firstStart)
 
@@ -1591,6 +1569,7 @@ class Utilities(script_utilities.Utilities):
                 break
 
             objects.extend(onRight)
+            onLine.update(x[:3] for x in onRight)
             lastObj, lastEnd = objects[-1][0], objects[-1][2]
             if self.isMathTopLevel(lastObj):
                 lastObj, lastEnd = self.lastContext(lastObj)
@@ -1598,6 +1577,7 @@ class Utilities(script_utilities.Utilities):
 
             nextObj, nOffset = self.findNextCaretInOrder(lastObj, lastEnd - 1)
 
+        objects = list(objects)
         nextEndTime = time.time()
         msg = f"INFO: Time to get line contents on right: {nextEndTime - nextStartTime:.4f}s"
         debug.printMessage(debug.LEVEL_INFO, msg, True)
@@ -1608,16 +1588,103 @@ class Utilities(script_utilities.Utilities):
 
         if useCache:
             self._currentLineContents = objects
+            self._cacheLineContents(objects, layoutMode)
 
         msg = f"INFO: Time to get line contents: {time.time() - startTime:.4f}s"
         debug.printMessage(debug.LEVEL_INFO, msg, True)
 
         self._debugContentsInfo(obj, offset, objects, "Line (layout mode)")
 
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         return objects
 
-    def getPreviousLineContents(self, obj=None, offset=-1, layoutMode=None, useCache=True):
+    def _cacheLineContents(self, contents, layoutMode):
+        """Adds contents to the recently computed lines. Each line is stamped with the
+        generations of its objects and of their parents, so that a change to the text or
+        children of any of them, or of their siblings, makes us compute it again."""
+
+        if not (contents and contents[0]):
+            return
+
+        objects = {x[0] for x in contents}
+        objects.update([AXObject.get_parent(x) for x in objects])
+        objects.discard(None)
+        stamps = [(x, AXObject.get_generation(x)) for x in objects]
+
+        cache = [x for x in self._lineContentsCache if x[0] != contents]
+        cache.insert(0, (contents, layoutMode, stamps))
+        self._lineContentsCache = cache[:self.LINE_CONTENTS_CACHE_SIZE]
+
+    def _getCachedLineContents(self, obj, offset, layoutMode):
+        """Returns the recently computed line with obj at offset, or None."""
+
+        for i, (contents, mode, stamps) in enumerate(self._lineContentsCache):
+            if mode != layoutMode \
+               or self.findObjectInContents(obj, offset, contents, usingCache=True) == -1:
+                continue
+
+            if any(AXObject.get_generation(x) != generation for x, generation in stamps):
+                tokens = ["WEB: Recently cached line with", obj, "at offset", offset, "is stale"]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                self._lineContentsCache.pop(i)
+                return None
+
+            return contents
+
+        return None
+
+    def prefetchLineContents(self, contents, forward=True):
+        """Computes the lines after (or before) contents when we are idle, so that moving
+        to them with the caret does not have to wait for them."""
+
+        if self._linePrefetchId:
+            GLib.source_remove(self._linePrefetchId)
+            self._linePrefetchId = 0
+
+        if not (contents and contents[0]):
+            return
+
+        self._linePrefetchId = GLib.idle_add(
+            self._prefetchLineContents, contents, contents, forward,
+            self.LINE_CONTENTS_PREFETCH, priority=GLib.PRIORITY_LOW)
+
+    def _prefetchLineContents(self, current, contents, forward, remaining):
+        self._linePrefetchId = 0
+
+        # Lines which the user is no longer near are not worth computing.
+        obj, offset = self.getCaretContext()
+        if self._script.inSayAll() \
+           or self.findObjectInContents(obj, offset, current, usingCache=True) == -1:
+            return False
+
+        # The line we start from, and the line we are after if it is still fresh, come
+        # from the recently computed lines. Any line we do compute is added to them, but
+        # must not replace the line the user is on, nor clear the caches when the context
+        # turns out to be invalid.
+        layoutMode = settings_manager.getManager().getSetting('layoutMode') \
+            or self._script.inFocusMode()
+        obj, offset = contents[0][0], contents[0][1]
+        currentLineContents = self._currentLineContents
+        try:
+            if forward:
+                contents = self.getNextLineContents(
+                    obj, offset, layoutMode, useCache=True, recover=False)
+            else:
+                contents = self.getPreviousLineContents(
+                    obj, offset, layoutMode, useCache=True, recover=False)
+        finally:
+            self._currentLineContents = currentLineContents
+
+        remaining -= 1
+        if remaining and contents and contents[0]:
+            self._linePrefetchId = GLib.idle_add(
+                self._prefetchLineContents, current, contents, forward, remaining,
+                priority=GLib.PRIORITY_LOW)
+
+        return False
+
+    def getPreviousLineContents(
+            self, obj=None, offset=-1, layoutMode=None, useCache=True, recover=True):
         if obj is None:
             obj, offset = self.getCaretContext()
 
@@ -1625,6 +1692,11 @@ class Utilities(script_utilities.Utilities):
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
         if not AXObject.is_valid(obj):
+            if not recover:
+                tokens = ["WEB: Current context obj", obj, "is not valid."]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                return []
+
             tokens = ["WEB: Current context obj", obj, "is not valid. Clearing cache."]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             self.clearCachedObjects()
@@ -1643,7 +1715,7 @@ class Utilities(script_utilities.Utilities):
 
         skipSpace = not self.elementIsPreformattedText(firstObj)
         obj, offset = self.previousContext(firstObj, firstOffset, skipSpace)
-        if not obj and firstObj:
+        if not obj and firstObj and recover:
             tokens = ["WEB: Previous context is: ", obj, ", ", offset, ". Trying again."]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             self.clearCachedObjects()
@@ -1676,7 +1748,8 @@ class Utilities(script_utilities.Utilities):
 
         return contents
 
-    def getNextLineContents(self, obj=None, offset=-1, layoutMode=None, useCache=True):
+    def getNextLineContents(
+            self, obj=None, offset=-1, layoutMode=None, useCache=True, recover=True):
         if obj is None:
             obj, offset = self.getCaretContext()
 
@@ -1684,6 +1757,11 @@ class Utilities(script_utilities.Utilities):
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
         if not AXObject.is_valid(obj):
+            if not recover:
+                tokens = ["WEB: Current context obj", obj, "is not valid."]
+                debug.printTokens(debug.LEVEL_INFO, tokens, True)
+                return []
+
             tokens = ["WEB: Current context obj", obj, "is not valid. Clearing cache."]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             self.clearCachedObjects()
@@ -1706,7 +1784,7 @@ class Utilities(script_utilities.Utilities):
 
         skipSpace = not self.elementIsPreformattedText(lastObj)
         obj, offset = self.nextContext(lastObj, lastOffset, skipSpace)
-        if not obj and lastObj:
+        if not obj and lastObj and recover:
             tokens = ["WEB: Next context is: ", obj, ", ", offset, ". Trying again."]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             self.clearCachedObjects()
@@ -1857,7 +1935,7 @@ class Utilities(script_utilities.Utilities):
         if not obj:
             obj = focus_manager.getManager().get_locus_of_focus()
 
-        rv = self._inTopLevelWebApp.get(hash(obj))
+        rv = self._predicates.get("inTopLevelWebApp", obj)
         if rv is not None:
             return rv
 
@@ -1866,7 +1944,7 @@ class Utilities(script_utilities.Utilities):
             document = obj
 
         rv = self.isTopLevelWebApp(document)
-        self._inTopLevelWebApp[hash(obj)] = rv
+        self._predicates.set("inTopLevelWebApp", obj, rv)
         return rv
 
     def isTopLevelWebApp(self, obj):
@@ -2038,7 +2116,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isFocusableWithMathChild.get(hash(obj))
+        rv = self._predicates.get("isFocusableWithMathChild", obj)
         if rv is not None:
             return rv
 
@@ -2049,7 +2127,7 @@ class Utilities(script_utilities.Utilities):
                 rv = True
                 break
 
-        self._isFocusableWithMathChild[hash(obj)] = rv
+        self._predicates.set("isFocusableWithMathChild", obj, rv)
         return rv
 
     def isFocusedWithMathChild(self, obj):
@@ -2061,7 +2139,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isTextBlockElement.get(hash(obj))
+        rv = self._predicates.get("isTextBlockElement", obj)
         if rv is not None:
             return rv
 
@@ -2084,7 +2162,7 @@ class Utilities(script_utilities.Utilities):
         else:
             rv = False
 
-        self._isTextBlockElement[hash(obj)] = rv
+        self._predicates.set("isTextBlockElement", obj, rv)
         return rv
 
     def _advanceCaretInEmptyObject(self, obj):
@@ -2124,7 +2202,7 @@ class Utilities(script_utilities.Utilities):
         if AXUtilities.is_panel(obj) and not childCount:
             return True
 
-        rv = self._treatAsDiv.get(hash(obj))
+        rv = self._predicates.get("treatAsDiv", obj)
         if rv is not None:
             return rv
 
@@ -2147,7 +2225,7 @@ class Utilities(script_utilities.Utilities):
 
                 rv = bool([x for x in AXObject.iter_children(parent, pred2)])
 
-        self._treatAsDiv[hash(obj)] = rv
+        self._predicates.set("treatAsDiv", obj, rv)
         return rv
 
     def isAriaAlert(self, obj):
@@ -2231,13 +2309,13 @@ class Utilities(script_utilities.Utilities):
         if not obj:
             return False
 
-        rv = self._isInlineIframeDescendant.get(hash(obj))
+        rv = self._predicates.get("isInlineIframeDescendant", obj)
         if rv is not None:
             return rv
 
         ancestor = AXObject.find_ancestor(obj, self.isInlineIframe)
         rv = ancestor is not None
-        self._isInlineIframeDescendant[hash(obj)] = rv
+        self._predicates.set("isInlineIframeDescendant", obj, rv)
         return rv
 
     def isInlineSuggestion(self, obj):
@@ -2520,7 +2598,7 @@ class Utilities(script_utilities.Utilities):
         return [attrs.get('open', '('), attrs.get('close', ')')]
 
     def getMathNestingLevel(self, obj, test=None):
-        rv = self._mathNestingLevel.get(hash(obj))
+        rv = self._predicates.get("mathNestingLevel", obj)
         if rv is not None:
             return rv
 
@@ -2535,16 +2613,20 @@ class Utilities(script_utilities.Utilities):
             ancestor = AXObject.find_ancestor(ancestor, pred)
             rv += 1
 
-        self._mathNestingLevel[hash(obj)] = rv
+        self._predicates.set("mathNestingLevel", obj, rv)
         return rv
 
     def filterContentsForPresentation(self, contents, inferLabels=False):
+        # Whether an object is included depends on the other contents, so the results
+        # are only kept for this call.
+        shouldFilter = {}
+
         def _include(x):
             obj, start, end, string = x
             if not obj or AXObject.is_dead(obj):
                 return False
 
-            rv = self._shouldFilter.get(hash(obj))
+            rv = shouldFilter.get(hash(obj))
             if rv is not None:
                 return rv
 
@@ -2568,15 +2650,13 @@ class Utilities(script_utilities.Utilities):
                 if widget and (inferLabels or AXObject.get_role(widget) in alwaysFilter):
                     rv = False
 
-            self._shouldFilter[hash(obj)] = rv
+            shouldFilter[hash(obj)] = rv
             return rv
 
         if len(contents) == 1:
             return contents
 
-        rv = list(filter(_include, contents))
-        self._shouldFilter = {}
-        return rv
+        return list(filter(_include, contents))
 
     def needsSeparator(self, lastChar, nextChar):
         if lastChar.isspace() or nextChar.isspace():
@@ -2598,7 +2678,7 @@ class Utilities(script_utilities.Utilities):
         if not obj:
             return False
 
-        rv = self._hasGridDescendant.get(hash(obj))
+        rv = self._predicates.get("hasGridDescendant", obj)
         if rv is not None:
             return rv
 
@@ -2615,19 +2695,19 @@ class Utilities(script_utilities.Utilities):
             grids = AXUtilities.find_all_grids(obj)
             rv = bool(grids)
 
-        self._hasGridDescendant[hash(obj)] = rv
+        self._predicates.set("hasGridDescendant", obj, rv)
         return rv
 
     def isGridDescendant(self, obj):
         if not obj:
             return False
 
-        rv = self._isGridDescendant.get(hash(obj))
+        rv = self._predicates.get("isGridDescendant", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.find_ancestor(obj, self.supportsSelectionAndTable) is not None
-        self._isGridDescendant[hash(obj)] = rv
+        self._predicates.set("isGridDescendant", obj, rv)
         return rv
 
     def isSorted(self, obj):
@@ -2698,24 +2778,24 @@ class Utilities(script_utilities.Utilities):
         if not obj:
             return False
 
-        rv = self._isEntryDescendant.get(hash(obj))
+        rv = self._predicates.get("isEntryDescendant", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.find_ancestor(obj, AXUtilities.is_entry) is not None
-        self._isEntryDescendant[hash(obj)] = rv
+        self._predicates.set("isEntryDescendant", obj, rv)
         return rv
 
     def isLabelDescendant(self, obj):
         if not obj:
             return False
 
-        rv = self._isLabelDescendant.get(hash(obj))
+        rv = self._predicates.get("isLabelDescendant", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.find_ancestor(obj, AXUtilities.is_label_or_caption) is not None
-        self._isLabelDescendant[hash(obj)] = rv
+        self._predicates.set("isLabelDescendant", obj, rv)
         return rv
 
     def isMenuInCollapsedSelectElement(self, obj):
@@ -2725,31 +2805,31 @@ class Utilities(script_utilities.Utilities):
         if not obj:
             return False
 
-        rv = self._isMenuDescendant.get(hash(obj))
+        rv = self._predicates.get("isMenuDescendant", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.find_ancestor(obj, AXUtilities.is_menu) is not None
-        self._isMenuDescendant[hash(obj)] = rv
+        self._predicates.set("isMenuDescendant", obj, rv)
         return rv
 
     def isModalDialogDescendant(self, obj):
         if not obj:
             return False
 
-        rv = self._isModalDialogDescendant.get(hash(obj))
+        rv = self._predicates.get("isModalDialogDescendant", obj)
         if rv is not None:
             return rv
 
         rv = super().isModalDialogDescendant(obj)
-        self._isModalDialogDescendant[hash(obj)] = rv
+        self._predicates.set("isModalDialogDescendant", obj, rv)
         return rv
 
     def isNavigableToolTipDescendant(self, obj):
         if not obj:
             return False
 
-        rv = self._isNavigableToolTipDescendant.get(hash(obj))
+        rv = self._predicates.get("isNavigableToolTipDescendant", obj)
         if rv is not None:
             return rv
 
@@ -2758,7 +2838,7 @@ class Utilities(script_utilities.Utilities):
         else:
             ancestor = AXObject.find_ancestor(obj, AXUtilities.is_tool_tip)
         rv = ancestor and not self.isNonNavigablePopup(ancestor)
-        self._isNavigableToolTipDescendant[hash(obj)] = rv
+        self._predicates.set("isNavigableToolTipDescendant", obj, rv)
         return rv
 
     def isTime(self, obj):
@@ -2768,31 +2848,31 @@ class Utilities(script_utilities.Utilities):
         if not obj:
             return False
 
-        rv = self._isToolBarDescendant.get(hash(obj))
+        rv = self._predicates.get("isToolBarDescendant", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.find_ancestor(obj, AXUtilities.is_tool_bar) is not None
-        self._isToolBarDescendant[hash(obj)] = rv
+        self._predicates.set("isToolBarDescendant", obj, rv)
         return rv
 
     def isWebAppDescendant(self, obj):
         if not obj:
             return False
 
-        rv = self._isWebAppDescendant.get(hash(obj))
+        rv = self._predicates.get("isWebAppDescendant", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.find_ancestor(obj, AXUtilities.is_embedded) is not None
-        self._isWebAppDescendant[hash(obj)] = rv
+        self._predicates.set("isWebAppDescendant", obj, rv)
         return rv
 
     def isLayoutOnly(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return super().isLayoutOnly(obj)
 
-        rv = self._isLayoutOnly.get(hash(obj))
+        rv = self._predicates.get("isLayoutOnly", obj)
         if rv is not None:
             if rv:
                 tokens = ["WEB:", obj, "is deemed to be layout only"]
@@ -2846,7 +2926,7 @@ class Utilities(script_utilities.Utilities):
             tokens = ["WEB:", obj, "is deemed to be layout only"]
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
 
-        self._isLayoutOnly[hash(obj)] = rv
+        self._predicates.set("isLayoutOnly", obj, rv)
         return rv
 
     def elementIsPreformattedText(self, obj):
@@ -2865,7 +2945,7 @@ class Utilities(script_utilities.Utilities):
         if self.elementIsPreformattedText(obj):
             return False
 
-        rv = self._elementLinesAreSingleWords.get(hash(obj))
+        rv = self._predicates.get("elementLinesAreSingleWords", obj)
         if rv is not None:
             return rv
 
@@ -2903,14 +2983,14 @@ class Utilities(script_utilities.Utilities):
                     break
                 i = max(i+1, end)
 
-        self._elementLinesAreSingleWords[hash(obj)] = rv
+        self._predicates.set("elementLinesAreSingleWords", obj, rv)
         return rv
 
     def elementLinesAreSingleChars(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._elementLinesAreSingleChars.get(hash(obj))
+        rv = self._predicates.get("elementLinesAreSingleChars", obj)
         if rv is not None:
             return rv
 
@@ -2949,14 +3029,14 @@ class Utilities(script_utilities.Utilities):
                     rv = False
                     break
 
-        self._elementLinesAreSingleChars[hash(obj)] = rv
+        self._predicates.set("elementLinesAreSingleChars", obj, rv)
         return rv
 
     def labelIsAncestorOfLabelled(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._labelIsAncestorOfLabelled.get(hash(obj))
+        rv = self._predicates.get("labelIsAncestorOfLabelled", obj)
         if rv is not None:
             return rv
 
@@ -2966,14 +3046,14 @@ class Utilities(script_utilities.Utilities):
                 rv = True
                 break
 
-        self._labelIsAncestorOfLabelled[hash(obj)] = rv
+        self._predicates.set("labelIsAncestorOfLabelled", obj, rv)
         return rv
 
     def isOffScreenLabel(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isOffScreenLabel.get(hash(obj))
+        rv = self._predicates.get("isOffScreenLabel", obj)
         if rv is not None:
             return rv
 
@@ -2988,7 +3068,7 @@ class Utilities(script_utilities.Utilities):
             if rect.x < 0 or rect.y < 0:
                 rv = True
 
-        self._isOffScreenLabel[hash(obj)] = rv
+        self._predicates.set("isOffScreenLabel", obj, rv)
         return rv
 
     def isDetachedDocument(self, obj):
@@ -3016,12 +3096,12 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return []
 
-        rv = self._labelTargets.get(hash(obj))
+        rv = self._predicates.get("labelTargets", obj)
         if rv is not None:
             return rv
 
         rv = [hash(t) for t in self.targetsForLabel(obj)]
-        self._labelTargets[hash(obj)] = rv
+        self._predicates.set("labelTargets", obj, rv)
         return rv
 
     def isLinkAncestorOfImageInContents(self, link, contents):
@@ -3050,7 +3130,7 @@ class Utilities(script_utilities.Utilities):
         return None
 
     def isLabellingInteractiveElement(self, obj):
-        if self._labelTargets.get(hash(obj)) == []:
+        if self._predicates.get("labelTargets", obj) == []:
             return False
 
         targets = self.targetsForLabel(obj)
@@ -3091,7 +3171,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isAnchor.get(hash(obj))
+        rv = self._predicates.get("isAnchor", obj)
         if rv is not None:
             return rv
 
@@ -3102,7 +3182,7 @@ class Utilities(script_utilities.Utilities):
            and not self._getXMLRoles(obj):
             rv = True
 
-        self._isAnchor[hash(obj)] = rv
+        self._predicates.set("isAnchor", obj, rv)
         return rv
 
     def isEmptyAnchor(self, obj):
@@ -3134,7 +3214,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isClickableElement.get(hash(obj))
+        rv = self._predicates.get("isClickableElement", obj)
         if rv is not None:
             return rv
 
@@ -3162,19 +3242,19 @@ class Utilities(script_utilities.Utilities):
             elif not text.strip():
                 rv = not (AXUtilities.is_static(obj) or AXUtilities.is_link(obj))
 
-        self._isClickableElement[hash(obj)] = rv
+        self._predicates.set("isClickableElement", obj, rv)
         return rv
 
     def isCodeDescendant(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return super().isCodeDescendant(obj)
 
-        rv = self._isCodeDescendant.get(hash(obj))
+        rv = self._predicates.get("isCodeDescendant", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.find_ancestor(obj, self.isCode) is not None
-        self._isCodeDescendant[hash(obj)] = rv
+        self._predicates.set("isCodeDescendant", obj, rv)
         return rv
 
     def isCode(self, obj):
@@ -3205,7 +3285,7 @@ class Utilities(script_utilities.Utilities):
         if not obj:
             return []
 
-        rv = self._descriptionListTerms.get(hash(obj))
+        rv = self._predicates.get("descriptionListTerms", obj)
         if rv is not None:
             return rv
 
@@ -3213,14 +3293,14 @@ class Utilities(script_utilities.Utilities):
         if not self.inDocumentContent(obj):
             return rv
 
-        self._descriptionListTerms[hash(obj)] = rv
+        self._predicates.set("descriptionListTerms", obj, rv)
         return rv
 
     def valuesForTerm(self, obj):
         if not obj:
             return []
 
-        rv = self._valuesForTerm.get(hash(obj))
+        rv = self._predicates.get("valuesForTerm", obj)
         if rv is not None:
             return rv
 
@@ -3228,7 +3308,7 @@ class Utilities(script_utilities.Utilities):
         if not self.inDocumentContent(obj):
             return rv
 
-        self._valuesForTerm[hash(obj)] = rv
+        self._predicates.set("valuesForTerm", obj, rv)
         return rv
 
     def getComboBoxValue(self, obj):
@@ -3239,7 +3319,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return super().isEditableComboBox(obj)
 
-        rv = self._isEditableComboBox.get(hash(obj))
+        rv = self._predicates.get("isEditableComboBox", obj)
         if rv is not None:
             return rv
 
@@ -3247,7 +3327,7 @@ class Utilities(script_utilities.Utilities):
         if AXUtilities.is_combo_box(obj):
             rv = AXUtilities.is_editable(obj)
 
-        self._isEditableComboBox[hash(obj)] = rv
+        self._predicates.set("isEditableComboBox", obj, rv)
         return rv
 
     def getEditableComboBoxForItem(self, item):
@@ -3397,12 +3477,12 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return super().isErrorMessage(obj)
 
-        rv = self._isErrorMessage.get(hash(obj))
+        rv = self._predicates.get("isErrorMessage", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.has_relation(obj, Atspi.RelationType.ERROR_FOR)
-        self._isErrorMessage[hash(obj)] = rv
+        self._predicates.set("isErrorMessage", obj, rv)
         return rv
 
     def isFakePlaceholderForEntry(self, obj):
@@ -3425,7 +3505,8 @@ class Utilities(script_utilities.Utilities):
         if _isMatch(obj):
             return True
 
-        return AXObject.find_descendant(obj, _isMatch) is not None
+        # Placeholders are small, so there is no point in searching big subtrees.
+        return AXObject.find_descendant(obj, _isMatch, SearchBudget(max_nodes=50)) is not None
 
     def isGrid(self, obj):
         return 'grid' in self._getXMLRoles(obj)
@@ -3437,7 +3518,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isInlineListItem.get(hash(obj))
+        rv = self._predicates.get("isInlineListItem", obj)
         if rv is not None:
             return rv
 
@@ -3447,7 +3528,7 @@ class Utilities(script_utilities.Utilities):
             displayStyle = self._getDisplayStyle(obj)
             rv = displayStyle and "inline" in displayStyle
 
-        self._isInlineListItem[hash(obj)] = rv
+        self._predicates.set("isInlineListItem", obj, rv)
         return rv
 
     def isBlockListDescendant(self, obj):
@@ -3460,20 +3541,20 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isListDescendant.get(hash(obj))
+        rv = self._predicates.get("isListDescendant", obj)
         if rv is not None:
             return rv
 
         ancestor = AXObject.find_ancestor(obj, AXUtilities.is_list)
         rv = ancestor is not None
-        self._isListDescendant[hash(obj)] = rv
+        self._predicates.set("isListDescendant", obj, rv)
         return rv
 
     def isInlineListDescendant(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isInlineListDescendant.get(hash(obj))
+        rv = self._predicates.get("isInlineListDescendant", obj)
         if rv is not None:
             return rv
 
@@ -3483,7 +3564,7 @@ class Utilities(script_utilities.Utilities):
             ancestor = AXObject.find_ancestor(obj, self.isInlineListItem)
             rv = ancestor is not None
 
-        self._isInlineListDescendant[hash(obj)] = rv
+        self._predicates.set("isInlineListDescendant", obj, rv)
         return rv
 
     def listForInlineListDescendant(self, obj):
@@ -3511,7 +3592,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isLandmark.get(hash(obj))
+        rv = self._predicates.get("isLandmark", obj)
         if rv is not None:
             return rv
 
@@ -3523,7 +3604,7 @@ class Utilities(script_utilities.Utilities):
             roles = self._getXMLRoles(obj)
             rv = bool(list(filter(lambda x: x in self.getLandmarkTypes(), roles)))
 
-        self._isLandmark[hash(obj)] = rv
+        self._predicates.set("isLandmark", obj, rv)
         return rv
 
     def isLandmarkWithoutType(self, obj):
@@ -3565,7 +3646,7 @@ class Utilities(script_utilities.Utilities):
         if not obj:
             return False
 
-        rv = self._isLink.get(hash(obj))
+        rv = self._predicates.get("isLink", obj)
         if rv is not None:
             return rv
 
@@ -3578,21 +3659,21 @@ class Utilities(script_utilities.Utilities):
         else:
             rv = False
 
-        self._isLink[hash(obj)] = rv
+        self._predicates.set("isLink", obj, rv)
         return rv
 
     def isNonNavigablePopup(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isNonNavigablePopup.get(hash(obj))
+        rv = self._predicates.get("isNonNavigablePopup", obj)
         if rv is not None:
             return rv
 
         rv = AXUtilities.is_tool_tip(obj) \
             and not AXUtilities.is_focusable(obj)
 
-        self._isNonNavigablePopup[hash(obj)] = rv
+        self._predicates.set("isNonNavigablePopup", obj, rv)
         return rv
 
     def hasUselessCanvasDescendant(self, obj):
@@ -3611,7 +3692,7 @@ class Utilities(script_utilities.Utilities):
         return 'switch' in self._getXMLRoles(obj)
 
     def isNonNavigableEmbeddedDocument(self, obj):
-        rv = self._isNonNavigableEmbeddedDocument.get(hash(obj))
+        rv = self._predicates.get("isNonNavigableEmbeddedDocument", obj)
         if rv is not None:
             return rv
 
@@ -3624,14 +3705,14 @@ class Utilities(script_utilities.Utilities):
             else:
                 rv = "doubleclick" in name
 
-        self._isNonNavigableEmbeddedDocument[hash(obj)] = rv
+        self._predicates.set("isNonNavigableEmbeddedDocument", obj, rv)
         return rv
 
     def isRedundantSVG(self, obj):
         if not self.isSVG(obj) or AXObject.get_child_count(AXObject.get_parent(obj)) == 1:
             return False
 
-        rv = self._isRedundantSVG.get(hash(obj))
+        rv = self._predicates.get("isRedundantSVG", obj)
         if rv is not None:
             return rv
 
@@ -3646,14 +3727,14 @@ class Utilities(script_utilities.Utilities):
                 intersection = AXComponent.get_rect_intersection(objExtents, largestExtents)
                 rv = intersection == objExtents
 
-        self._isRedundantSVG[hash(obj)] = rv
+        self._predicates.set("isRedundantSVG", obj, rv)
         return rv
 
     def isCustomImage(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isCustomImage.get(hash(obj))
+        rv = self._predicates.get("isCustomImage", obj)
         if rv is not None:
             return rv
 
@@ -3668,14 +3749,14 @@ class Utilities(script_utilities.Utilities):
             else:
                 rv = True
 
-        self._isCustomImage[hash(obj)] = rv
+        self._predicates.set("isCustomImage", obj, rv)
         return rv
 
     def isUselessImage(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isUselessImage.get(hash(obj))
+        rv = self._predicates.get("isUselessImage", obj)
         if rv is not None:
             return rv
 
@@ -3709,7 +3790,7 @@ class Utilities(script_utilities.Utilities):
                     rv = False
                     break
 
-        self._isUselessImage[hash(obj)] = rv
+        self._predicates.set("isUselessImage", obj, rv)
         return rv
 
     def hasValidName(self, obj):
@@ -3737,7 +3818,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isUselessEmptyElement.get(hash(obj))
+        rv = self._predicates.get("isUselessEmptyElement", obj)
         if rv is not None:
             return rv
 
@@ -3765,14 +3846,14 @@ class Utilities(script_utilities.Utilities):
         else:
             rv = True
 
-        self._isUselessEmptyElement[hash(obj)] = rv
+        self._predicates.set("isUselessEmptyElement", obj, rv)
         return rv
 
     def isParentOfNullChild(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isParentOfNullChild.get(hash(obj))
+        rv = self._predicates.get("isParentOfNullChild", obj)
         if rv is not None:
             return rv
 
@@ -3784,7 +3865,7 @@ class Utilities(script_utilities.Utilities):
             debug.printTokens(debug.LEVEL_INFO, tokens, True)
             rv = True
 
-        self._isParentOfNullChild[hash(obj)] = rv
+        self._predicates.set("isParentOfNullChild", obj, rv)
         return rv
 
     def hasExplicitName(self, obj):
@@ -3798,12 +3879,12 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._hasLongDesc.get(hash(obj))
+        rv = self._predicates.get("hasLongDesc", obj)
         if rv is not None:
             return rv
 
         rv = AXObject.has_action(obj, "showlongdesc")
-        self._hasLongDesc[hash(obj)] = rv
+        self._predicates.set("hasLongDesc", obj, rv)
         return rv
 
     def hasVisibleCaption(self, obj):
@@ -3813,7 +3894,7 @@ class Utilities(script_utilities.Utilities):
         if not (self.isFigure(obj) or AXObject.supports_table(obj)):
             return False
 
-        rv = self._hasVisibleCaption.get(hash(obj))
+        rv = self._predicates.get("hasVisibleCaption", obj)
         if rv is not None:
             return rv
 
@@ -3824,20 +3905,20 @@ class Utilities(script_utilities.Utilities):
                 and AXUtilities.is_showing(x) and AXUtilities.is_visible(x)
 
         rv = bool(list(filter(isVisibleCaption, labels)))
-        self._hasVisibleCaption[hash(obj)] = rv
+        self._predicates.set("hasVisibleCaption", obj, rv)
         return rv
 
     def hasDetails(self, obj):
         if not (obj and self.inDocumentContent(obj)):
             return super().hasDetails(obj)
 
-        rv = self._hasDetails.get(hash(obj))
+        rv = self._predicates.get("hasDetails", obj)
         if rv is not None:
             return rv
 
         relation = AXObject.get_relation(obj, Atspi.RelationType.DETAILS)
         rv = relation and relation.get_n_targets() > 0
-        self._hasDetails[hash(obj)] = rv
+        self._predicates.set("hasDetails", obj, rv)
         return rv
 
     def detailsIn(self, obj):
@@ -3850,13 +3931,13 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return super().isDetails(obj)
 
-        rv = self._isDetails.get(hash(obj))
+        rv = self._predicates.get("isDetails", obj)
         if rv is not None:
             return rv
 
         relation = AXObject.get_relation(obj, Atspi.RelationType.DETAILS_FOR)
         rv = relation and relation.get_n_targets() > 0
-        self._isDetails[hash(obj)] = rv
+        self._predicates.set("isDetails", obj, rv)
         return rv
 
     def detailsFor(self, obj):
@@ -3876,19 +3957,19 @@ class Utilities(script_utilities.Utilities):
         if not self.shouldInferLabelFor(obj):
             return None, []
 
-        rv = self._inferredLabels.get(hash(obj))
+        rv = self._predicates.get("inferredLabels", obj)
         if rv is not None:
             return rv
 
         rv = self._script.labelInference.infer(obj, False)
-        self._inferredLabels[hash(obj)] = rv
+        self._predicates.set("inferredLabels", obj, rv)
         return rv
 
     def shouldInferLabelFor(self, obj):
         if not self.inDocumentContent() or self.isWebAppDescendant(obj):
             return False
 
-        rv = self._shouldInferLabelFor.get(hash(obj))
+        rv = self._predicates.get("shouldInferLabelFor", obj)
         if rv and not self._script.caretNavigation.last_input_event_was_navigation_command():
             return not self._script.inSayAll()
         if rv is False:
@@ -3909,7 +3990,7 @@ class Utilities(script_utilities.Utilities):
                      Atspi.Role.RADIO_BUTTON]
             rv = role in roles and not self.displayedLabel(obj)
 
-        self._shouldInferLabelFor[hash(obj)] = rv
+        self._predicates.set("shouldInferLabelFor", obj, rv)
 
         if self._script.caretNavigation.last_input_event_was_navigation_command() \
            and role not in [Atspi.Role.RADIO_BUTTON, Atspi.Role.CHECK_BOX]:
@@ -3921,7 +4002,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return super().displayedLabel(obj)
 
-        rv = self._displayedLabelText.get(hash(obj))
+        rv = self._predicates.get("displayedLabelText", obj)
         if rv is not None:
             return rv
 
@@ -3930,14 +4011,14 @@ class Utilities(script_utilities.Utilities):
                    or self.displayedText(label) for label in labels if label is not None]
         rv = " ".join(strings)
 
-        self._displayedLabelText[hash(obj)] = rv
+        self._predicates.set("displayedLabelText", obj, rv)
         return rv
 
     def labelsForObject(self, obj):
         if not obj:
             return []
 
-        rv = self._labelsForObject.get(hash(obj))
+        rv = self._predicates.get("labelsForObject", obj)
         if rv is not None:
             return rv
 
@@ -3945,7 +4026,7 @@ class Utilities(script_utilities.Utilities):
         if not self.inDocumentContent(obj):
             return rv
 
-        self._labelsForObject[hash(obj)] = rv
+        self._predicates.set("labelsForObject", obj, rv)
         return rv
 
     def isSpinnerEntry(self, obj):
@@ -4226,7 +4307,7 @@ class Utilities(script_utilities.Utilities):
         if not (obj and self.inDocumentContent(obj)):
             return False
 
-        rv = self._isContentEditableWithEmbeddedObjects.get(hash(obj))
+        rv = self._predicates.get("isContentEditableWithEmbeddedObjects", obj)
         if rv is not None:
             return rv
 
@@ -4245,7 +4326,7 @@ class Utilities(script_utilities.Utilities):
             document = self.getDocumentForObject(obj)
             rv = self.isContentEditableWithEmbeddedObjects(document)
 
-        self._isContentEditableWithEmbeddedObjects[hash(obj)] = rv
+        self._predicates.set("isContentEditableWithEmbeddedObjects", obj, rv)
         return rv
 
     def _rangeInParentWithLength(self, obj):
@@ -4304,7 +4385,17 @@ class Utilities(script_utilities.Utilities):
 
         return False
 
+    def _clearCaretContextDecisions(self):
+        """Forgets which objects can have the caret context, and the caret order found
+        from those decisions. This is done before and after each of the contents, or the
+        first caret context, is found, so the caret order is only reused while finding
+        one of them, just as the decisions are."""
+
+        self._canHaveCaretContextDecision = {}
+        self._caretOrder.clear()
+
     def _canHaveCaretContext(self, obj):
+        self._addCaretOrderDependency(obj)
         rv = self._canHaveCaretContextDecision.get(hash(obj))
         if rv is not None:
             return rv
@@ -4507,6 +4598,8 @@ class Utilities(script_utilities.Utilities):
 
     def clearCaretContext(self, documentFrame=None):
         self.clearContentCache()
+        self._lineContentsCache = []
+        self._caretOrder.clear()
         documentFrame = documentFrame or self.documentFrame()
         if not documentFrame:
             return
@@ -4731,9 +4824,9 @@ class Utilities(script_utilities.Utilities):
         self._contextPathsRolesAndNames[hash(parent)] = path, role, name
 
     def findFirstCaretContext(self, obj, offset):
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         rv = self._findFirstCaretContext(obj, offset)
-        self._canHaveCaretContextDecision = {}
+        self._clearCaretContextDecisions()
         return rv
 
     def _findFirstCaretContext(self, obj, offset):
@@ -4830,9 +4923,53 @@ class Utilities(script_utilities.Utilities):
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
         return self._findFirstCaretContext(child, 0)
 
+    def _addCaretOrderDependency(self, obj):
+        """Notes that the caret position being found depends on obj. None means that it
+        depends on something we cannot track, and that it must not be cached."""
+
+        if self._caretOrderDependencies is not None:
+            self._caretOrderDependencies.append(obj)
+
+    def _findCaretInOrder(self, finder, obj, offset):
+        """Returns the result of finder, which is _findNextCaretInOrder or
+        _findPreviousCaretInOrder, for obj and offset. Building a line asks for the caret
+        positions around the same objects many times, so each result is cached along with
+        the generations of the objects it was found from. The results depend on which
+        objects can have the caret context, so they are forgotten along with those
+        decisions by _clearCaretContextDecisions(), and sooner if one of the objects (or
+        the text or children of one of them) changes."""
+
+        if not obj:
+            obj, offset = self.getCaretContext()
+
+        key = finder.__name__, AXObject.get_id(obj), offset, self._script.inFocusMode()
+        entry = self._caretOrder.get(key)
+        if entry is not None:
+            rv, stamps = entry
+            if all(AXObject.get_generation(x) == generation for x, generation in stamps):
+                self._caretOrderStats[0] += 1
+                return rv
+            self._caretOrder.pop(key, None)
+
+        self._caretOrderStats[1] += 1
+        outer, self._caretOrderDependencies = self._caretOrderDependencies, []
+        try:
+            rv = finder(obj, offset)
+            dependencies = self._caretOrderDependencies
+        finally:
+            self._caretOrderDependencies = outer
+
+        if outer is not None:
+            outer.extend(dependencies)
+        if dependencies and None not in dependencies:
+            stamps = [(x, AXObject.get_generation(x)) for x in set(dependencies)]
+            self._caretOrder[key] = rv, stamps
+
+        return rv
+
     def findNextCaretInOrder(self, obj=None, offset=-1):
         startTime = time.time()
-        rv = self._findNextCaretInOrder(obj, offset)
+        rv = self._findCaretInOrder(self._findNextCaretInOrder, obj, offset)
         tokens = ["WEB: Next caret in order for", obj, ", ", offset, ":",
                   rv[0], ", ", rv[1], f"({time.time() - startTime:.4f}s)"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
@@ -4845,6 +4982,8 @@ class Utilities(script_utilities.Utilities):
         if not obj or not self.inDocumentContent(obj):
             return None, -1
 
+        self._addCaretOrderDependency(obj)
+
         if self._canHaveCaretContext(obj):
             if self.treatAsTextObject(obj):
                 allText = AXText.get_all_text(obj)
@@ -4872,11 +5011,14 @@ class Utilities(script_utilities.Utilities):
 
         while obj and AXObject.get_parent(obj):
             if self.isDetachedDocument(AXObject.get_parent(obj)):
+                self._addCaretOrderDependency(None)
                 obj = self.iframeForDetachedDocument(AXObject.get_parent(obj))
                 continue
 
             parent = AXObject.get_parent(obj)
+            self._addCaretOrderDependency(parent)
             if not AXObject.is_valid(parent):
+                self._addCaretOrderDependency(None)
                 msg = "WEB: Finding next caret in order. Parent is not valid."
                 debug.printMessage(debug.LEVEL_INFO, msg, True)
                 replicant = self.findReplicant(self.documentFrame(), parent)
@@ -4901,7 +5043,7 @@ class Utilities(script_utilities.Utilities):
 
     def findPreviousCaretInOrder(self, obj=None, offset=-1):
         startTime = time.time()
-        rv = self._findPreviousCaretInOrder(obj, offset)
+        rv = self._findCaretInOrder(self._findPreviousCaretInOrder, obj, offset)
         tokens = ["WEB: Previous caret in order for", obj, ", ", offset, ":",
                   rv[0], ", ", rv[1], f"({time.time() - startTime:.4f}s)"]
         debug.printTokens(debug.LEVEL_INFO, tokens, True)
@@ -4914,6 +5056,8 @@ class Utilities(script_utilities.Utilities):
         if not obj or not self.inDocumentContent(obj):
             return None, -1
 
+        self._addCaretOrderDependency(obj)
+
         if self._canHaveCaretContext(obj):
             if self.treatAsTextObject(obj):
                 allText = AXText.get_all_text(obj)
@@ -4944,11 +5088,14 @@ class Utilities(script_utilities.Utilities):
 
         while obj and AXObject.get_parent(obj):
             if self.isDetachedDocument(AXObject.get_parent(obj)):
+                self._addCaretOrderDependency(None)
                 obj = self.iframeForDetachedDocument(AXObject.get_parent(obj))
                 continue
 
             parent = AXObject.get_parent(obj)
+            self._addCaretOrderDependency(parent)
             if not AXObject.is_valid(parent):
+                self._addCaretOrderDependency(None)
                 msg = "WEB: Finding previous caret in order. Parent is not valid."
                 debug.printMessage(debug.LEVEL_INFO, msg, True)
                 replicant = self.findReplicant(self.documentFrame(), parent)
@@ -5030,7 +5177,7 @@ class Utilities(script_utilities.Utilities):
         if not self.inDocumentContent(obj):
             return super().preferDescriptionOverName(obj)
 
-        rv = self._preferDescriptionOverName.get(hash(obj))
+        rv = self._predicates.get("preferDescriptionOverName", obj)
         if rv is not None:
             return rv
 
@@ -5044,7 +5191,7 @@ class Utilities(script_utilities.Utilities):
         else:
             rv = False
 
-        self._preferDescriptionOverName[hash(obj)] = rv
+        self._predicates.set("preferDescriptionOverName", obj, rv)
         return rv
 
     def lastInputEventWasCopy(self):
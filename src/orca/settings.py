@@ -392,6 +392,18 @@ brailleBindingsMap      = {}
 timeoutTime             = 10   # a value of 0 means don't do hang checking
 timeoutCallback         = None # Set by orca.py:init to orca.timeout
 
+# The maximum time in milliseconds the event manager spends processing queued
+# object events before returning control to the main loop.
+eventQueueTimeBudget    = 8
+
+# An application is flooding us when it sends more than eventFloodThreshold events
+# of a single type within eventFloodWindow seconds. While it is, its noisy events
+# are pruned unless they are related to the locus of focus. Above the deluge
+# threshold, those events are ignored as soon as they arrive.
+eventFloodWindow        = 1.0
+eventFloodThreshold     = 50
+eventDelugeThreshold    = 100
+
 structNavTriggersFocusMode = False
 caretNavTriggersFocusMode = False
 nativeNavTriggersFocusMode = True
@@ -45,9 +45,11 @@ from . import settings
 from . import settings_manager
 from .ax_collection import AXCollection
 from .ax_event_synthesizer import AXEventSynthesizer
+from .ax_async import AXAsync
 from .ax_hypertext import AXHypertext
 from .ax_object import AXObject
 from .ax_selection import AXSelection
+from .ax_snapshot import AXSnapshot
 from .ax_table import AXTable
 from .ax_text import AXText
 from .ax_utilities import AXUtilities
@@ -268,6 +270,7 @@ class StructuralNavigationObject:
         """Show a list of all the items with this object type."""
 
         objects = self.structuralNavigation._getAll(self)
+        self.structuralNavigation._prefetch(objects)
 
         def _isValidMatch(x):
             if AXObject.is_dead(x):
@@ -341,6 +344,7 @@ class StructuralNavigationObject:
 
         def showListAtLevel(script, inputEvent):
             objects = self.structuralNavigation._getAll(self, arg=level)
+            self.structuralNavigation._prefetch(objects)
 
             def _isValidMatch(x):
                 return not (script.utilities.isHidden(x) or script.utilities.isEmpty(x))
@@ -784,6 +788,22 @@ class StructuralNavigation:
         self._objectCache[hash(document)] = cache
         return rv
 
+    def _prefetch(self, objects):
+        """Fetches the properties needed to present objects, which _getAll() found in the
+        modal dialog with focus or in the document. The snapshot is only kept for that
+        subtree, and is not taken at all if there is no document."""
+
+        if not objects:
+            return
+
+        focus = focus_manager.getManager().get_locus_of_focus()
+        root = self._script.utilities.getModalDialog(focus) \
+            or self._script.utilities.documentFrame()
+        if root is not None and AXSnapshot.prefetch(root):
+            return
+
+        AXAsync.prefetch(objects)
+
     def goEdge(self, structuralNavigationObject, isStart, event, container=None, arg=None):
         self._last_input_event = event
         if container is None:
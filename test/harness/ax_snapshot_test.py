@@ -0,0 +1,233 @@
+"""Tests for AXSnapshot which use canned replies of the org.a11y.atspi.Cache interface
+in place of an application. The replies are parsed directly, and served by a fake Cache
+service over a private peer-to-peer D-Bus connection, so no bus or app is needed."""
+
+import tempfile
+import threading
+import time
+import unittest
+
+import gi
+gi.require_version("Atspi", "2.0")
+from gi.repository import Atspi
+from gi.repository import Gio
+from gi.repository import GLib
+
+# Orca's modules expect debug, and with it AXObject, to be imported first.
+from orca import debug  # noqa: F401
+from orca.ax_snapshot import AXSnapshot
+
+APP = ":1.42"
+NULL = (APP, "/org/a11y/atspi/null")
+ROOT = (APP, "/org/a11y/atspi/accessible/root")
+IFACES = ["org.a11y.atspi.Accessible", "org.a11y.atspi.Component"]
+
+CURRENT_SIGNATURE = "a((so)(so)(so)iiassusau)"
+OLDER_SIGNATURE = "a((so)(so)(so)a(so)assusau)"
+
+
+def states(*state_types):
+    words = [0, 0]
+    for state_type in state_types:
+        value = int(state_type)
+        words[value // 32] |= 1 << (value % 32)
+    return words
+
+
+def current_item(obj, parent, index, count, name, role, description="", state_words=None):
+    """Returns an item as given to us by current versions of at-spi2-core."""
+
+    return ((APP, obj), ROOT, (APP, parent), index, count, IFACES, name,
+            int(role), description, state_words or [0, 0])
+
+
+def older_item(obj, parent, children, name, role, description="", state_words=None):
+    """Returns an item as given to us by older versions of at-spi2-core."""
+
+    return ((APP, obj), ROOT, (APP, parent), [(APP, c) for c in children], IFACES, name,
+            int(role), description, state_words or [0, 0])
+
+
+APP_ITEMS = [
+    current_item("/0", NULL[1], -1, 2, "app", Atspi.Role.APPLICATION),
+    current_item("/1", "/0", 0, 1, "Window", Atspi.Role.FRAME),
+    current_item("/2", "/1", 0, 0, "OK", Atspi.Role.PUSH_BUTTON),
+    current_item("/3", "/0", 1, 0, "Other window", Atspi.Role.FRAME),
+]
+
+
+class FakeApp:
+    bus_name = APP
+
+
+class FakeAccessible:
+    def __init__(self, path):
+        self.app = FakeApp()
+        self.path = path
+
+
+class ParseItemsTest(unittest.TestCase):
+
+    def test_current_item(self):
+        items = [current_item("/1", "/0", 2, 3, "OK", Atspi.Role.PUSH_BUTTON, "Accept",
+                              states(Atspi.StateType.FOCUSABLE, Atspi.StateType.FOCUSED))]
+        parent, properties = AXSnapshot._parse_items(items)[(APP, "/1")]
+        self.assertEqual(parent, (APP, "/0"))
+        self.assertEqual(properties["name"], "OK")
+        self.assertEqual(properties["description"], "Accept")
+        self.assertEqual(properties["role"], Atspi.Role.PUSH_BUTTON)
+        self.assertEqual(properties["child_count"], 3)
+        self.assertTrue(properties["state_set"].contains(Atspi.StateType.FOCUSED))
+        self.assertTrue(properties["state_set"].contains(Atspi.StateType.FOCUSABLE))
+        self.assertFalse(properties["state_set"].contains(Atspi.StateType.CHECKED))
+
+    def test_older_item(self):
+        items = [older_item("/1", "/0", ["/2", "/3"], "List", Atspi.Role.LIST)]
+        parent, properties = AXSnapshot._parse_items(items)[(APP, "/1")]
+        self.assertEqual(parent, (APP, "/0"))
+        self.assertEqual(properties["role"], Atspi.Role.LIST)
+        self.assertEqual(properties["child_count"], 2)
+
+    def test_unknown_item_is_skipped(self):
+        items = [("unexpected", "reply"),
+                 current_item("/1", "/0", 0, 0, "Label", Atspi.Role.LABEL)]
+        self.assertEqual(list(AXSnapshot._parse_items(items)), [(APP, "/1")])
+
+
+class FakeCacheService:
+    """Serves org.a11y.atspi.Cache from a thread of its own over a peer-to-peer D-Bus
+    connection, which AXSnapshot uses in place of its connection to the bus."""
+
+    XML = """<node>
+      <interface name="org.a11y.atspi.Cache">
+        <method name="GetItems">
+          <arg direction="out" type="%s"/>
+        </method>
+      </interface>
+    </node>"""
+
+    def __init__(self, items, signature=CURRENT_SIGNATURE, delay=0, error=None):
+        self.items = items
+        self.signature = signature
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self._ready = threading.Event()
+        self._connections = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        context = GLib.MainContext.new()
+        context.push_thread_default()
+        self._server = Gio.DBusServer.new_sync(
+            f"unix:tmpdir={tempfile.gettempdir()}", Gio.DBusServerFlags.NONE,
+            Gio.dbus_generate_guid(), None, None)
+        self._server.connect("new-connection", self._on_new_connection)
+        self._server.start()
+        self._loop = GLib.MainLoop.new(context, False)
+        self._ready.set()
+        self._loop.run()
+        self._server.stop()
+        context.pop_thread_default()
+
+    def _on_new_connection(self, server, connection):
+        info = Gio.DBusNodeInfo.new_for_xml(self.XML % self.signature).interfaces[0]
+        connection.register_object(
+            AXSnapshot.CACHE_PATH, info, self._on_method_call, None, None)
+        self._connections.append(connection)
+        return True
+
+    def _on_method_call(self, connection, sender, path, interface, method, params, invocation):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error:
+            invocation.return_dbus_error(self.error, "Not supported by this fake")
+            return
+        invocation.return_value(GLib.Variant(f"({self.signature})", (self.items,)))
+
+    def connect(self):
+        """Returns a new connection to this service."""
+
+        return Gio.DBusConnection.new_for_address_sync(
+            self._server.get_client_address(),
+            Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT, None, None)
+
+    def stop(self):
+        self._loop.quit()
+        self._thread.join()
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        AXSnapshot.ITEMS.clear()
+        AXSnapshot.UNSUPPORTED_APPS.clear()
+        self.service = None
+
+    def tearDown(self):
+        AXSnapshot.ITEMS.clear()
+        AXSnapshot.UNSUPPORTED_APPS.clear()
+        if AXSnapshot._connection is not None:
+            AXSnapshot._connection.close_sync(None)
+            AXSnapshot._connection = None
+        if self.service is not None:
+            self.service.stop()
+
+    def serve(self, items, **kwargs):
+        self.service = FakeCacheService(items, **kwargs)
+        AXSnapshot._connection = self.service.connect()
+
+    def test_only_subtree_of_root_is_kept(self):
+        self.serve(APP_ITEMS)
+        self.assertEqual(AXSnapshot.prefetch(FakeAccessible("/1")), 2)
+        self.assertEqual(self.service.calls, 1)
+
+        self.assertEqual(set(AXSnapshot.ITEMS), {(APP, "/1"), (APP, "/2")})
+        properties = AXSnapshot.take_properties(FakeAccessible("/2"))
+        self.assertEqual(properties["name"], "OK")
+        self.assertEqual(properties["role"], Atspi.Role.PUSH_BUTTON)
+        self.assertIsNone(AXSnapshot.take_properties(FakeAccessible("/2")))
+
+    def test_older_reply(self):
+        items = [
+            older_item("/1", "/0", ["/2"], "List", Atspi.Role.LIST),
+            older_item("/2", "/1", [], "Item", Atspi.Role.LIST_ITEM),
+        ]
+        self.serve(items, signature=OLDER_SIGNATURE)
+        self.assertEqual(AXSnapshot.prefetch(FakeAccessible("/1")), 2)
+
+        properties = AXSnapshot.take_properties(FakeAccessible("/1"))
+        self.assertEqual(properties["child_count"], 1)
+        self.assertEqual(properties["role"], Atspi.Role.LIST)
+
+    def test_slow_reply_times_out(self):
+        delay = 2 * AXSnapshot.TIMEOUT / 1000
+        self.serve(APP_ITEMS, delay=delay)
+        start = time.time()
+        self.assertEqual(AXSnapshot.prefetch(FakeAccessible("/1")), 0)
+        self.assertLess(time.time() - start, delay)
+
+        self.assertFalse(AXSnapshot.ITEMS)
+        self.assertNotIn(APP, AXSnapshot.UNSUPPORTED_APPS)
+
+    def test_app_without_interface_is_not_asked_again(self):
+        self.serve(APP_ITEMS, error="org.freedesktop.DBus.Error.UnknownMethod")
+        self.assertEqual(AXSnapshot.prefetch(FakeAccessible("/1")), 0)
+        self.assertIn(APP, AXSnapshot.UNSUPPORTED_APPS)
+
+        self.assertEqual(AXSnapshot.prefetch(FakeAccessible("/1")), 0)
+        self.assertEqual(self.service.calls, 1)
+
+    def test_failed_call_keeps_nothing(self):
+        self.serve(APP_ITEMS, error="org.freedesktop.DBus.Error.Failed")
+        self.assertEqual(AXSnapshot.prefetch(FakeAccessible("/1")), 0)
+
+        self.assertFalse(AXSnapshot.ITEMS)
+        self.assertNotIn(APP, AXSnapshot.UNSUPPORTED_APPS)
+
+
+if __name__ == "__main__":
+    unittest.main()